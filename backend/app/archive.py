@@ -0,0 +1,93 @@
+import os
+import re
+import struct
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Tuple
+
+from app.imageinfo import ImageInfo, read_image_info
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp'
+}
+
+
+@dataclass
+class PageRef:
+    """A page produced by ingest, as recorded in the chapter's page manifest"""
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    format: Optional[str] = None
+    crc32: Optional[int] = None
+    data_offset: Optional[int] = None
+    # Set when a long-strip page was sliced into tiles (app.tiles)
+    tile_height: Optional[int] = None
+    tile_count: Optional[int] = None
+
+    def set_info(self, info: Optional[ImageInfo]) -> "PageRef":
+        if info:
+            self.format, self.width, self.height = info
+        return self
+
+
+def nat_sort_key(s):
+    """Natural sort key - extracts numbers for sorting, falls back to ASCII if no numbers"""
+    # Find all numbers in the string
+    numbers = re.findall(r'\d+', s)
+    if numbers:
+        # Convert to integers for natural sorting
+        # Use a tuple that starts with 0 to prefer files with numbers
+        # Then include all found numbers as integers
+        return (0, tuple(int(n) for n in numbers), s.lower())
+    else:
+        # No numbers found - fallback to ASCII (lexicographic) sorting
+        # Use 1 to put these after files with numbers
+        return (1, (), s.lower())
+
+
+def content_type_for(filename: str) -> str:
+    """Guess the image content type from a page filename"""
+    ext = os.path.splitext(filename)[1].lower()
+    return CONTENT_TYPES.get(ext, 'application/octet-stream')
+
+
+def list_image_entries(zf: zipfile.ZipFile) -> List[Tuple[str, str]]:
+    """Return (page filename, entry name) pairs for the images in a chapter ZIP, in reading order"""
+    entries = []
+    for name in zf.namelist():
+        ext = os.path.splitext(name)[1].lower()
+        if ext in IMAGE_EXTENSIONS and not name.endswith('/'):
+            entries.append((os.path.basename(name), name))
+    entries.sort(key=lambda entry: nat_sort_key(entry[0]))
+    return entries
+
+
+def data_offset(f: BinaryIO, zinfo: zipfile.ZipInfo) -> Optional[int]:
+    """Where a stored entry's data starts in the archive file; None for compressed entries"""
+    if zinfo.compress_type != zipfile.ZIP_STORED:
+        return None
+    f.seek(zinfo.header_offset + 26)
+    name_length, extra_length = struct.unpack("<2H", f.read(4))
+    return zinfo.header_offset + 30 + name_length + extra_length
+
+
+def zip_page_refs(zip_path: str) -> List[PageRef]:
+    """Page manifest of a chapter ZIP kept as-is, reading only each image's header"""
+    refs = []
+    with open(zip_path, "rb") as raw, zipfile.ZipFile(zip_path, "r") as zf:
+        for filename, name in list_image_entries(zf):
+            with zf.open(name) as f:
+                info = read_image_info(f)
+            zinfo = zf.getinfo(name)
+            refs.append(PageRef(filename=filename, size=zinfo.file_size, crc32=zinfo.CRC,
+                                data_offset=data_offset(raw, zinfo)).set_info(info))
+    return refs
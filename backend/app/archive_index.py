@@ -0,0 +1,304 @@
+"""Shared on-disk index of chapter archive entries.
+
+Serving a page from a chapter ZIP needs the entry's offset and sizes.
+Rather than every worker parsing every archive's central directory and
+keeping the result in its own memory, the entries are kept in one
+append-only index file under STORAGE_PATH that every worker memory-maps
+read-only, so the page cache holds a single copy shared by all processes.
+
+The file is a sequence of records, one per indexed archive:
+
+    header   RECORD_HEADER: magic, record length, chapter id, archive
+             mtime_ns and size, entry count
+    entries  ENTRY per entry, sorted by name for binary search
+    names    the entry names (page basenames), UTF-8
+
+A lookup uses the newest of a chapter's records that matches its archive
+on size and mtime, so while readers drain from a re-uploaded chapter's old
+version both versions stay indexed. Uploads append a record; an archive
+with no matching record is indexed and appended on first use. ``python -m app.archive_index`` rewrites
+the file with only the current records of existing chapters, and is run
+before the workers start so they start warm.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.archive import IMAGE_EXTENSIONS
+from app.config import settings
+from app.zipmmap import BadArchive, archives
+
+INDEX_DIR = os.path.join(settings.STORAGE_PATH, ".index")
+INDEX_PATH = os.path.join(INDEX_DIR, "chapters.idx")
+
+MAGIC = b"CIX1"
+# Records remembered per chapter: the current archive version and any still draining
+RECORDS_PER_CHAPTER = 4
+# magic, record length, chapter id, archive mtime_ns, archive size, entry count
+RECORD_HEADER = struct.Struct("<4sIQqQI")
+# name offset (from the start of the names), name length, compression method,
+# local header offset, compressed size, uncompressed size
+ENTRY = struct.Struct("<IHHQQQ")
+
+
+class IndexEntry(NamedTuple):
+    header_offset: int
+    compress_size: int
+    file_size: int
+    compress_type: int
+
+
+def build_record(chapter_id: int, zip_path: str) -> bytes:
+    """Index the page entries of a chapter ZIP. Raises BadArchive for invalid archives."""
+    st = os.stat(zip_path)
+    entries = {}
+    for entry in archives.open(zip_path, st).entries():
+        name = os.path.basename(entry.name)
+        if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        # Pages are addressed by basename, the first entry wins
+        entries.setdefault(name.encode("utf-8"), entry)
+
+    rows = []
+    names = bytearray()
+    for name in sorted(entries):
+        entry = entries[name]
+        rows.append(ENTRY.pack(len(names), len(name), entry.compress_type,
+                               entry.header_offset, entry.compress_size, entry.file_size))
+        names += name
+    length = RECORD_HEADER.size + ENTRY.size * len(rows) + len(names)
+    header = RECORD_HEADER.pack(MAGIC, length, chapter_id, st.st_mtime_ns, st.st_size, len(rows))
+    return header + b"".join(rows) + bytes(names)
+
+
+def read_entry(zip_path: str, entry: IndexEntry):
+    """An entry's contents from the process's mapping of the archive; a memoryview for stored entries"""
+    return archives.open(zip_path).read(entry.header_offset, entry.compress_size, entry.compress_type)
+
+
+class ArchiveIndex:
+    """A process's read-only view of the index file, plus appends under an exclusive lock"""
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        # Writers lock a separate file: compaction replaces the index file itself
+        self.lock_path = path + ".lock"
+        self._lock = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+        self._inode = None
+        self._scanned = 0
+        # chapter id -> offsets of its latest records, newest first
+        self._records: Dict[int, List[int]] = {}
+
+    def _reset(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._inode = None
+        self._scanned = 0
+        self._records = {}
+
+    def _refresh(self):
+        """Map records appended by any process since the last look, reopening after a compaction"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        if st.st_ino != self._inode:
+            self._reset()
+            self._inode = st.st_ino
+        if st.st_size <= self._scanned:
+            return
+        with open(self.path, "rb") as f:
+            new_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map is not None:
+            self._map.close()
+        self._map = new_map
+        self._scan()
+
+    def _scan(self):
+        """Read record headers from where the last scan stopped. Stops at a partial record."""
+        data = self._map
+        position = self._scanned
+        while position + RECORD_HEADER.size <= len(data):
+            magic, length, chapter_id, _, _, _ = RECORD_HEADER.unpack_from(data, position)
+            if magic != MAGIC or length < RECORD_HEADER.size or position + length > len(data):
+                break
+            positions = self._records.setdefault(chapter_id, [])
+            positions.insert(0, position)
+            del positions[RECORDS_PER_CHAPTER:]
+            position += length
+        self._scanned = position
+
+    def _find(self, chapter_id: int, st: os.stat_result, filename: str) -> Tuple[bool, Optional[IndexEntry]]:
+        """Look a page up in the chapter's record for this archive: (record found, entry)"""
+        position = self._position(chapter_id, st)
+        if position is None:
+            return False, None
+        data = self._map
+        count = RECORD_HEADER.unpack_from(data, position)[5]
+
+        entries = position + RECORD_HEADER.size
+        names = entries + ENTRY.size * count
+        target = filename.encode("utf-8")
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            name_offset, name_length, method, header_offset, compress_size, file_size = \
+                ENTRY.unpack_from(data, entries + middle * ENTRY.size)
+            name = data[names + name_offset:names + name_offset + name_length]
+            if name == target:
+                return True, IndexEntry(header_offset, compress_size, file_size, method)
+            if name < target:
+                low = middle + 1
+            else:
+                high = middle
+        return True, None
+
+    def _position(self, chapter_id: int, st: os.stat_result) -> Optional[int]:
+        """Offset of the chapter's newest record matching the archive on size and mtime"""
+        for position in self._records.get(chapter_id, ()):
+            _, _, _, mtime_ns, size, _ = RECORD_HEADER.unpack_from(self._map, position)
+            if mtime_ns == st.st_mtime_ns and size == st.st_size:
+                return position
+        return None
+
+    def warm(self) -> int:
+        """Map the index ahead of the first lookup. Returns the number of chapters indexed."""
+        with self._lock:
+            self._refresh()
+            return len(self._records)
+
+    def lookup(self, chapter_id: int, zip_path: str, filename: str) -> Optional[IndexEntry]:
+        """Offsets of a page in a chapter archive, indexing the archive if its record is missing or stale"""
+        st = os.stat(zip_path)
+        with self._lock:
+            self._refresh()
+            current, entry = self._find(chapter_id, st, filename)
+        if current:
+            return entry
+
+        self.append([build_record(chapter_id, zip_path)])
+        with self._lock:
+            self._refresh()
+            return self._find(chapter_id, st, filename)[1]
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, records: Iterable[bytes]) -> None:
+        """Append records for all processes to see"""
+        records = list(records)
+        if not records:
+            return
+        with self._write_lock(), open(self.path, "ab") as f:
+            # With the lock held no append is in progress, so anything after
+            # the last whole record was left by a crashed writer
+            with self._lock:
+                self._refresh()
+                st = os.fstat(f.fileno())
+                if self._inode == st.st_ino and self._scanned < st.st_size:
+                    f.truncate(self._scanned)
+            f.write(b"".join(records))
+            f.flush()
+
+    def index_chapters(self, chapters: Iterable[Tuple[int, str]]) -> None:
+        """Append fresh records for newly uploaded chapter archives"""
+        records = []
+        for chapter_id, zip_path in chapters:
+            try:
+                records.append(build_record(chapter_id, zip_path))
+            except (OSError, BadArchive):
+                continue
+        self.append(records)
+
+    def compact(self, chapters: Dict[int, str]) -> Tuple[int, int]:
+        """Rewrite the index with one current record per existing chapter.
+
+        ``chapters`` maps chapter ids to their archive path. Records still
+        matching their archive are copied, the rest are rebuilt. Returns
+        (records kept, records rebuilt).
+        """
+        with self._write_lock():
+            current = {}
+            with self._lock:
+                self._refresh()
+                for chapter_id, zip_path in chapters.items():
+                    try:
+                        st = os.stat(zip_path)
+                    except FileNotFoundError:
+                        continue
+                    position = self._position(chapter_id, st)
+                    if position is not None:
+                        length = RECORD_HEADER.unpack_from(self._map, position)[1]
+                        current[chapter_id] = bytes(self._map[position:position + length])
+
+            tmp_path = f"{self.path}.tmp-{os.getpid()}"
+            kept = rebuilt = 0
+            with open(tmp_path, "wb") as out:
+                for chapter_id, zip_path in sorted(chapters.items()):
+                    record = current.get(chapter_id)
+                    if record is not None:
+                        kept += 1
+                    else:
+                        try:
+                            record = build_record(chapter_id, zip_path)
+                        except (OSError, BadArchive):
+                            continue
+                        rebuilt += 1
+                    out.write(record)
+            os.replace(tmp_path, self.path)
+        return kept, rebuilt
+
+
+archive_index = ArchiveIndex()
+
+
+def zip_chapters(db) -> Dict[int, str]:
+    """Archive paths of all chapters stored as ZIPs, leaving out archives in the object store this node has not cached"""
+    from app import storage
+    from app.models import Chapter
+
+    rows = db.query(Chapter.id, Chapter.folder_path, Chapter.archive_key, Chapter.archive_version).filter(
+        Chapter.storage_mode == "zip", Chapter.folder_path.isnot(None)
+    )
+    paths = {}
+    for row in rows:
+        if row.archive_key:
+            zip_path = storage.archive_path(row, fetch=False)
+            if zip_path:
+                paths[row.id] = zip_path
+        else:
+            paths[row.id] = storage.local_archive_path(row)
+    return paths
+
+
+def main() -> int:
+    """Compact and warm the index before the workers start"""
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        chapters = zip_chapters(db)
+    finally:
+        db.close()
+    kept, rebuilt = archive_index.compact(chapters)
+    print(f"Archive index: {kept} records kept, {rebuilt} rebuilt")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Content-addressed page store used when STORAGE_MODE=blob.
+
+Chapter archives are split into pages at ingest. Every page is written once
+under its SHA-256 in a sharded directory below STORAGE_PATH, and a chapter is
+just its ordered ChapterPage manifest pointing at those blobs. PageBlob rows
+count how many manifest entries reference each blob so unreferenced blobs can
+be garbage collected.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+from collections import Counter
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.archive import PageRef, list_image_entries
+from app.config import settings
+from app.imageinfo import image_info
+from app.models import ChapterPage, PageBlob
+
+BLOB_ROOT = os.path.join(settings.STORAGE_PATH, ".blobs")
+# Unreferenced blobs removed per transaction by the garbage collector
+GC_BATCH_SIZE = 500
+
+
+def blob_path(sha256: str) -> str:
+    """Path of a blob, sharded by the first two bytes of its hash"""
+    return os.path.join(BLOB_ROOT, sha256[:2], sha256[2:4], sha256)
+
+
+def write_blob(sha256: str, data: bytes) -> bool:
+    """Store a blob unless it is already present. Returns True if it was written."""
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        return False
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    # Write to a temp file and rename so readers never see a partial blob
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def split_archive(zip_path: str, only: Optional[Set[str]] = None) -> List[PageRef]:
+    """Hash every page of a chapter ZIP and store the ones not already in the blob store.
+
+    When ``only`` is given, just those hashes are (re)written.
+    """
+    refs = []
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        for filename, name in list_image_entries(zf):
+            data = zf.read(name)
+            sha256 = hashlib.sha256(data).hexdigest()
+            if only is None or sha256 in only:
+                write_blob(sha256, data)
+            refs.append(PageRef(filename=filename, sha256=sha256, size=len(data),
+                                crc32=zf.getinfo(name).CRC).set_info(image_info(data)))
+    return refs
+
+
+def release_chapters(db: Session, chapter_ids: Iterable[int]) -> None:
+    """Drop the manifests of the given chapters and release their blob references"""
+    chapter_ids = list(chapter_ids)
+    if not chapter_ids:
+        return
+    released = (
+        db.query(ChapterPage.blob_sha256, func.count())
+        .filter(ChapterPage.chapter_id.in_(chapter_ids), ChapterPage.blob_sha256.isnot(None))
+        .group_by(ChapterPage.blob_sha256)
+        .all()
+    )
+    db.query(ChapterPage).filter(ChapterPage.chapter_id.in_(chapter_ids)).delete(synchronize_session=False)
+    for sha256, count in released:
+        db.query(PageBlob).filter(PageBlob.sha256 == sha256).update(
+            {PageBlob.ref_count: PageBlob.ref_count - count}, synchronize_session=False
+        )
+
+
+def apply_manifest(db: Session, chapter_id: int, refs: List[PageRef]) -> None:
+    """Replace a chapter's manifest, taking a reference on every blob it points at
+
+    Pages without a hash (zip and exploded storage) are recorded without
+    touching the blob store.
+    """
+    release_chapters(db, [chapter_id])
+
+    counts = Counter(ref.sha256 for ref in refs if ref.sha256)
+    sizes = {ref.sha256: ref.size for ref in refs}
+    for sha256, count in counts.items():
+        stmt = insert(PageBlob).values(sha256=sha256, size=sizes[sha256], ref_count=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PageBlob.sha256],
+            set_={"ref_count": PageBlob.ref_count + stmt.excluded.ref_count},
+        )
+        db.execute(stmt)
+
+    db.add_all([
+        ChapterPage(chapter_id=chapter_id, page_index=index, filename=ref.filename,
+                    blob_sha256=ref.sha256, size=ref.size,
+                    width=ref.width, height=ref.height, format=ref.format, crc32=ref.crc32,
+                    data_offset=ref.data_offset, tile_height=ref.tile_height, tile_count=ref.tile_count)
+        for index, ref in enumerate(refs)
+    ])
+
+
+def missing_blobs(refs: List[PageRef]) -> Set[str]:
+    """Hashes referenced by ``refs`` whose blob file is gone.
+
+    A blob can be collected between ``split_archive`` seeing it and
+    ``apply_manifest`` referencing it again, so ingest checks this after
+    committing and rewrites anything it lost.
+    """
+    return {ref.sha256 for ref in refs if ref.sha256 and not os.path.exists(blob_path(ref.sha256))}
+
+
+def collect_garbage(db: Session) -> Tuple[int, int]:
+    """Delete unreferenced blobs. Returns (blobs removed, bytes freed)."""
+    removed = 0
+    freed = 0
+    while True:
+        # The deleted rows stay locked until the files are gone: an ingest
+        # re-referencing one of these hashes waits to recreate its row, and
+        # then finds the file missing and rewrites it (see missing_blobs)
+        batch = select(PageBlob.sha256).where(PageBlob.ref_count <= 0) \
+            .limit(GC_BATCH_SIZE).with_for_update(skip_locked=True)
+        garbage = db.execute(
+            delete(PageBlob).where(PageBlob.sha256.in_(batch), PageBlob.ref_count <= 0)
+            .returning(PageBlob.sha256, PageBlob.size)
+        ).all()
+        for sha256, size in garbage:
+            try:
+                os.remove(blob_path(sha256))
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+        db.commit()
+        if len(garbage) < GC_BATCH_SIZE:
+            return removed, freed
+
+
+def dedup_stats(db: Session) -> dict:
+    """Space used by the blob store compared to storing every chapter's pages separately"""
+    pages, logical_bytes = (
+        db.query(func.count(ChapterPage.id), func.coalesce(func.sum(ChapterPage.size), 0))
+        .filter(ChapterPage.blob_sha256.isnot(None))
+        .one()
+    )
+    blobs, stored_bytes = db.query(func.count(PageBlob.sha256), func.coalesce(func.sum(PageBlob.size), 0)).one()
+    return {
+        "pages": pages,
+        "blobs": blobs,
+        "logical_bytes": int(logical_bytes),
+        "stored_bytes": int(stored_bytes),
+        "saved_bytes": int(logical_bytes) - int(stored_bytes),
+        "dedup_ratio": round(logical_bytes / stored_bytes, 3) if stored_bytes else 1.0,
+    }
@@ -0,0 +1,303 @@
+"""CBZ downloads of chapters and volumes, streamed from the stored pages.
+
+A download is planned before its first byte is sent, as a list of parts of
+known size: each page's local header, the page data, and the central
+directory. The headers are built from the sizes and CRC-32 the pages
+already have, so page data is copied through exactly as stored. Entries of
+chapter ZIPs are copied raw from the process's mapping of the archive,
+deflated ones still deflated. Blob and exploded pages are read from their
+files as stored entries.
+
+Knowing the layout up front gives the response a Content-Length and lets
+any byte range be served without producing what comes before it, so an
+interrupted download can resume. Data is read on the disk I/O pool one
+chunk at a time: a download holds one chunk and its headers in memory,
+and nothing is written to disk.
+"""
+import hashlib
+import os
+import re
+import struct
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.diskio import CHUNK_SIZE, disk_io
+from app.models import Chapter, Manga
+from app.zipmmap import (
+    CENTRAL_HEADER, CENTRAL_HEADER_SIGNATURE, EOCD, EOCD_SIGNATURE, LOCAL_HEADER, LOCAL_HEADER_SIGNATURE,
+    ZIP64_EOCD, ZIP64_EOCD_SIGNATURE, ZIP64_EXTRA_ID, ZIP64_LOCATOR, ZIP64_LOCATOR_SIGNATURE, ZIP_STORED,
+    BadArchive, MappedArchive, archives,
+)
+
+MEDIA_TYPE = "application/vnd.comicbook+zip"
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+# Made on Unix, so readers apply the permissions in the external attributes
+MADE_BY_UNIX = 3 << 8
+UTF8_FLAG = 0x800
+FILE_ATTRIBUTES = 0o100644 << 16
+
+
+class Part(NamedTuple):
+    """A run of bytes of a download: header bytes, or a slice of a mapped archive or a file"""
+    size: int
+    data: Optional[bytes] = None
+    archive: Optional[MappedArchive] = None
+    path: Optional[str] = None
+    offset: int = 0
+
+
+class Member(NamedTuple):
+    """A page of a download, with what its headers record"""
+    name: str
+    crc: int
+    compress_size: int
+    file_size: int
+    compress_type: int
+    modified: Tuple[int, int]
+    source: Part
+
+
+class Plan(NamedTuple):
+    parts: List[Part]
+    size: int
+    etag: str
+
+
+def dos_datetime(moment: Optional[datetime]) -> Tuple[int, int]:
+    """(time, date) in MS-DOS format"""
+    if moment is None or moment.year < 1980:
+        return 0, 1 << 5 | 1
+    return (
+        moment.hour << 11 | moment.minute << 5 | moment.second // 2,
+        (moment.year - 1980) << 9 | moment.month << 5 | moment.day,
+    )
+
+
+def build_plan(members: List[Member]) -> Plan:
+    """Lay out a ZIP of the members: local headers and data, then the central directory"""
+    parts = []
+    central = bytearray()
+    position = 0
+    for member in members:
+        name = member.name.encode("utf-8")
+        time, date = member.modified
+
+        # Sizes past 4 GiB go in a ZIP64 extra field, in both headers
+        zip64 = member.file_size >= ZIP64_LIMIT or member.compress_size >= ZIP64_LIMIT
+        extra = struct.pack("<2H2Q", ZIP64_EXTRA_ID, 16, member.file_size, member.compress_size) if zip64 else b""
+        local = LOCAL_HEADER.pack(
+            LOCAL_HEADER_SIGNATURE, VERSION_ZIP64 if zip64 else VERSION_DEFAULT, UTF8_FLAG,
+            member.compress_type, time, date, member.crc,
+            ZIP64_LIMIT if zip64 else member.compress_size, ZIP64_LIMIT if zip64 else member.file_size,
+            len(name), len(extra),
+        ) + name + extra
+        parts.append(Part(len(local), data=local))
+        parts.append(member.source)
+
+        values = []
+        file_size, compress_size, header_offset = member.file_size, member.compress_size, position
+        if file_size >= ZIP64_LIMIT:
+            values.append(file_size)
+            file_size = ZIP64_LIMIT
+        if compress_size >= ZIP64_LIMIT:
+            values.append(compress_size)
+            compress_size = ZIP64_LIMIT
+        if header_offset >= ZIP64_LIMIT:
+            values.append(header_offset)
+            header_offset = ZIP64_LIMIT
+        extra = struct.pack(f"<2H{len(values)}Q", ZIP64_EXTRA_ID, 8 * len(values), *values) if values else b""
+        version = VERSION_ZIP64 if values else VERSION_DEFAULT
+        central += CENTRAL_HEADER.pack(
+            CENTRAL_HEADER_SIGNATURE, MADE_BY_UNIX | version, version, UTF8_FLAG,
+            member.compress_type, time, date, member.crc, compress_size, file_size,
+            len(name), len(extra), 0, 0, 0, FILE_ATTRIBUTES, header_offset,
+        ) + name + extra
+        position += len(local) + member.source.size
+
+    count, directory_size, directory_offset = len(members), len(central), position
+    if count >= ZIP64_COUNT_LIMIT or directory_size >= ZIP64_LIMIT or directory_offset >= ZIP64_LIMIT:
+        central += ZIP64_EOCD.pack(
+            ZIP64_EOCD_SIGNATURE, ZIP64_EOCD.size - 12, MADE_BY_UNIX | VERSION_ZIP64, VERSION_ZIP64,
+            0, 0, count, count, directory_size, directory_offset,
+        )
+        central += ZIP64_LOCATOR.pack(ZIP64_LOCATOR_SIGNATURE, 0, directory_offset + directory_size, 1)
+        count = min(count, ZIP64_COUNT_LIMIT)
+        directory_size = min(directory_size, ZIP64_LIMIT)
+        directory_offset = min(directory_offset, ZIP64_LIMIT)
+    central += EOCD.pack(EOCD_SIGNATURE, 0, 0, count, count, directory_size, directory_offset, 0)
+    parts.append(Part(len(central), data=bytes(central)))
+
+    # The central directory records every name, CRC, size and offset, so it identifies the content
+    etag = '"' + hashlib.sha256(central).hexdigest()[:32] + '"'
+    return Plan(parts, position + len(central), etag)
+
+
+def file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def chapter_members(db: Session, chapter: Chapter, folder: str = "") -> List[Member]:
+    """The pages of a chapter as download members, named folder + page filename"""
+    from app.routers.chapter import ensure_manifest, get_zip_path, page_path
+
+    pages = ensure_manifest(db, chapter)
+    modified = dos_datetime(chapter.created_at)
+    members = []
+
+    if chapter.storage_mode in ("blob", "exploded"):
+        for page in pages:
+            path = page_path(chapter, page)
+            try:
+                size = os.stat(path).st_size
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Page not found")
+            if page.crc32 is None:
+                # A page from before downloads, read once
+                page.crc32 = file_crc32(path)
+            members.append(Member(folder + page.filename, page.crc32, size, size, ZIP_STORED, modified,
+                                  Part(size, path=path)))
+        db.commit()
+        return members
+
+    zip_path = get_zip_path(chapter)
+    if not zip_path:
+        raise HTTPException(status_code=404, detail="Chapter ZIP file not found")
+    # The archive's own directory has the CRC and sizes of the bytes copied
+    try:
+        archive = archives.open(zip_path)
+        entries = {}
+        for entry in archive.entries():
+            entries.setdefault(os.path.basename(entry.name), entry)
+        for page in pages:
+            entry = entries.get(page.filename)
+            if entry is None:
+                raise HTTPException(status_code=404, detail="Page not found")
+            source = Part(entry.compress_size, archive=archive, offset=archive.data_offset(entry.header_offset))
+            members.append(Member(folder + page.filename, entry.crc, entry.compress_size, entry.file_size,
+                                  entry.compress_type, modified, source))
+    except BadArchive:
+        raise HTTPException(status_code=400, detail="Invalid ZIP file")
+    return members
+
+
+def plan_chapter(db: Session, chapter_id: int) -> Tuple[Plan, str]:
+    """The download plan and file name of a chapter"""
+    from app.routers.chapter import get_readable_chapter
+
+    chapter = get_readable_chapter(db, chapter_id)
+    filename = f"{chapter.manga.title} - Chapter {chapter.chapter_number:03d}.cbz"
+    return build_plan(chapter_members(db, chapter)), filename
+
+
+def plan_volume(db: Session, manga_id: int, first: Optional[int], last: Optional[int]) -> Tuple[Plan, str]:
+    """The download plan and file name of a manga's chapters numbered first to last, one folder per chapter"""
+    manga = db.query(Manga).filter(
+        Manga.id == manga_id, Manga.is_published == True, Manga.is_deleted == False
+    ).first()
+    if not manga:
+        raise HTTPException(status_code=404, detail="Manga not found")
+
+    query = db.query(Chapter).filter(Chapter.manga_id == manga_id)
+    if first is not None:
+        query = query.filter(Chapter.chapter_number >= first)
+    if last is not None:
+        query = query.filter(Chapter.chapter_number <= last)
+    chapters = query.order_by(Chapter.chapter_number).all()
+    if not chapters:
+        raise HTTPException(status_code=404, detail="No chapters in range")
+
+    members = []
+    for chapter in chapters:
+        members.extend(chapter_members(db, chapter, f"Chapter {chapter.chapter_number:03d}/"))
+    numbers = f"{chapters[0].chapter_number:03d}-{chapters[-1].chapter_number:03d}"
+    return build_plan(members), f"{manga.title} - Chapters {numbers}.cbz"
+
+
+def read_part(part: Part, start: int, length: int) -> bytes:
+    """length bytes of a part from start. Runs on the disk I/O pool."""
+    if part.archive is not None:
+        return bytes(part.archive.raw(part.offset + start, length))
+    with open(part.path, "rb") as f:
+        f.seek(part.offset + start)
+        data = f.read(length)
+    if len(data) != length:
+        raise OSError(f"{part.path} changed during download")
+    return data
+
+
+async def stream(plan: Plan, start: int, end: int) -> AsyncIterator[bytes]:
+    """Bytes start to end (exclusive) of a planned download"""
+    position = 0
+    for part in plan.parts:
+        part_start, position = position, position + part.size
+        if position <= start:
+            continue
+        if part_start >= end:
+            break
+        low, high = max(start, part_start) - part_start, min(end, position) - part_start
+        if part.data is not None:
+            yield part.data[low:high]
+            continue
+        for offset in range(low, high, CHUNK_SIZE):
+            yield await disk_io.run(read_part, part, offset, min(CHUNK_SIZE, high - offset), admit=False)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) of a single bytes range, end exclusive.
+
+    None when there is no range or it is not understood, so the whole file
+    is sent. Raises 416 for a range past the end.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            start, end = max(0, size - int(last)), size
+    except ValueError:
+        return None
+    if end <= start and first and last:
+        return None
+    if start >= size or end <= start:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size)
+
+
+def attachment(filename: str) -> str:
+    """Content-Disposition for a download, with an ASCII fallback name for old clients"""
+    fallback = re.sub(r"[^A-Za-z0-9 ._()-]", "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def download_response(plan: Plan, filename: str, request: Request) -> StreamingResponse:
+    """Stream a planned download, or the requested part of it"""
+    headers = {"Accept-Ranges": "bytes", "ETag": plan.etag, "Content-Disposition": attachment(filename)}
+    start, end, status_code = 0, plan.size, 200
+    # A resume only gets a part when the download is still the one it started
+    if request.headers.get("if-range", plan.etag) == plan.etag:
+        byte_range = parse_range(request.headers.get("range"), plan.size)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{plan.size}"
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(stream(plan, start, end), status_code=status_code, media_type=MEDIA_TYPE, headers=headers)
@@ -0,0 +1,264 @@
+"""Background storage collector.
+
+Deleting a manga or replacing a chapter archive only records a
+StorageGcJob; the disk space is reclaimed here, off the request path. A
+replaced archive version is left alone until the job's not_before, so
+requests that were already reading it can finish. When idle, the
+collector also clears out abandoned resumable uploads. Jobs live in the
+database so a collector that crashes or restarts picks up where
+it left off, and deletions are rate limited so a large series does not cause
+an I/O storm for readers.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app import blobstore, storage
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Chapter, Manga, StorageGcJob
+
+logger = logging.getLogger(__name__)
+
+# Progress is written back to the job every this many files
+PROGRESS_EVERY = 100
+
+# How often expired upload sessions are cleaned up
+EXPIRE_UPLOADS_EVERY = 300
+
+
+def drain_until(delay: float) -> Optional[datetime]:
+    return datetime.now(timezone.utc) + timedelta(seconds=delay) if delay > 0 else None
+
+
+def enqueue_path(db: Session, path: str, delay: float = 0) -> StorageGcJob:
+    """Schedule a file or folder for removal, no sooner than delay seconds from now. Committed with the caller's transaction."""
+    job = StorageGcJob(kind="path", path=path, not_before=drain_until(delay))
+    db.add(job)
+    return job
+
+
+def enqueue_object(db: Session, key: str, delay: float = 0) -> StorageGcJob:
+    """Schedule an object store key for deletion, no sooner than delay seconds from now. Committed with the caller's transaction."""
+    job = StorageGcJob(kind="object", path=key, not_before=drain_until(delay))
+    db.add(job)
+    return job
+
+
+def enqueue_manga(db: Session, manga: Manga) -> StorageGcJob:
+    """Schedule removal of a manga's folder and, once it is gone, its database rows"""
+    job = StorageGcJob(kind="manga", manga_id=manga.id, path=os.path.join(settings.STORAGE_PATH, str(manga.id)))
+    db.add(job)
+    return job
+
+
+def job_progress(job: StorageGcJob) -> dict:
+    """Progress report for a job, as shown to admins"""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "manga_id": job.manga_id,
+        "path": job.path,
+        "status": job.status,
+        "files_total": job.files_total,
+        "files_removed": job.files_removed,
+        "bytes_freed": job.bytes_freed,
+        "error": job.error,
+        "not_before": job.not_before,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def count_files(path: str) -> int:
+    if not os.path.isdir(path):
+        return 1 if os.path.lexists(path) else 0
+    return sum(len(files) for _, _, files in os.walk(path))
+
+
+class StorageCollector:
+    """Works through pending StorageGcJobs on a daemon thread"""
+
+    def __init__(self, files_per_second: float = None, poll_seconds: float = None):
+        self.files_per_second = files_per_second if files_per_second is not None else settings.GC_FILES_PER_SECOND
+        self.poll_seconds = poll_seconds if poll_seconds is not None else settings.GC_POLL_SECONDS
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_expiry = 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-collector", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop after the current file; an unfinished job resumes on the next start"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                worked = self.run_once()
+            except Exception:
+                logger.exception("Storage collector failed")
+                worked = False
+            if not worked:
+                self._expire_uploads()
+                self._stop.wait(self.poll_seconds)
+
+    def _expire_uploads(self):
+        if time.monotonic() < self._next_expiry:
+            return
+        self._next_expiry = time.monotonic() + EXPIRE_UPLOADS_EVERY
+        from app.resumable import expire_sessions
+
+        db = SessionLocal()
+        try:
+            expire_sessions(db)
+        except Exception:
+            logger.exception("Expiring upload sessions failed")
+        finally:
+            db.close()
+
+    def run_once(self) -> bool:
+        """Process one job. Returns False when there was nothing to do."""
+        db = SessionLocal()
+        try:
+            job = self._claim(db)
+            if job is None:
+                return False
+            try:
+                self._process(db, job)
+            except Exception as e:
+                db.rollback()
+                job.status = "failed"
+                job.error = str(e)[:1000]
+                job.updated_at = datetime.now(timezone.utc)
+                db.commit()
+                logger.exception("Storage collector job %s failed", job.id)
+            return True
+        finally:
+            db.close()
+
+    def _claim(self, db: Session) -> Optional[StorageGcJob]:
+        now = datetime.now(timezone.utc)
+        stale = now - timedelta(seconds=settings.GC_LEASE_SECONDS)
+        job = (
+            db.query(StorageGcJob)
+            .filter(or_(
+                StorageGcJob.status == "pending",
+                # Left running by a collector that crashed or was killed
+                and_(StorageGcJob.status == "running", StorageGcJob.updated_at < stale),
+            ))
+            .filter(or_(StorageGcJob.not_before.is_(None), StorageGcJob.not_before <= now))
+            .order_by(StorageGcJob.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            db.rollback()
+            return None
+        job.status = "running"
+        job.updated_at = now
+        db.commit()
+        return job
+
+    def _process(self, db: Session, job: StorageGcJob):
+        if job.kind == "object":
+            storage.backend.delete(job.path)
+            job.files_total = job.files_removed = 1
+            job.status = "done"
+            job.updated_at = job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+            return
+
+        if job.files_total is None:
+            job.files_total = job.files_removed + count_files(job.path)
+            db.commit()
+
+        if not self._remove_tree(db, job):
+            # Stopping: hand the job back so the next start resumes it
+            job.status = "pending"
+            db.commit()
+            return
+
+        if job.kind == "manga" and job.manga_id is not None:
+            job.files_removed += storage.backend.delete_prefix(f"{job.manga_id}/")
+            manga = db.query(Manga).filter(Manga.id == job.manga_id, Manga.is_deleted == True).first()
+            if manga:
+                chapter_ids = [chapter_id for chapter_id, in db.query(Chapter.id).filter(Chapter.manga_id == manga.id)]
+                blobstore.release_chapters(db, chapter_ids)
+                db.delete(manga)
+                db.commit()
+            blobstore.collect_garbage(db)
+
+        job.status = "done"
+        job.updated_at = job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+    def _remove_tree(self, db: Session, job: StorageGcJob) -> bool:
+        """Delete everything under the job's path at the configured rate"""
+        interval = 1.0 / self.files_per_second if self.files_per_second > 0 else 0
+        next_at = time.monotonic()
+        unsaved = 0
+
+        def remove(path: str):
+            nonlocal next_at, unsaved
+            try:
+                size = os.lstat(path).st_size
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            job.files_removed += 1
+            job.bytes_freed += size
+            unsaved += 1
+            if unsaved >= PROGRESS_EVERY:
+                job.updated_at = datetime.now(timezone.utc)
+                db.commit()
+                unsaved = 0
+            if interval:
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_at = time.monotonic()
+
+        if os.path.isdir(job.path) and not os.path.islink(job.path):
+            for folder, dirs, files in os.walk(job.path, topdown=False):
+                for name in files:
+                    if self._stop.is_set():
+                        db.commit()
+                        return False
+                    remove(os.path.join(folder, name))
+                for name in dirs:
+                    dir_path = os.path.join(folder, name)
+                    if os.path.islink(dir_path):
+                        remove(dir_path)
+                    else:
+                        try:
+                            os.rmdir(dir_path)
+                        except OSError:
+                            pass
+            try:
+                os.rmdir(job.path)
+            except OSError:
+                pass
+        elif os.path.lexists(job.path):
+            remove(job.path)
+        db.commit()
+        return True
+
+
+collector = StorageCollector()
@@ -4,10 +4,91 @@ from functools import lru_cache
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # Read replicas for the reader's read-only routes, comma-separated URLs
+    REPLICA_URLS: str = ""
+    # Replicas further behind the primary than this are not used, and clients
+    # that just wrote read from the primary for as long
+    REPLICA_MAX_LAG_SECONDS: float = 5
+    REPLICA_CHECK_SECONDS: float = 5
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     STORAGE_PATH: str = "/app/storage/manga"
+    # "zip" keeps each chapter.zip as uploaded, "blob" splits chapters into
+    # content-addressed pages shared across chapters, "exploded" extracts
+    # pages to plain files
+    STORAGE_MODE: str = "zip"
+    # Where chapter archives and generated images are kept: "local"
+    # (STORAGE_PATH) or "s3", an S3-compatible bucket shared by several
+    # backend nodes. With s3, chapters are always stored as ZIPs.
+    STORAGE_BACKEND: str = "local"
+    S3_BUCKET: str = ""
+    S3_PREFIX: str = ""
+    # For MinIO and other S3-compatible stores; empty for AWS
+    S3_ENDPOINT_URL: str = ""
+    S3_REGION: str = ""
+    # Empty uses boto3's usual credential chain
+    S3_ACCESS_KEY_ID: str = ""
+    S3_SECRET_ACCESS_KEY: str = ""
+    # Local read-through cache of objects (default STORAGE_PATH/.cache) and its size
+    STORAGE_CACHE_PATH: str = ""
+    STORAGE_CACHE_BYTES: int = 20 * 1024 * 1024 * 1024
+    # Internal nginx location serving STORAGE_PATH; page files are handed
+    # off there with X-Accel-Redirect when nginx asks for it. Empty disables.
+    ACCEL_REDIRECT_PREFIX: str = "/_protected/storage"
+    # Chapters of a bulk upload prepared in parallel
+    INGEST_WORKERS: int = 4
+    # Rewrite uploaded archives as stored, ordered, page-aligned images
+    NORMALIZE_ARCHIVES: bool = True
+    # Resumable uploads: largest accepted chunk, largest archive, and how
+    # long an idle upload is kept before its staging file is removed
+    UPLOAD_CHUNK_MAX_BYTES: int = 16 * 1024 * 1024
+    UPLOAD_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    UPLOAD_SESSION_TTL_HOURS: int = 24
+    # Per-client request rate limits (per minute, with a burst allowance) for
+    # page images, auth, admin and all other API routes, and how many page
+    # requests a worker serves at once before answering 503. Each worker
+    # process keeps its own buckets, so with WEB_CONCURRENCY workers a client
+    # may get up to that many times these rates.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PAGES_PER_MINUTE: int = 600
+    RATE_LIMIT_PAGES_BURST: int = 200
+    RATE_LIMIT_AUTH_PER_MINUTE: int = 10
+    RATE_LIMIT_AUTH_BURST: int = 10
+    RATE_LIMIT_ADMIN_PER_MINUTE: int = 300
+    RATE_LIMIT_ADMIN_BURST: int = 100
+    RATE_LIMIT_DEFAULT_PER_MINUTE: int = 300
+    RATE_LIMIT_DEFAULT_BURST: int = 100
+    PAGES_MAX_IN_FLIGHT: int = 64
+    # Reading progress is buffered in an unlogged table and written in batches this often
+    PROGRESS_FLUSH_SECONDS: float = 5
+    # Background storage collector: deletion rate limit, how often to look
+    # for work, how long a running job may go silent before another
+    # collector takes it over, and how long what a re-upload replaced is
+    # kept for readers still on the old version
+    GC_FILES_PER_SECOND: float = 200
+    GC_POLL_SECONDS: float = 5
+    GC_LEASE_SECONDS: int = 300
+    GC_DRAIN_SECONDS: int = 300
+    # Storage consistency scanner: worker threads, hours between scheduled
+    # scans (0 disables them) and repairs scheduled scans may apply
+    # (comma-separated: orphans, trash, missing)
+    SCAN_WORKERS: int = 8
+    SCAN_INTERVAL_HOURS: float = 24
+    SCAN_REPAIR: str = ""
+    # Threads for the chapter routes' disk and database work, and how many
+    # requests may wait for one before new ones get 503
+    DISK_IO_WORKERS: int = 16
+    DISK_IO_MAX_QUEUE: int = 64
+    # In-memory cache of hot pages per worker process (0 disables), and the
+    # largest page it keeps
+    PAGE_CACHE_BYTES: int = 256 * 1024 * 1024
+    PAGE_CACHE_MAX_ENTRY_BYTES: int = 8 * 1024 * 1024
+    # Processes for CPU-bound image work (thumbnails, archive normalization)
+    IMAGE_WORKERS: int = 2
+    # Startup warm-up: chapter archives of the most recently read manga to
+    # map ahead of the first request
+    WARMUP_ARCHIVES: int = 32
 
     class Config:
         env_file = ".env"
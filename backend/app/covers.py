@@ -0,0 +1,237 @@
+"""Cover thumbnails at a few fixed sizes.
+
+The source is the cover image an admin set, fetched from its URL, or when
+there is none the first page of the manga's lowest chapter. It is rendered
+at a few fixed sizes, cropped to the 3:4 of the catalogue cards, as WebP
+under STORAGE_PATH/<manga>/.covers/. Rendering runs in the shared image
+process pool, as a background job. A cover taken from the chapters is
+redone whenever the lowest chapter is uploaded again or a lower one is
+added; one set by hand whenever it is changed.
+
+The thumbnails are versioned by a hash of the source image, in their file
+names and URLs, so they can be cached forever; the previous version is
+collected once readers have drained. ``python -m app.covers`` generates
+thumbnails for existing manga without them.
+"""
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import sys
+import urllib.request
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app import collector, storage, workers
+from app.archive_index import archive_index, read_entry
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Chapter, ChapterPage, Manga, StorageGcJob
+
+logger = logging.getLogger(__name__)
+
+# Name -> (width, height); 3:4 like the cards
+COVER_SIZES: Dict[str, Tuple[int, int]] = {
+    "small": (200, 267),
+    "medium": (400, 533),
+    "large": (800, 1067),
+}
+COVER_QUALITY = 80
+
+# Limits for fetching a cover image set by URL
+COVER_FETCH_TIMEOUT = 10
+COVER_FETCH_MAX_BYTES = 20 * 1024 * 1024
+
+
+def cover_dir(manga_id: int) -> str:
+    return os.path.join(settings.STORAGE_PATH, str(manga_id), ".covers")
+
+
+def cover_path(manga_id: int, size: str, version: str) -> str:
+    return os.path.join(cover_dir(manga_id), f"{size}-{version}.webp")
+
+
+def legacy_cover_path(manga_id: int, size: str) -> str:
+    """Where thumbnails were kept before their file names were versioned"""
+    return os.path.join(cover_dir(manga_id), f"{size}.webp")
+
+
+def cover_url(manga_id: int, version: str, size: str = "large") -> str:
+    return f"/api/manga/{manga_id}/cover/{size}?v={version}"
+
+
+def is_generated(manga: Manga) -> bool:
+    """Whether the manga's cover comes from its chapters rather than being set by hand"""
+    return not manga.cover_image or (
+        manga.cover_version is not None and manga.cover_image == cover_url(manga.id, manga.cover_version)
+    )
+
+
+def render_covers(data: bytes, out_dir: str, version: str) -> Dict[str, int]:
+    """Render every cover size from an image. Runs in the image process pool; returns the bytes written per size."""
+    from PIL import Image, ImageOps
+
+    largest = max(COVER_SIZES.values())
+    with Image.open(io.BytesIO(data)) as image:
+        # Let JPEG decode at a reduced scale when the page is much larger
+        image.draft("RGB", largest)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = {}
+    for size, dimensions in sorted(COVER_SIZES.items(), key=lambda item: -item[1][0]):
+        thumbnail = ImageOps.fit(image, dimensions, Image.LANCZOS)
+        path = os.path.join(out_dir, f"{size}-{version}.webp")
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        thumbnail.save(tmp_path, "WEBP", quality=COVER_QUALITY, method=4)
+        os.replace(tmp_path, path)
+        written[size] = os.path.getsize(path)
+    return written
+
+
+def first_page(db: Session, manga_id: int) -> Optional[Tuple[Chapter, ChapterPage]]:
+    """The first page of the manga's lowest numbered chapter that has pages"""
+    row = db.query(Chapter, ChapterPage).join(
+        ChapterPage, ChapterPage.chapter_id == Chapter.id
+    ).filter(
+        Chapter.manga_id == manga_id
+    ).order_by(Chapter.chapter_number, ChapterPage.page_index).first()
+    return tuple(row) if row else None
+
+
+def read_page(chapter: Chapter, page: ChapterPage) -> bytes:
+    """The bytes of a page, whatever the chapter's storage mode"""
+    from app.routers.chapter import page_path
+
+    if chapter.storage_mode in ("blob", "exploded"):
+        with open(page_path(chapter, page), "rb") as f:
+            return f.read()
+    zip_path = storage.archive_path(chapter)
+    if zip_path is None:
+        raise FileNotFoundError(f"Archive of chapter {chapter.id} not found")
+    entry = archive_index.lookup(chapter.id, zip_path, page.filename)
+    if entry is None:
+        raise FileNotFoundError(f"{page.filename} not in {zip_path}")
+    return bytes(read_entry(zip_path, entry))
+
+
+def release(db: Session, manga_id: int, keep: str) -> None:
+    """Queue every thumbnail but those of version ``keep`` for collection. Committed with the caller's transaction."""
+    folder = cover_dir(manga_id)
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return
+    queued = {path for (path,) in db.query(StorageGcJob.path).filter(
+        StorageGcJob.kind == "path", StorageGcJob.status == "pending", StorageGcJob.path.startswith(folder + os.sep)
+    )}
+    # Cards already showing them can finish loading them
+    for name in names:
+        path = os.path.join(folder, name)
+        if not name.endswith(f"-{keep}.webp") and path not in queued:
+            collector.enqueue_path(db, path, settings.GC_DRAIN_SECONDS)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def fetch_cover(url: str) -> Optional[bytes]:
+    """Download a cover image set by URL; None for URLs that are not public http(s) addresses"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return None
+    try:
+        # Only fetch from the internet, never from the hosts around the backend
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        for *_, address in socket.getaddrinfo(parsed.hostname, port):
+            if not ipaddress.ip_address(address[0].split("%")[0]).is_global:
+                logger.warning("Not fetching cover %s: not a public address", url)
+                return None
+        # Redirects are not followed, they could lead anywhere
+        with urllib.request.build_opener(NoRedirect).open(url, timeout=COVER_FETCH_TIMEOUT) as response:
+            data = response.read(COVER_FETCH_MAX_BYTES + 1)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not fetch cover %s: %s", url, e)
+        return None
+    if len(data) > COVER_FETCH_MAX_BYTES:
+        logger.warning("Not using cover %s: larger than %d bytes", url, COVER_FETCH_MAX_BYTES)
+        return None
+    return data
+
+
+def generate(manga_id: int) -> Optional[str]:
+    """(Re)generate a manga's cover thumbnails. Returns the new cover version, if they changed."""
+    db = SessionLocal()
+    try:
+        manga = db.query(Manga).filter(Manga.id == manga_id, Manga.is_deleted == False).first()
+        if not manga:
+            return None
+        source, old_version = manga.cover_image, manga.cover_version
+        generated = is_generated(manga)
+        if generated:
+            found = first_page(db, manga_id)
+            data = read_page(*found) if found else None
+        else:
+            data = fetch_cover(source)
+        db.rollback()
+        if not data:
+            return None
+        version = hashlib.sha256(data).hexdigest()[:12]
+        if version == old_version:
+            return None
+        workers.submit(render_covers, data, cover_dir(manga_id), version).result()
+        for size in COVER_SIZES:
+            storage.publish(cover_path(manga_id, size, version), version)
+
+        # Unless the cover was changed in the meantime
+        unchanged = or_(Manga.cover_image.is_(None), Manga.cover_image == "") if not source else Manga.cover_image == source
+        values = {Manga.cover_version: version}
+        if generated:
+            values[Manga.cover_image] = cover_url(manga_id, version)
+        updated = db.query(Manga).filter(Manga.id == manga_id, unchanged).update(values, synchronize_session=False)
+        if updated:
+            release(db, manga_id, version)
+        db.commit()
+        return version if updated else None
+    finally:
+        db.close()
+
+
+def schedule(manga_id: int) -> None:
+    """Generate a manga's cover in the background"""
+    workers.schedule(generate, manga_id)
+
+
+def main() -> int:
+    """Generate thumbnails for every manga with a cover or chapters but no thumbnails"""
+    db = SessionLocal()
+    try:
+        manga_ids = [manga_id for manga_id, in db.query(Manga.id).filter(
+            Manga.is_deleted == False,
+            Manga.cover_version.is_(None),
+            or_(Manga.chapters.any(), Manga.cover_image.isnot(None) & (Manga.cover_image != "")),
+        ).order_by(Manga.id)]
+    finally:
+        db.close()
+
+    generated = 0
+    for manga_id in manga_ids:
+        try:
+            if generate(manga_id):
+                generated += 1
+        except Exception:
+            logger.exception("Cover generation failed for manga %s", manga_id)
+    workers.shutdown()
+    print(f"Covers: {generated} of {len(manga_ids)} generated")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Dedicated thread pool for the chapter routes' disk and database work.
+
+Sync routes share Starlette's default thread pool with logins (bcrypt),
+catalogue queries and everything else, so a burst of reads from a cold
+chapter can take every thread and stall the rest of the API. The chapter
+routes are coroutines instead, and hand their blocking work to this pool
+of DISK_IO_WORKERS threads.
+
+Jobs beyond the workers wait in a queue of at most DISK_IO_MAX_QUEUE.
+Past that, new requests get 503 with Retry-After instead of piling up
+behind a slow disk. Reads that continue a response already being sent
+are not refused. Like the rest of the request path, the counters are only
+touched on the event loop, so they need no lock.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, TypeVar, Union
+
+from fastapi import HTTPException
+
+from app.config import settings
+
+T = TypeVar("T")
+
+# Bytes per chunk when streaming page data
+CHUNK_SIZE = 128 * 1024
+
+
+class DiskIO:
+    def __init__(self, workers: int = None, max_queue: int = None):
+        self.workers = max(1, workers if workers is not None else settings.DISK_IO_WORKERS)
+        self.max_queue = max(0, max_queue if max_queue is not None else settings.DISK_IO_MAX_QUEUE)
+        self.in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="disk-io")
+
+    async def run(self, fn: Callable[..., T], *args, admit: bool = True) -> T:
+        """Run fn(*args) in the pool. With admit, refuse with 503 when the queue is full."""
+        if admit and self.in_flight >= self.workers + self.max_queue:
+            raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # Carry the request's context along, as asyncio.to_thread does
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, functools.partial(context.run, fn, *args))
+        finally:
+            self.in_flight -= 1
+
+    async def iter_data(self, data: Union[bytes, memoryview]) -> AsyncIterator[bytes]:
+        """Stream page data in chunks. Views of a mapped archive are copied out in the pool, where page faults may block."""
+        for start in range(0, len(data), CHUNK_SIZE):
+            chunk = data[start:start + CHUNK_SIZE]
+            if isinstance(chunk, memoryview):
+                yield await self.run(bytes, chunk, admit=False)
+            else:
+                yield chunk
+
+    async def iter_file(self, f: BinaryIO) -> AsyncIterator[bytes]:
+        """Stream an open file in chunks read in the pool, closing it at the end"""
+        try:
+            while True:
+                chunk = await self.run(f.read, CHUNK_SIZE, admit=False)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+
+disk_io = DiskIO()
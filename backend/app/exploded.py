@@ -0,0 +1,55 @@
+"""Exploded chapter storage used when STORAGE_MODE=exploded.
+
+Ingest extracts every page of a chapter archive into a ``pages.v<N>`` folder
+next to the archive version it came from. Page requests then only need a
+database lookup before handing the file to nginx with X-Accel-Redirect.
+Like the archive, the folder of the version being replaced stays in place
+until readers have drained; chapters from before versioning use ``pages``.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import List, Optional
+
+from app import storage
+from app.archive import PageRef, list_image_entries
+from app.imageinfo import read_image_info
+
+PAGES_DIR = "pages"
+
+
+def pages_dir(chapter_folder: str, version: Optional[int]) -> str:
+    """Folder holding the extracted pages of a chapter archive version"""
+    return os.path.join(chapter_folder, storage.versioned_name(PAGES_DIR, version))
+
+
+def explode_archive(zip_path: str, chapter_folder: str, version: int) -> List[PageRef]:
+    """Extract the images of a chapter ZIP into the pages folder of its version"""
+    staging = tempfile.mkdtemp(dir=chapter_folder, prefix=".pages-")
+    refs = []
+    seen = set()
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            for filename, name in list_image_entries(zf):
+                # Pages are addressed by basename, keep the first of duplicates
+                if filename in seen:
+                    continue
+                seen.add(filename)
+                path = os.path.join(staging, filename)
+                with zf.open(name) as src, open(path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                with open(path, "rb") as f:
+                    info = read_image_info(f)
+                zinfo = zf.getinfo(name)
+                refs.append(PageRef(filename=filename, size=zinfo.file_size, crc32=zinfo.CRC).set_info(info))
+        if refs:
+            # Nothing points at the folder before the chapter is committed
+            os.rename(staging, pages_dir(chapter_folder, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if not refs:
+        shutil.rmtree(staging, ignore_errors=True)
+    return refs
@@ -0,0 +1,134 @@
+"""Background warm-up after startup, and the checks behind /health/ready.
+
+Workers start serving straight away. Warm-up then opens the database
+pool's connections and maps the archive index and the archives of the
+chapters most recently read, so the first readers do not pay for it.
+Readiness needs the database and storage to be reachable and warm-up to
+have finished. A failed warm-up still counts as finished, because the
+caches it fills are also filled on demand.
+"""
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from app import storage
+from app.archive_index import archive_index
+from app.config import settings
+from app.database import SessionLocal, engine, replicas
+from app.models import Chapter, ReadingProgress
+from app.zipmmap import BadArchive, archives
+
+logger = logging.getLogger(__name__)
+
+
+def warm_pool() -> int:
+    """Open the pool's connections up front. Returns how many were opened."""
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = []
+    try:
+        for _ in range(size):
+            conn = engine.connect()
+            connections.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
+
+def warm_archives(limit: int) -> int:
+    """Map the archives of the most recently read zip chapters. Returns how many were mapped."""
+    db = SessionLocal()
+    try:
+        rows = db.query(Chapter.id, Chapter.folder_path, Chapter.archive_key, Chapter.archive_version).join(
+            ReadingProgress, ReadingProgress.chapter_id == Chapter.id
+        ).filter(
+            Chapter.storage_mode == "zip", Chapter.folder_path.isnot(None)
+        ).order_by(ReadingProgress.updated_at.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+    mapped = 0
+    seen = set()
+    for row in rows:
+        if row.id in seen:
+            continue
+        seen.add(row.id)
+        # Only archives this node has; warm-up does not download from the object store
+        zip_path = storage.archive_path(row, fetch=False)
+        if not zip_path:
+            continue
+        try:
+            archives.open(zip_path).entries()
+        except (OSError, BadArchive):
+            continue
+        mapped += 1
+    return mapped
+
+
+class Warmup:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            connections = warm_pool()
+            indexed = archive_index.warm()
+            mapped = warm_archives(settings.WARMUP_ARCHIVES)
+            logger.info("Warm-up done: %d connections, %d chapters indexed, %d archives mapped",
+                        connections, indexed, mapped)
+        except Exception as e:
+            self.error = f"{e.__class__.__name__}: {e}"
+            logger.exception("Warm-up failed")
+        finally:
+            self.done.set()
+
+
+def readiness() -> Tuple[bool, Dict[str, str]]:
+    """(ready, state of each check)"""
+    checks = {}
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"unreachable: {e.__class__.__name__}"
+
+    storage_path = settings.STORAGE_PATH
+    if not os.path.isdir(storage_path):
+        checks["storage"] = "missing"
+    elif not os.access(storage_path, os.W_OK):
+        checks["storage"] = "read-only"
+    else:
+        checks["storage"] = "ok"
+    if storage.backend.remote and checks["storage"] == "ok":
+        try:
+            storage.backend.check()
+        except Exception as e:
+            checks["storage"] = f"object store unreachable: {e.__class__.__name__}"
+
+    # Reads fall back to the primary, so replicas being down does not make the worker unready
+    for index, replica in enumerate(replicas.replicas):
+        checks[f"replica_{index}"] = "ok" if replica.healthy else (replica.error or "not checked")
+
+    if not warmup.done.is_set():
+        checks["warmup"] = "running"
+    else:
+        checks["warmup"] = "ok" if warmup.error is None else f"failed: {warmup.error}"
+
+    ready = checks["database"] == "ok" and checks["storage"] == "ok" and warmup.done.is_set()
+    return ready, checks
+
+
+warmup = Warmup()
@@ -0,0 +1,125 @@
+"""Image dimensions from file headers, without decoding the image.
+
+Only as much of the file is read as the format needs: a fixed-size header
+for PNG, GIF and WebP, and the segments up to the first frame header for
+JPEG.
+"""
+import io
+import struct
+from typing import BinaryIO, NamedTuple, Optional
+
+# Bytes read up front; enough for every format but JPEG
+HEAD_SIZE = 32
+
+# Give up on a JPEG whose frame header is not within this many bytes
+JPEG_SCAN_LIMIT = 1024 * 1024
+
+# Start-of-frame markers, i.e. every SOFn except DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xDA))
+
+
+class ImageInfo(NamedTuple):
+    format: str
+    width: int
+    height: int
+
+
+def read_image_info(f: BinaryIO) -> Optional[ImageInfo]:
+    """Read the format and dimensions of an image from a file object positioned at its start.
+
+    Returns None for unknown formats and truncated or corrupt headers.
+    """
+    head = f.read(HEAD_SIZE)
+    try:
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", head[16:24])
+            return ImageInfo("png", width, height)
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            width, height = struct.unpack("<HH", head[6:10])
+            return ImageInfo("gif", width, height)
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return webp_info(head)
+        if head[:2] == b"\xff\xd8":
+            return jpeg_info(f, head[2:])
+    except struct.error:
+        return None
+    return None
+
+
+def image_info(data: bytes) -> Optional[ImageInfo]:
+    """read_image_info for an image already in memory"""
+    return read_image_info(io.BytesIO(data))
+
+
+def webp_info(head: bytes) -> Optional[ImageInfo]:
+    chunk = head[12:16]
+    if chunk == b"VP8 ":
+        # Lossy: 14-bit dimensions after the keyframe start code
+        if head[23:26] != b"\x9d\x01\x2a":
+            return None
+        width, height = struct.unpack("<HH", head[26:30])
+        return ImageInfo("webp", width & 0x3FFF, height & 0x3FFF)
+    if chunk == b"VP8L":
+        # Lossless: 14-bit width-1 and height-1 packed after the signature byte
+        if head[20] != 0x2F:
+            return None
+        bits = struct.unpack("<I", head[21:25])[0]
+        return ImageInfo("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b"VP8X":
+        # Extended: 24-bit canvas width-1 and height-1
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return ImageInfo("webp", width, height)
+    return None
+
+
+def jpeg_info(f: BinaryIO, buffered: bytes) -> Optional[ImageInfo]:
+    """Walk the JPEG segments after SOI until a start-of-frame header"""
+    data = bytearray(buffered)
+    pos = 0
+    consumed = 0
+
+    def need(n: int) -> bool:
+        nonlocal data
+        missing = pos + n - len(data)
+        if missing > 0:
+            data += f.read(missing)
+        return len(data) >= pos + n
+
+    while consumed + pos < JPEG_SCAN_LIMIT:
+        if not need(2):
+            return None
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        pos += 2
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if not need(2):
+            return None
+        length = struct.unpack(">H", data[pos:pos + 2])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if not need(7):
+                return None
+            height, width = struct.unpack(">HH", data[pos + 3:pos + 7])
+            return ImageInfo("jpeg", width, height)
+        if marker == 0xDA or length < 2:
+            # Scan data without a frame header first: not a valid JPEG
+            return None
+        # Skip the segment, dropping what is no longer needed
+        skip = pos + length - len(data)
+        consumed += pos + length
+        if skip > 0:
+            f.read(skip)
+            data = bytearray()
+        else:
+            data = data[pos + length:]
+        pos = 0
+    return None
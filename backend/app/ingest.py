@@ -0,0 +1,401 @@
+"""Chapter ingest pipeline shared by single and bulk uploads.
+
+Ingest runs in two stages. ``prepare_chapter`` does all the file work for
+one chapter without touching the database, so several chapters can be
+prepared in parallel. ``commit_chapters`` then records any number of
+prepared chapters in a single transaction and finishes the file work that
+has to wait for the commit.
+
+A re-upload never touches the archive readers are using. The new archive
+is placed next to it as the chapter's next version (chapter.v<N>.zip), and
+the commit that points the chapter at it is the switch-over. The old
+version is collected GC_DRAIN_SECONDS later, once requests that started on
+it are done.
+"""
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app import blobstore, collector, covers, exploded, sprites, storage, tiles, workers
+from app.archive_index import archive_index
+from app.archive import IMAGE_EXTENSIONS, PageRef, zip_page_refs
+from app.config import settings
+from app.models import Chapter, Manga
+from app.normalize import normalize_archive
+
+logger = logging.getLogger(__name__)
+
+STAGING_PATH = os.path.join(settings.STORAGE_PATH, ".staging")
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Last archive version handed out in a chapter folder
+VERSION_MARKER = ".version"
+
+# Chapters inside a bulk upload can be archives as well as folders
+ARCHIVE_EXTENSIONS = {'.zip', '.cbz'}
+
+
+@dataclass
+class BulkItem:
+    """One chapter found in a bulk upload: an inner archive or a folder of images"""
+    name: str
+    archive: Optional[str] = None
+    pages: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PreparedChapter:
+    chapter_number: int
+    title: Optional[str]
+    folder: str
+    storage_mode: str
+    zip_path: str
+    refs: List[PageRef] = field(default_factory=list)
+    # Object store key the archive was uploaded to (STORAGE_BACKEND=s3)
+    archive_key: Optional[str] = None
+    archive_version: Optional[int] = None
+
+
+def current_storage_mode() -> str:
+    # The object store holds chapters as archives only
+    if storage.backend.remote:
+        return "zip"
+    return settings.STORAGE_MODE if settings.STORAGE_MODE in ("blob", "exploded") else "zip"
+
+
+def chapter_folder(manga_id: int, chapter_number: int) -> str:
+    return os.path.join(settings.STORAGE_PATH, str(manga_id), str(chapter_number))
+
+
+def staging_file(suffix: str = ".zip") -> str:
+    """Create an empty staging file on the same filesystem as the library, so it can be renamed into place"""
+    os.makedirs(STAGING_PATH, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=STAGING_PATH, suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def save_upload(src: BinaryIO) -> str:
+    """Copy an uploaded file to a new staging file without holding it in memory"""
+    path = staging_file()
+    try:
+        with open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def next_archive_version(folder: str) -> int:
+    """Reserve the chapter's next archive version.
+
+    Version numbers are never handed out twice, even once the files of
+    earlier versions are gone (blob uploads drop their archive, and the
+    collector drains old versions), since cached tile URLs carry them. The
+    last one handed out is kept in the folder's VERSION_MARKER.
+    """
+    with open(os.path.join(folder, VERSION_MARKER), "a+") as marker:
+        fcntl.flock(marker, fcntl.LOCK_EX)
+        try:
+            marker.seek(0)
+            last = marker.read().strip()
+            # Folders from before the marker only have their files to go by
+            versions = [storage.entry_version(name) for name in os.listdir(folder)]
+            version = max([int(last or 0)] + [v for v in versions if v is not None]) + 1
+            marker.seek(0)
+            marker.truncate()
+            marker.write(str(version))
+            marker.flush()
+            os.fsync(marker.fileno())
+        finally:
+            fcntl.flock(marker, fcntl.LOCK_UN)
+    return version
+
+
+def place_archive(src_path: str, folder: str) -> Tuple[int, str]:
+    """Move a staged archive into a chapter folder as the chapter's next version. Returns (version, path)."""
+    while True:
+        version = next_archive_version(folder)
+        path = os.path.join(folder, storage.archive_name(version))
+        try:
+            # Appears complete under its name, and never over another upload's
+            os.link(src_path, path)
+        except FileExistsError:
+            continue
+        os.remove(src_path)
+        return version, path
+
+
+def discard(path: str) -> None:
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def discard_version(prepared: PreparedChapter) -> None:
+    """Remove the archive of a version that was never committed and the pages and tiles made from it"""
+    discard(prepared.zip_path)
+    for path in (exploded.pages_dir(prepared.folder, prepared.archive_version),
+                 tiles.tiles_dir(prepared.folder, prepared.archive_version)):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def prepare_chapter(manga_id: int, chapter_number: int, title: Optional[str], src_path: str) -> PreparedChapter:
+    """Validate a staged chapter archive, normalize it and move it into the library.
+
+    The staged file is consumed: it is either moved into place or removed.
+    Raises HTTPException(400) when the archive is unusable, leaving any
+    existing version of the chapter untouched.
+    """
+    try:
+        with zipfile.ZipFile(src_path, "r") as zf:
+            if not zf.namelist():
+                raise HTTPException(status_code=400, detail="ZIP file is empty")
+        if settings.NORMALIZE_ARCHIVES:
+            # Decompressing and rewriting is CPU work, done in the image pool
+            workers.submit(normalize_archive, src_path).result()
+    except zipfile.BadZipFile:
+        discard(src_path)
+        raise HTTPException(status_code=400, detail="Invalid ZIP file")
+    except HTTPException:
+        discard(src_path)
+        raise
+
+    folder = chapter_folder(manga_id, chapter_number)
+    os.makedirs(folder, exist_ok=True)
+    # Readers stay on the current version until this one is committed
+    version, zip_path = place_archive(src_path, folder)
+    prepared = PreparedChapter(
+        chapter_number=chapter_number,
+        title=title,
+        folder=folder,
+        storage_mode=current_storage_mode(),
+        zip_path=zip_path,
+        archive_version=version,
+    )
+
+    try:
+        # Split or extract pages and build the manifest before touching the database
+        try:
+            if prepared.storage_mode == "blob":
+                prepared.refs = blobstore.split_archive(prepared.zip_path)
+            elif prepared.storage_mode == "exploded":
+                prepared.refs = exploded.explode_archive(prepared.zip_path, folder, version)
+            else:
+                prepared.refs = zip_page_refs(prepared.zip_path)
+            if not prepared.refs and prepared.storage_mode != "zip":
+                raise HTTPException(status_code=400, detail="ZIP file contains no images")
+
+            # Slice long-strip pages so the reader can load them a tile at a time
+            tiles.tile_chapter(prepared.zip_path, prepared.refs, folder, version)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Invalid ZIP file")
+
+        if storage.backend.remote:
+            # Upload before the chapter is committed, so no node sees a key without its object
+            prepared.archive_key = storage.new_archive_key(manga_id, chapter_number)
+            try:
+                storage.backend.upload(prepared.archive_key, prepared.zip_path)
+            except Exception:
+                raise HTTPException(status_code=503, detail="Storage unavailable")
+    except BaseException:
+        # Nothing points at this version yet
+        discard_version(prepared)
+        raise
+
+    return prepared
+
+
+def commit_chapters(db: Session, manga: Manga, prepared: List[PreparedChapter]) -> List[Chapter]:
+    """Create or update the chapter rows of prepared chapters in one transaction
+
+    The rows are upserted on (manga_id, chapter_number), so concurrent
+    uploads of the same chapter cannot create duplicates: the later one
+    waits on the row lock and then replaces the earlier one's manifest.
+    """
+    # Lock rows in a fixed order so concurrent bulk uploads cannot deadlock
+    prepared = sorted(prepared, key=lambda p: p.chapter_number)
+    # The archives these uploads replace
+    old_rows = {
+        row.chapter_number: row
+        for row in db.query(
+            Chapter.chapter_number, Chapter.folder_path, Chapter.archive_key, Chapter.archive_version
+        ).filter(
+            Chapter.manga_id == manga.id,
+            Chapter.chapter_number.in_([p.chapter_number for p in prepared]),
+        ).order_by(Chapter.chapter_number).with_for_update()
+    }
+    stmt = insert(Chapter).values([
+        {
+            "manga_id": manga.id,
+            "chapter_number": p.chapter_number,
+            "title": p.title,
+            "folder_path": p.folder,
+            "storage_mode": p.storage_mode,
+            "archive_key": p.archive_key,
+            "archive_version": p.archive_version,
+        }
+        for p in prepared
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Chapter.manga_id, Chapter.chapter_number],
+        set_={
+            "title": stmt.excluded.title,
+            "folder_path": stmt.excluded.folder_path,
+            "storage_mode": stmt.excluded.storage_mode,
+            "archive_key": stmt.excluded.archive_key,
+            "archive_version": stmt.excluded.archive_version,
+            # The pages changed: the old sprite sheet no longer applies
+            "sprite_version": None,
+            "sprite_map": None,
+        },
+    ).returning(Chapter.chapter_number, Chapter.id)
+    ids = dict(db.execute(stmt).all())
+
+    # Re-uploads keep their creation time, so only new chapters move the manga up
+    db.query(Manga).filter(Manga.id == manga.id).update(
+        {Manga.last_chapter_at: select(func.max(Chapter.created_at)).where(Chapter.manga_id == manga.id).scalar_subquery()},
+        synchronize_session=False,
+    )
+
+    for p in prepared:
+        blobstore.apply_manifest(db, ids[p.chapter_number], p.refs)
+        # Requests already on the old archive version get GC_DRAIN_SECONDS to finish
+        old = old_rows.get(p.chapter_number)
+        if old and old.archive_key and old.archive_key != p.archive_key:
+            collector.enqueue_object(db, old.archive_key, settings.GC_DRAIN_SECONDS)
+        elif old and not old.archive_key:
+            old_path = storage.local_archive_path(old)
+            if old_path and old_path != p.zip_path and os.path.exists(old_path):
+                collector.enqueue_path(db, old_path, settings.GC_DRAIN_SECONDS)
+        if old and old.folder_path and old.archive_version != p.archive_version:
+            # And the pages and tiles made from it
+            for old_path in (exploded.pages_dir(old.folder_path, old.archive_version),
+                             tiles.tiles_dir(old.folder_path, old.archive_version)):
+                if os.path.exists(old_path):
+                    collector.enqueue_path(db, old_path, settings.GC_DRAIN_SECONDS)
+
+    # Index the new archives before the switch-over, so their first readers find every worker warm
+    archive_index.index_chapters(
+        (ids[p.chapter_number], p.zip_path) for p in prepared if p.storage_mode == "zip"
+    )
+
+    db.commit()
+
+    for p in prepared:
+        if p.storage_mode == "blob":
+            # Restore any blob collected while this upload was in flight, then
+            # drop the archive: the pages are now the chapter
+            lost = blobstore.missing_blobs(p.refs)
+            if lost:
+                blobstore.split_archive(p.zip_path, lost)
+            discard(p.zip_path)
+        elif p.archive_key:
+            # Just uploaded, so likely read soon: keep it as this node's cached copy
+            p.zip_path = storage.cache.add(p.archive_key, p.zip_path)
+
+    # Pages dropped by a re-upload may no longer be referenced anywhere
+    blobstore.collect_garbage(db)
+
+    # A cover taken from the first page follows the lowest chapter
+    lowest = db.query(func.min(Chapter.chapter_number)).filter(Chapter.manga_id == manga.id).scalar()
+    if covers.is_generated(manga) and any(p.chapter_number <= lowest for p in prepared):
+        covers.schedule(manga.id)
+    sprites.schedule(ids[p.chapter_number] for p in prepared)
+
+    return db.query(Chapter).filter(Chapter.id.in_(ids.values())).order_by(Chapter.chapter_number).all()
+
+
+def list_bulk_items(outer_path: str) -> List[BulkItem]:
+    """Find the chapters of a bulk upload: inner ZIP/CBZ archives and folders containing images"""
+    items = []
+    folders = {}
+    with zipfile.ZipFile(outer_path, "r") as zf:
+        for info in zf.infolist():
+            if info.is_dir() or "__MACOSX" in info.filename.split("/"):
+                continue
+            stem, ext = os.path.splitext(os.path.basename(info.filename))
+            ext = ext.lower()
+            if ext in ARCHIVE_EXTENSIONS:
+                items.append(BulkItem(name=stem, archive=info.filename))
+            elif ext in IMAGE_EXTENSIONS:
+                folder = os.path.dirname(info.filename)
+                if folder:
+                    folders.setdefault(folder, []).append(info.filename)
+    items.extend(BulkItem(name=os.path.basename(folder), pages=pages) for folder, pages in folders.items())
+    return items
+
+
+def stage_bulk_item(outer_path: str, item: BulkItem) -> str:
+    """Write one chapter of a bulk upload to its own staging ZIP"""
+    path = staging_file()
+    try:
+        with zipfile.ZipFile(outer_path, "r") as outer:
+            if item.archive:
+                with outer.open(item.archive) as src, open(path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            else:
+                with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as dst:
+                    for name in item.pages:
+                        with outer.open(name) as src, dst.open(os.path.basename(name), "w", force_zip64=True) as out:
+                            shutil.copyfileobj(src, out, COPY_BUFFER_SIZE)
+    except BaseException:
+        discard(path)
+        raise
+    return path
+
+
+def prepare_bulk(
+    manga_id: int, outer_path: str, numbered: List[Tuple[int, BulkItem]]
+) -> List[Union[PreparedChapter, Exception]]:
+    """Prepare the chapters of a bulk upload in parallel, INGEST_WORKERS at a time.
+
+    Every worker opens the outer archive itself, so chapters are read
+    concurrently. Returns a PreparedChapter or the error for each chapter,
+    in order.
+    """
+    def prepare(chapter_number: int, item: BulkItem) -> Union[PreparedChapter, Exception]:
+        try:
+            staged = stage_bulk_item(outer_path, item)
+            return prepare_chapter(manga_id, chapter_number, None, staged)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=settings.INGEST_WORKERS, thread_name_prefix="ingest") as pool:
+        return list(pool.map(lambda entry: prepare(*entry), numbered))
+
+
+def abandon_chapters(db: Session, manga: Manga, prepared: List[PreparedChapter]) -> None:
+    """Clean up after commit_chapters raised: discard the prepared versions no chapter points at.
+
+    The commit itself may have gone through before the error, so the rows
+    are checked first; if they cannot be read, the files are left for the
+    storage scan.
+    """
+    db.rollback()
+    committed = set(db.query(Chapter.chapter_number, Chapter.archive_version).filter(
+        Chapter.manga_id == manga.id,
+        Chapter.chapter_number.in_([p.chapter_number for p in prepared]),
+    ).all())
+    db.rollback()
+    for p in prepared:
+        if (p.chapter_number, p.archive_version) in committed:
+            continue
+        discard_version(p)
+        if p.archive_key:
+            try:
+                storage.backend.delete(p.archive_key)
+            except Exception:
+                logger.warning("Could not delete uncommitted archive %s", p.archive_key, exc_info=True)
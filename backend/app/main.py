@@ -2,72 +2,49 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import math
 import os
+import time
 
-from app.database import engine, Base, get_db
-from app.routers import auth, manga, chapter, admin
-from app.models import User, SiteConfig
-from app.auth import get_password_hash
-
-
-def create_seed_admin():
-    """Create seed admin user if environment variables are set and no users exist"""
-    from app.database import SessionLocal
-    
-    db = SessionLocal()
-    try:
-        # Check if any users exist
-        user_count = db.query(User).count()
-        if user_count > 0:
-            return  # Skip if users already exist
-        
-        # Get setup admin credentials from environment
-        admin_username = os.getenv("SETUP_ADMIN_USERNAME")
-        admin_email = os.getenv("SETUP_ADMIN_EMAIL")
-        admin_password = os.getenv("SETUP_ADMIN_PASSWORD")
-        
-        # Only create if all environment variables are set
-        if admin_username and admin_email and admin_password:
-            # Check if admin already exists by username
-            existing = db.query(User).filter(User.username == admin_username).first()
-            if existing:
-                return
-            
-            # Create the seed admin
-            admin_user = User(
-                username=admin_username,
-                email=admin_email,
-                hashed_password=get_password_hash(admin_password),
-                role="admin"
-            )
-            db.add(admin_user)
-            
-            # Set registration to disabled by default
-            config = db.query(SiteConfig).filter(SiteConfig.key == "registration_enabled").first()
-            if not config:
-                config = SiteConfig(key="registration_enabled", value="false")
-                db.add(config)
-            
-            db.commit()
-            print(f"Seed admin user '{admin_username}' created successfully!")
-    finally:
-        db.close()
+from app import workers
+from app.routers import auth, manga, chapter, admin, uploads, progress, feed
+from app.collector import collector
+from app.health import readiness, warmup
+from app.scanner import scheduler as scan_scheduler
+from app.progress import progress_buffer
+from app.ratelimit import limiter, pool_for, client_keys, retry_after
+from app.config import settings
+from app.database import read_primary, replicas
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables on startup
-    Base.metadata.create_all(bind=engine)
-
-    # Create seed admin if environment variables are set
-    create_seed_admin()
+    # Schema and seed admin are set up by app.migrate before the workers start
 
     # Ensure storage directory exists
     storage_path = os.getenv("STORAGE_PATH", "/app/storage/manga")
     os.makedirs(storage_path, exist_ok=True)
 
+    # Reclaim storage of deleted manga and replaced archives in the background
+    collector.start()
+    # Periodic storage consistency scans
+    scan_scheduler.start()
+    # Batched writes of reading progress
+    progress_buffer.start()
+    # Fill the connection pool and archive caches without holding up startup
+    warmup.start()
+    # Health and lag checks of the read replicas, if any
+    replicas.start()
+
     yield
 
+    # Write progress still buffered before exiting
+    progress_buffer.stop()
+    replicas.stop()
+    scan_scheduler.stop()
+    collector.stop()
+    workers.shutdown()
+
 
 app = FastAPI(
     title="Manga Reader API",
@@ -76,6 +53,63 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Rate limiting and admission control. Registered before CORS so that
+# throttled responses still get CORS headers.
+@app.middleware("http")
+async def rate_limit(request, call_next):
+    pool = pool_for(request.url.path) if settings.RATE_LIMIT_ENABLED else None
+    if pool is None or request.method == "OPTIONS":
+        return await call_next(request)
+
+    wait = limiter.check(pool, client_keys(request))
+    if wait > 0:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests"},
+            headers={"Retry-After": retry_after(wait)},
+        )
+
+    if pool != "pages":
+        return await call_next(request)
+    # Keep page requests from taking every slot of uvicorn's --limit-concurrency
+    if limiter.pages_in_flight >= settings.PAGES_MAX_IN_FLIGHT:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server busy"},
+            headers={"Retry-After": "1"},
+        )
+    limiter.pages_in_flight += 1
+    try:
+        return await call_next(request)
+    finally:
+        limiter.pages_in_flight -= 1
+
+
+# Read-after-write: a client that just wrote reads from the primary until
+# every replica in use has its write. Reading progress is not read back
+# through replicas, so reporting it does not count.
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+
+@app.middleware("http")
+async def read_your_writes(request, call_next):
+    if not replicas.enabled:
+        return await call_next(request)
+    try:
+        until = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        until = 0
+    read_primary.set(until > time.time())
+    response = await call_next(request)
+
+    wrote = request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400
+    if wrote and not request.url.path.startswith("/api/progress"):
+        window = replicas.read_after_write_seconds
+        response.set_cookie(READ_PRIMARY_COOKIE, str(int(time.time() + window) + 1),
+                            max_age=math.ceil(window) + 1, httponly=True, samesite="lax")
+    return response
+
+
 # CORS configuration - allow all for LAN access
 # Can be restricted via CORS_ORIGINS env variable (comma-separated)
 cors_origins = os.getenv("CORS_ORIGINS", "*")
@@ -104,6 +138,9 @@ app.include_router(auth.router)
 app.include_router(manga.router)
 app.include_router(chapter.router)
 app.include_router(admin.router)
+app.include_router(uploads.router)
+app.include_router(progress.router)
+app.include_router(feed.router)
 
 
 @app.get("/")
@@ -114,3 +151,19 @@ def root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+
+@app.get("/health/live")
+def liveness():
+    """The process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def readiness_check():
+    """Database and storage reachable and warm-up finished, else 503"""
+    ready, checks = readiness()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not ready", "checks": checks},
+    )
@@ -0,0 +1,81 @@
+"""Schema setup and first-run seeding, run once before the workers start.
+
+``python -m app.migrate`` applies init.sql (idempotent, so it also upgrades
+existing databases), creates any table the models define that init.sql
+does not, and creates the seed admin on an empty database. The API
+processes themselves do no schema work at startup.
+
+Concurrent runs (several containers starting at once) are serialized with
+a Postgres advisory lock.
+"""
+import os
+import sys
+
+from sqlalchemy import exists, select, text
+from sqlalchemy.exc import IntegrityError
+
+from app.auth import get_password_hash
+from app.database import Base, SessionLocal, engine
+from app.models import SiteConfig, User
+
+INIT_SQL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "init.sql")
+
+# Arbitrary key for pg_advisory_lock, shared by every migrate run
+MIGRATE_LOCK_KEY = 0x6D616E6761
+
+
+def apply_schema() -> None:
+    """Apply init.sql, then create whatever the models add on top of it"""
+    with open(INIT_SQL_PATH) as f:
+        script = f.read()
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATE_LOCK_KEY})
+        # Plain DBAPI execute: the script is several statements
+        conn.exec_driver_sql(script)
+        Base.metadata.create_all(bind=conn)
+
+
+def create_seed_admin() -> bool:
+    """Create the seed admin if SETUP_ADMIN_* are set and there are no users yet. Returns True if created."""
+    admin_username = os.getenv("SETUP_ADMIN_USERNAME")
+    admin_email = os.getenv("SETUP_ADMIN_EMAIL")
+    admin_password = os.getenv("SETUP_ADMIN_PASSWORD")
+    if not (admin_username and admin_email and admin_password):
+        return False
+
+    db = SessionLocal()
+    try:
+        # One indexed probe; the password is only hashed when there is nobody
+        if db.execute(select(exists().where(User.id.isnot(None)))).scalar():
+            return False
+
+        db.add(User(
+            username=admin_username,
+            email=admin_email,
+            hashed_password=get_password_hash(admin_password),
+            role="admin"
+        ))
+        # Set registration to disabled by default
+        if not db.query(SiteConfig).filter(SiteConfig.key == "registration_enabled").first():
+            db.add(SiteConfig(key="registration_enabled", value="false"))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another migrate run created it at the same time
+            db.rollback()
+            return False
+        return True
+    finally:
+        db.close()
+
+
+def main() -> int:
+    apply_schema()
+    print("Database schema up to date")
+    if create_seed_admin():
+        print(f"Seed admin user '{os.getenv('SETUP_ADMIN_USERNAME')}' created successfully!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -17,6 +17,14 @@ class User(Base):
 
     manga_uploads = relationship("Manga", back_populates="uploader")
 
+    __table_args__ = (
+        # Case-insensitive prefix search in the admin user list
+        Index("idx_users_username_prefix", func.lower(username).label("lower_username"),
+              postgresql_ops={"lower_username": "varchar_pattern_ops"}),
+        Index("idx_users_email_prefix", func.lower(email).label("lower_email"),
+              postgresql_ops={"lower_email": "varchar_pattern_ops"}),
+    )
+
 
 class Manga(Base):
     __tablename__ = "manga"
@@ -25,14 +33,24 @@ class Manga(Base):
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     cover_image = Column(String(500), nullable=True)
+    # Hash of the page the generated cover thumbnails were made from, None without thumbnails
+    cover_version = Column(String(16), nullable=True)
     folder_path = Column(String(500), nullable=True)
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     is_published = Column(Boolean, default=False)
+    is_deleted = Column(Boolean, default=False, server_default="false", nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # Creation time of the newest chapter, kept up to date by ingest; None without chapters
+    last_chapter_at = Column(DateTime(timezone=True), nullable=True)
 
     uploader = relationship("User", back_populates="manga_uploads")
     chapters = relationship("Chapter", back_populates="manga", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("idx_manga_last_chapter_at", last_chapter_at.desc().nullslast(), id.desc()),
+    )
+
 
 class Chapter(Base):
     __tablename__ = "chapters"
@@ -42,9 +60,175 @@ class Chapter(Base):
     chapter_number = Column(Integer, nullable=False)
     title = Column(String(255), nullable=True)
     folder_path = Column(String(500), nullable=True)
+    storage_mode = Column(String(20), default="zip", server_default="zip", nullable=False)
+    # Page thumbnail sprite sheet: version (None until rendered) and JSON [x, y, w, h] per page
+    sprite_version = Column(String(16), nullable=True)
+    sprite_map = Column(Text, nullable=True)
+    # Key of the archive in the object store (STORAGE_BACKEND=s3); None for archives on local disk
+    archive_key = Column(String(500), nullable=True)
+    # Version of the archive on local disk, named chapter.v<N>.zip; None for a chapter.zip from before versioning
+    archive_version = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     manga = relationship("Manga", back_populates="chapters")
+    pages = relationship("ChapterPage", back_populates="chapter", order_by="ChapterPage.page_index",
+                         cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("idx_chapters_manga_number", "manga_id", "chapter_number", unique=True),
+        Index("idx_chapters_created", created_at.desc(), id.desc()),
+    )
+
+
+class PageBlob(Base):
+    """A page image stored once by content hash, shared by every chapter that contains it"""
+    __tablename__ = "page_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_page_blobs_unreferenced", "sha256", postgresql_where=(ref_count <= 0)),
+    )
+
+
+class ChapterPage(Base):
+    """One entry of a chapter's ordered page manifest"""
+    __tablename__ = "chapter_pages"
+
+    id = Column(Integer, primary_key=True)
+    chapter_id = Column(Integer, ForeignKey("chapters.id", ondelete="CASCADE"), nullable=False)
+    page_index = Column(Integer, nullable=False)
+    filename = Column(String(255), nullable=False)
+    blob_sha256 = Column(String(64), ForeignKey("page_blobs.sha256"), nullable=True)
+    size = Column(BigInteger, nullable=False)
+    # Read from the image header at ingest; NULL when it could not be parsed
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    format = Column(String(10), nullable=True)
+    # CRC-32 of the page data, as recorded in the uploaded archive; NULL for pages from before downloads
+    crc32 = Column(BigInteger, nullable=True)
+    # Start of the page's data in the chapter archive when stored uncompressed, for ranged reads
+    data_offset = Column(BigInteger, nullable=True)
+    # Long-strip pages sliced for the reader (app.tiles): tile height and count; NULL when not sliced
+    tile_height = Column(Integer, nullable=True)
+    tile_count = Column(Integer, nullable=True)
+
+    chapter = relationship("Chapter", back_populates="pages")
+
+    __table_args__ = (
+        Index("idx_chapter_pages_chapter", "chapter_id", "page_index"),
+        Index("idx_chapter_pages_blob", "blob_sha256"),
+    )
+
+
+class StorageGcJob(Base):
+    """Storage the background collector still has to reclaim"""
+    __tablename__ = "storage_gc_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False)  # "manga", "path" or "object" (a key in the object store)
+    manga_id = Column(Integer, nullable=True)
+    path = Column(String(500), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, done, failed
+    files_total = Column(Integer, nullable=True)
+    files_removed = Column(Integer, nullable=False, default=0)
+    bytes_freed = Column(BigInteger, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    # Not collected before this time, so readers of a replaced archive can finish
+    not_before = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("idx_storage_gc_jobs_status", "status", "id"),
+    )
+
+
+class UploadSession(Base):
+    """A resumable chapter upload, assembled chunk by chunk in a staging file"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)
+    manga_id = Column(Integer, ForeignKey("manga.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    chapter_number = Column(Integer, nullable=False)
+    title = Column(String(255), nullable=True)
+    size = Column(BigInteger, nullable=False)
+    received_bytes = Column(BigInteger, nullable=False, default=0)
+    ranges = Column(Text, nullable=False, default="[]")  # JSON list of received [start, end) ranges
+    path = Column(String(500), nullable=False)
+    status = Column(String(20), nullable=False, default="open")  # open, finalizing
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("idx_upload_sessions_expires_at", "expires_at"),
+    )
+
+
+class ReadingProgress(Base):
+    """Where a user is in a manga: the chapter and page last read"""
+    __tablename__ = "reading_progress"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    manga_id = Column(Integer, ForeignKey("manga.id", ondelete="CASCADE"), nullable=False)
+    chapter_id = Column(Integer, ForeignKey("chapters.id", ondelete="CASCADE"), nullable=False)
+    page = Column(Integer, nullable=False, default=0)  # zero-based page index
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_reading_progress_user_manga", "user_id", "manga_id", unique=True),
+        Index("idx_reading_progress_user_updated", "user_id", "updated_at"),
+    )
+
+
+class PendingProgress(Base):
+    """Latest progress reports not yet written to reading_progress.
+
+    UNLOGGED: shared by every worker but cheap to write, and only lost if
+    Postgres itself crashes.
+    """
+    __tablename__ = "reading_progress_pending"
+
+    user_id = Column(Integer, primary_key=True)
+    manga_id = Column(Integer, primary_key=True)
+    chapter_id = Column(Integer, nullable=False)
+    page = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+
+class ArchiveScanState(Base):
+    """What the storage scanner last saw for an archive, so unchanged archives are not re-verified"""
+    __tablename__ = "archive_scan_state"
+
+    path = Column(String(500), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    mtime_ns = Column(BigInteger, nullable=False)
+    ok = Column(Boolean, nullable=False)
+    error = Column(Text, nullable=True)
+    checked_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class StorageScan(Base):
+    """A run of the storage consistency scanner and its report"""
+    __tablename__ = "storage_scans"
+
+    id = Column(Integer, primary_key=True, index=True)
+    trigger = Column(String(20), nullable=False)  # "admin" or "schedule"
+    repair = Column(String(100), nullable=True)
+    status = Column(String(20), nullable=False, default="running")  # running, done, failed
+    report = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
 
 
 class SiteConfig(Base):
@@ -0,0 +1,124 @@
+"""Rewrite uploaded chapter archives into one canonical layout.
+
+Uploads arrive deflated, in any entry order, with nested folders and junk
+(``__MACOSX``, ``Thumbs.db``, AppleDouble ``._`` files). Ingest rewrites
+each chapter archive so that it holds only its images:
+
+- stored, not deflated: image formats are already compressed, and stored
+  pages are served straight from the mapped archive
+- in reading order, by ``nat_sort_key`` on the full entry name
+- flat, named ``0001.jpg``, ``0002.png``, ... so pages cannot collide
+- with each page's data starting on a PAGE_ALIGN boundary, padded through
+  the local header's extra field as zipalign does
+
+The rewrite runs in the image process pool and writes a temp file next to
+the archive, which is renamed over it only once complete. Archives already
+in this layout are left as they are.
+"""
+import os
+import shutil
+import struct
+import zipfile
+import zlib
+from typing import List
+
+from app.archive import IMAGE_EXTENSIONS, nat_sort_key
+
+PAGE_ALIGN = 4096
+
+# Extra field ID used by Android's zipalign for padding
+ALIGNMENT_EXTRA_ID = 0xD935
+EXTRA_HEADER = struct.Struct("<2H")
+# Fixed part of a local file header, and its ZIP64 extra field
+LOCAL_HEADER_SIZE = 30
+ZIP64_EXTRA_SIZE = 20
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def is_junk(name: str) -> bool:
+    """Entries that are not pages: folders, non-images and macOS metadata"""
+    parts = name.split("/")
+    basename = parts[-1]
+    return (
+        not basename
+        or "__MACOSX" in parts
+        or basename.startswith("._")
+        or os.path.splitext(basename)[1].lower() not in IMAGE_EXTENSIONS
+    )
+
+
+def page_entries(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """The image entries of an archive, in reading order"""
+    infos = [info for info in zf.infolist() if not is_junk(info.filename)]
+    infos.sort(key=lambda info: nat_sort_key(info.filename))
+    return infos
+
+
+def page_name(index: int, count: int, source_name: str) -> str:
+    """Canonical name of the index-th page (0-based) of a chapter"""
+    ext = os.path.splitext(source_name)[1].lower()
+    width = max(4, len(str(count)))
+    return f"{index + 1:0{width}d}{ext}"
+
+
+def alignment_extra(header_offset: int, name: str, zip64: bool) -> bytes:
+    """Extra field padding a local header so the entry's data starts on a PAGE_ALIGN boundary"""
+    data_offset = header_offset + LOCAL_HEADER_SIZE + len(name.encode("utf-8")) + EXTRA_HEADER.size
+    if zip64:
+        data_offset += ZIP64_EXTRA_SIZE
+    padding = -data_offset % PAGE_ALIGN
+    return EXTRA_HEADER.pack(ALIGNMENT_EXTRA_ID, padding) + b"\0" * padding
+
+
+def is_normalized(zf: zipfile.ZipFile, path: str) -> bool:
+    """Whether an archive already has the canonical layout"""
+    infos = zf.infolist()
+    if infos != page_entries(zf):
+        return False
+    for index, info in enumerate(infos):
+        if info.compress_type != zipfile.ZIP_STORED or info.filename != page_name(index, len(infos), info.filename):
+            return False
+    # Data offsets are only known from the local headers
+    with open(path, "rb") as f:
+        for info in infos:
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<2H", f.read(4))
+            if (info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length) % PAGE_ALIGN:
+                return False
+    return True
+
+
+def normalize_archive(path: str) -> bool:
+    """Rewrite a chapter archive in place into the canonical layout. Runs in the image process pool.
+
+    Returns False when the archive was already canonical. Raises
+    zipfile.BadZipFile when it cannot be read, leaving it untouched.
+    """
+    tmp_path = f"{path}.normalize-{os.getpid()}"
+    try:
+        with zipfile.ZipFile(path, "r") as src:
+            if is_normalized(src, path):
+                return False
+            infos = page_entries(src)
+            with open(tmp_path, "wb") as f, zipfile.ZipFile(f, "w", zipfile.ZIP_STORED) as dst:
+                for index, info in enumerate(infos):
+                    name = page_name(index, len(infos), info.filename)
+                    zinfo = zipfile.ZipInfo(name, date_time=info.date_time)
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                    zinfo.external_attr = 0o644 << 16
+                    zinfo.file_size = info.file_size
+                    zip64 = info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+                    zinfo.extra = alignment_extra(f.tell(), name, zip64)
+                    with src.open(info) as r, dst.open(zinfo, "w", force_zip64=zip64) as w:
+                        shutil.copyfileobj(r, w, COPY_BUFFER_SIZE)
+                    # The padding is only needed in the local header, keep the central directory compact
+                    zinfo.extra = b""
+        os.replace(tmp_path, path)
+        return True
+    except (zlib.error, EOFError, NotImplementedError, RuntimeError) as e:
+        # Corrupt, encrypted or unsupported entries; reported as a bad archive
+        raise zipfile.BadZipFile(str(e))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,113 @@
+"""In-memory cache of hot page bytes.
+
+When a popular chapter is released, hundreds of readers ask for its first
+pages within seconds. Each worker process keeps recently read pages in an
+LRU cache bounded by PAGE_CACHE_BYTES, so a hot page is read from storage
+once and then served from memory, without another trip through the
+archive index, the mapping or the object store.
+
+Keys name immutable content: an archive's identity (inode, size and mtime,
+or its object store key) plus the entry name, or a page blob's hash. A
+re-uploaded chapter therefore gets new keys, and its old pages simply age
+out. Concurrent misses for the same key are coalesced: one request reads
+the page, the others wait for its result.
+
+Pages larger than PAGE_CACHE_MAX_ENTRY_BYTES are not kept, so one huge
+spread cannot flush the cache.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Union
+
+from app.config import settings
+
+PageData = Union[bytes, memoryview]
+
+
+class PageCache:
+    def __init__(self, max_bytes: int = None, max_entry_bytes: int = None):
+        self.max_bytes = max(0, max_bytes if max_bytes is not None else settings.PAGE_CACHE_BYTES)
+        self.max_entry_bytes = min(
+            self.max_bytes,
+            max_entry_bytes if max_entry_bytes is not None else settings.PAGE_CACHE_MAX_ENTRY_BYTES,
+        )
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._pages: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._loading: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, load: Callable[..., PageData], *args) -> PageData:
+        """The page at key, from the cache or from load(*args). Exceptions from load reach every waiting caller."""
+        if not self.max_bytes:
+            return load(*args)
+        with self._lock:
+            data = self._pages.get(key)
+            if data is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return data
+            future = self._loading.get(key)
+            leader = future is None
+            if leader:
+                future = self._loading[key] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            data = load(*args)
+            if len(data) <= self.max_entry_bytes:
+                # Views of a mapped archive are copied out once, here on the disk I/O pool
+                data = bytes(data)
+                self._put(key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def _put(self, key: Hashable, data: bytes) -> None:
+        with self._lock:
+            old = self._pages.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._pages[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._pages),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "max_entry_bytes": self.max_entry_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                # Coalesced requests did not read storage either
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+            }
+
+
+page_cache = PageCache()
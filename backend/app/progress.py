@@ -0,0 +1,139 @@
+"""Write-behind buffer for reading progress.
+
+Page turns are the most frequent request the app sees, so progress reports
+are not written to reading_progress one by one. The latest report per
+(user, manga) is kept in reading_progress_pending, an UNLOGGED table:
+writing it skips the WAL, replication and the indexes of reading_progress,
+and every worker process sees it. A background thread in each worker moves
+everything pending into reading_progress in batched upserts every
+PROGRESS_FLUSH_SECONDS, and once more on shutdown. Reads flush the user's
+own reports first, so a report is visible to the next read whichever
+worker took it. Pending reports are only lost if Postgres itself crashes.
+"""
+import logging
+import threading
+from typing import List, Optional
+
+from sqlalchemy import delete, func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import PendingProgress, ReadingProgress
+
+logger = logging.getLogger(__name__)
+
+# Rows per batch when flushing
+FLUSH_BATCH_SIZE = 1000
+
+
+def upsert_statement(rows):
+    """Insert or update progress rows, never overwriting a newer report"""
+    stmt = insert(ReadingProgress).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[ReadingProgress.user_id, ReadingProgress.manga_id],
+        set_={
+            "chapter_id": stmt.excluded.chapter_id,
+            "page": stmt.excluded.page,
+            "updated_at": stmt.excluded.updated_at,
+        },
+        where=ReadingProgress.updated_at < stmt.excluded.updated_at,
+    )
+
+
+class ProgressBuffer:
+    """Coalesces progress reports in reading_progress_pending and flushes them on a daemon thread"""
+
+    def __init__(self, flush_seconds: float = None):
+        self.flush_seconds = flush_seconds if flush_seconds is not None else settings.PROGRESS_FLUSH_SECONDS
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, db: Session, user_id: int, manga_id: int, chapter_id: int, page: int) -> None:
+        stmt = insert(PendingProgress).values(
+            user_id=user_id, manga_id=manga_id, chapter_id=chapter_id, page=page, updated_at=func.now()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PendingProgress.user_id, PendingProgress.manga_id],
+            set_={"chapter_id": stmt.excluded.chapter_id, "page": stmt.excluded.page, "updated_at": stmt.excluded.updated_at},
+        )
+        # Losing the last report to a crash is fine; don't wait for the commit to reach disk
+        db.execute(text("SET LOCAL synchronous_commit TO OFF"))
+        db.execute(stmt)
+        db.commit()
+
+    def flush(self, user_id: int = None) -> int:
+        """Write pending reports (only this user's, if given). Returns the number written."""
+        written = 0
+        db = SessionLocal()
+        try:
+            while True:
+                rows = self._take(db, user_id)
+                if rows:
+                    self._write(db, rows)
+                db.commit()
+                written += len(rows)
+                if len(rows) < FLUSH_BATCH_SIZE:
+                    return written
+        finally:
+            db.close()
+
+    def _take(self, db: Session, user_id: Optional[int]) -> List[dict]:
+        """Remove a batch of pending reports; they come back if the transaction does not commit"""
+        pending = select(PendingProgress.user_id, PendingProgress.manga_id).limit(FLUSH_BATCH_SIZE)
+        if user_id is None:
+            # Workers flushing on their interval leave each other's batches alone
+            pending = pending.with_for_update(skip_locked=True)
+        else:
+            # Reads wait for a flush in progress, so they see its reports
+            pending = pending.where(PendingProgress.user_id == user_id).with_for_update()
+        taken = db.execute(
+            delete(PendingProgress)
+            .where(tuple_(PendingProgress.user_id, PendingProgress.manga_id).in_(pending))
+            .returning(PendingProgress.user_id, PendingProgress.manga_id, PendingProgress.chapter_id,
+                       PendingProgress.page, PendingProgress.updated_at)
+        )
+        return [dict(row._mapping) for row in taken]
+
+    def _write(self, db: Session, rows: List[dict]):
+        try:
+            with db.begin_nested():
+                db.execute(upsert_statement(rows))
+        except IntegrityError:
+            # A chapter, manga or user was deleted since it was reported:
+            # write row by row and drop the ones that no longer apply
+            for row in rows:
+                try:
+                    with db.begin_nested():
+                        db.execute(upsert_statement([row]))
+                except IntegrityError:
+                    pass
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="progress-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop the flush thread and write whatever is still buffered"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final reading progress flush failed")
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Reading progress flush failed")
+
+
+progress_buffer = ProgressBuffer()
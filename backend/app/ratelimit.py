@@ -0,0 +1,153 @@
+"""Per-client token buckets and admission control for API requests.
+
+Requests are sorted into pools (page images, auth, admin and everything
+else) that are limited independently, so a scraper pulling pages runs out
+of page tokens without locking its owner, or anyone else, out of logging in
+or administering the site. Every request is charged to its IP, and
+requests carrying a valid token to their user as well, so neither rotating
+accounts from one address nor one account from many addresses gets around
+the limits.
+
+Page requests additionally share a cap on how many may be in flight at once
+in this process, keeping room for other routes below uvicorn's
+--limit-concurrency.
+
+State is per process and kept in plain dicts: the middleware runs on the
+event loop, so no locking is needed. With WEB_CONCURRENCY workers a client
+can therefore get up to that many times the configured rate.
+"""
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+
+from app.auth import decode_token
+from app.config import settings
+
+# Credential checks and account creation, limited tightly against guessing
+AUTH_PATHS = {"/api/auth/login", "/api/auth/register", "/api/auth/password"}
+
+# Look for idle buckets to drop at most this often
+EVICT_INTERVAL_SECONDS = 60
+
+
+@dataclass
+class Pool:
+    name: str
+    rate: float  # tokens per second
+    burst: float
+
+    @classmethod
+    def per_minute(cls, name: str, per_minute: int, burst: int) -> "Pool":
+        return cls(name, per_minute / 60.0, float(max(burst, 1)))
+
+
+class TokenBuckets:
+    """Token buckets for one pool, keyed by client.
+
+    A bucket is just (tokens, last refill time). Buckets that have been idle
+    long enough to refill completely are indistinguishable from new ones,
+    so they are dropped to keep memory bounded by the active clients.
+    """
+
+    def __init__(self, pool: Pool):
+        self.pool = pool
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+        self._next_evict = time.monotonic() + EVICT_INTERVAL_SECONDS
+
+    def take(self, keys: List[str], now: float = None) -> float:
+        """Take a token from each key's bucket. Returns 0 if allowed, else the seconds until all have one.
+
+        Nothing is taken unless every bucket has a token.
+        """
+        now = time.monotonic() if now is None else now
+        pool = self.pool
+        refilled = {}
+        for key in keys:
+            tokens, last = self.buckets.get(key, (pool.burst, now))
+            refilled[key] = min(pool.burst, tokens + (now - last) * pool.rate)
+        lowest = min(refilled.values())
+        if lowest >= 1:
+            for key, tokens in refilled.items():
+                self.buckets[key] = (tokens - 1, now)
+            wait = 0.0
+        else:
+            for key, tokens in refilled.items():
+                self.buckets[key] = (tokens, now)
+            wait = (1 - lowest) / pool.rate if pool.rate > 0 else float(EVICT_INTERVAL_SECONDS)
+        if now >= self._next_evict:
+            self.evict(now)
+        return wait
+
+    def evict(self, now: float) -> int:
+        full_after = self.pool.burst / self.pool.rate if self.pool.rate > 0 else float("inf")
+        idle = [key for key, (_, last) in self.buckets.items() if now - last >= full_after]
+        for key in idle:
+            del self.buckets[key]
+        self._next_evict = now + EVICT_INTERVAL_SECONDS
+        return len(idle)
+
+
+def build_pools() -> Dict[str, Pool]:
+    return {
+        "pages": Pool.per_minute("pages", settings.RATE_LIMIT_PAGES_PER_MINUTE, settings.RATE_LIMIT_PAGES_BURST),
+        "auth": Pool.per_minute("auth", settings.RATE_LIMIT_AUTH_PER_MINUTE, settings.RATE_LIMIT_AUTH_BURST),
+        "admin": Pool.per_minute("admin", settings.RATE_LIMIT_ADMIN_PER_MINUTE, settings.RATE_LIMIT_ADMIN_BURST),
+        "default": Pool.per_minute("default", settings.RATE_LIMIT_DEFAULT_PER_MINUTE, settings.RATE_LIMIT_DEFAULT_BURST),
+    }
+
+
+def pool_for(path: str) -> Optional[str]:
+    """The pool a request path is limited by, or None for paths that are not limited"""
+    if not path.startswith("/api/"):
+        return None
+    if path.startswith("/api/chapters/") and ("/pages/" in path or path.endswith(("/sprite", "/download"))):
+        return "pages"
+    if path.startswith("/api/manga/") and ("/cover/" in path or path.endswith("/download")):
+        return "pages"
+    if path in AUTH_PATHS:
+        return "auth"
+    if path.startswith("/api/admin/"):
+        return "admin"
+    return "default"
+
+
+def client_keys(request: Request) -> List[str]:
+    """The client IP, and the user for requests with a valid token.
+
+    Only the token signature is checked, no database lookup. Page images
+    are requested by the browser without an Authorization header, so the
+    token cookie counts too.
+    """
+    # uvicorn runs with --proxy-headers, so behind nginx this is the real client
+    keys = [f"ip:{request.client.host if request.client else 'unknown'}"]
+    token = None
+    authorization = request.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        token = authorization[7:]
+    elif "token" in request.cookies:
+        token = request.cookies["token"]
+    if token:
+        username = decode_token(token)
+        if username:
+            keys.append(f"user:{username}")
+    return keys
+
+
+class RateLimiter:
+    def __init__(self):
+        self.buckets: Dict[str, TokenBuckets] = {name: TokenBuckets(pool) for name, pool in build_pools().items()}
+        self.pages_in_flight = 0
+
+    def check(self, pool: str, keys: List[str]) -> float:
+        """Seconds the client has to wait, 0 when the request may proceed"""
+        return self.buckets[pool].take(keys)
+
+
+def retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+limiter = RateLimiter()
@@ -0,0 +1,228 @@
+"""Resumable chapter uploads.
+
+A client creates an UploadSession for an archive of known size, then sends
+the archive in chunks, each written at its offset into a preallocated
+staging file. Chunks may arrive in any order and in parallel; the session
+records which byte ranges have been received, so after a dropped connection
+the client asks what is missing and carries on. Once every byte is there,
+finalizing hands the staging file to the normal chapter ingest.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from app import ingest
+from app.config import settings
+from app.models import Manga, UploadSession, User
+
+logger = logging.getLogger(__name__)
+
+# Buffer this much of a chunk before writing it out
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Missing ranges listed in a status response
+MISSING_RANGES_SHOWN = 50
+
+
+def session_ttl() -> timedelta:
+    return timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Add the byte range [start, end) to a sorted list of disjoint ranges"""
+    merged = []
+    for r_start, r_end in ranges:
+        if r_end < start or r_start > end:
+            merged.append([r_start, r_end])
+        else:
+            start, end = min(start, r_start), max(end, r_end)
+    merged.append([start, end])
+    merged.sort()
+    return merged
+
+
+def missing_ranges(ranges: List[List[int]], size: int) -> List[List[int]]:
+    missing = []
+    position = 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+def session_status(session: UploadSession) -> dict:
+    ranges = json.loads(session.ranges)
+    return {
+        "id": session.id,
+        "manga_id": session.manga_id,
+        "chapter_number": session.chapter_number,
+        "size": session.size,
+        "received_bytes": session.received_bytes,
+        "missing": missing_ranges(ranges, session.size)[:MISSING_RANGES_SHOWN],
+        "complete": session.received_bytes >= session.size,
+        "status": session.status,
+        "chunk_max_bytes": settings.UPLOAD_CHUNK_MAX_BYTES,
+        "expires_at": session.expires_at,
+    }
+
+
+def create_session(db: Session, manga: Manga, user: User, chapter_number: int, title: str, size: int) -> UploadSession:
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be positive")
+    if size > settings.UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    # Preallocate (sparsely) so chunks can be written at any offset
+    path = ingest.staging_file(".part")
+    os.truncate(path, size)
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        manga_id=manga.id,
+        user_id=user.id,
+        chapter_number=chapter_number,
+        title=title,
+        size=size,
+        received_bytes=0,
+        ranges="[]",
+        path=path,
+        status="open",
+        expires_at=datetime.now(timezone.utc) + session_ttl(),
+    )
+    db.add(session)
+    try:
+        db.commit()
+    except BaseException:
+        ingest.discard(path)
+        raise
+    db.refresh(session)
+    return session
+
+
+def write_at(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def record_chunk(db: Session, session_id: str, start: int, end: int) -> UploadSession:
+    """Mark [start, end) as received. The row lock keeps parallel chunks from losing each other's ranges."""
+    session = db.query(UploadSession).filter(UploadSession.id == session_id).with_for_update().first()
+    if not session:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if session.status != "open":
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+
+    ranges = merge_range(json.loads(session.ranges), start, end)
+    now = datetime.now(timezone.utc)
+    session.ranges = json.dumps(ranges)
+    session.received_bytes = sum(r_end - r_start for r_start, r_end in ranges)
+    session.updated_at = now
+    session.expires_at = now + session_ttl()
+    db.commit()
+    db.refresh(session)
+    return session
+
+
+def begin_finalize(db: Session, session_id: str) -> Tuple[UploadSession, Manga]:
+    """Claim a completely received upload for ingest; chunks arriving from then on are rejected.
+
+    The row lock makes parallel finalize calls for one upload take turns, so only one ingests it.
+    """
+    session = db.query(UploadSession).filter(UploadSession.id == session_id).with_for_update().first()
+    if not session or session.status != "open":
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Upload is already being finalized")
+    if session.received_bytes < session.size:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Upload is incomplete")
+    manga = db.query(Manga).filter(Manga.id == session.manga_id, Manga.is_deleted == False).first()
+    if not manga:
+        remove_session(db, session)
+        raise HTTPException(status_code=404, detail="Manga not found")
+    session.status = "finalizing"
+    db.commit()
+    return session, manga
+
+
+def prepare_upload(db: Session, session: UploadSession) -> ingest.PreparedChapter:
+    """Hand a claimed upload's staging file to ingest.prepare_chapter"""
+    args = (session.manga_id, session.chapter_number, session.title, session.path)
+    # Preparing can take a while; don't hold the connection meanwhile
+    db.rollback()
+    return ingest.prepare_chapter(*args)
+
+
+def reopen_session(db: Session, session: UploadSession) -> None:
+    """Let a session whose ingest failed take chunks and be finalized again"""
+    session.status = "open"
+    db.commit()
+
+
+def recover_session(db: Session, session: UploadSession) -> None:
+    """After a failed ingest: reopen the session if its staged file is still there as received, otherwise drop it"""
+    if os.path.exists(session.path) and os.path.getsize(session.path) == session.size:
+        reopen_session(db, session)
+    else:
+        # Moved into the library or rewritten by normalization: finalizing again would not ingest what was sent
+        remove_session(db, session)
+
+
+def remove_session(db: Session, session: UploadSession) -> None:
+    path = session.path
+    db.delete(session)
+    db.commit()
+    ingest.discard(path)
+
+
+def expire_sessions(db: Session) -> Tuple[int, int]:
+    """Drop expired upload sessions and stale staging files.
+
+    Staging files without a session (left by interrupted uploads or by a
+    manga deleted mid-upload) are removed once they are as old as an
+    expired session would be. Returns (sessions expired, files removed).
+    """
+    now = datetime.now(timezone.utc)
+    expired = db.execute(
+        delete(UploadSession).where(UploadSession.expires_at < now).returning(UploadSession.path)
+    ).scalars().all()
+    db.commit()
+
+    removed = 0
+    for path in expired:
+        if os.path.exists(path):
+            ingest.discard(path)
+            removed += 1
+
+    if os.path.isdir(ingest.STAGING_PATH):
+        in_use = {path for path, in db.query(UploadSession.path)}
+        db.rollback()
+        cutoff = time.time() - session_ttl().total_seconds()
+        with os.scandir(ingest.STAGING_PATH) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False) and entry.path not in in_use \
+                            and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+
+    if expired or removed:
+        logger.info("Expired %d upload sessions, removed %d staging files", len(expired), removed)
+    return len(expired), removed
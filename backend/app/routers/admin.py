@@ -1,15 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Query, Session
+from typing import Optional, Tuple
 
 from app.database import get_db
 from app.models import User
-from app.schemas.user import UserResponse, UserUpdate, UserCreate, AdminPasswordChange
+from app.schemas.user import UserResponse, UserUpdate, UserCreate, AdminPasswordChange, UserListResponse
 from app.auth import get_password_hash
 from app.deps import require_admin
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
+MAX_USERS_LIMIT = 200
+# Below this many rows (by the planner's estimate) totals are counted exactly
+EXACT_COUNT_BELOW = 10000
+
 
 @router.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 def create_user(
@@ -49,14 +54,63 @@ def create_user(
     return db_user
 
 
-@router.get("/users", response_model=List[UserResponse])
+def count_rows(db: Session, query: Query) -> Tuple[int, bool]:
+    """(rows the query returns, whether that is an estimate).
+
+    Large results are estimated by the planner instead of counted, so a
+    page of a big table costs no full scan.
+    """
+    compiled = query.order_by(None).statement.compile(dialect=db.get_bind().dialect)
+    plan = db.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    estimate = int(plan[0]["Plan"]["Plan Rows"])
+    if estimate < EXACT_COUNT_BELOW:
+        return query.order_by(None).count(), False
+    return estimate, True
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@router.get("/users", response_model=UserListResponse)
 def list_users(
+    q: Optional[str] = None,
+    role: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    cursor: Optional[int] = None,
+    limit: int = 50,
     current_user: User = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
-    """List all users (admin only)"""
-    users = db.query(User).all()
-    return users
+    """List users by id, a page at a time (admin only).
+
+    ``q`` matches the start of the username or email, case-insensitively,
+    on their prefix indexes. ``cursor`` is the ``next_cursor`` of the
+    previous page.
+    """
+    query = db.query(User)
+    if q:
+        pattern = escape_like(q.lower()) + "%"
+        query = query.filter(or_(
+            func.lower(User.username).like(pattern, escape="\\"),
+            func.lower(User.email).like(pattern, escape="\\"),
+        ))
+    if role:
+        query = query.filter(User.role == role)
+    if is_active is not None:
+        query = query.filter(User.is_active == is_active)
+    total, total_is_estimate = count_rows(db, query)
+
+    if cursor is not None:
+        query = query.filter(User.id > cursor)
+    limit = min(max(limit, 1), MAX_USERS_LIMIT)
+    users = query.order_by(User.id).limit(limit + 1).all()
+    return {
+        "items": users[:limit],
+        "next_cursor": users[limit - 1].id if len(users) > limit else None,
+        "total": total,
+        "total_is_estimate": total_is_estimate,
+    }
 
 
 @router.put("/users/{user_id}", response_model=UserResponse)
@@ -147,8 +201,8 @@ def get_stats(
     from app.models import Manga, Chapter
 
     total_users = db.query(User).count()
-    total_manga = db.query(Manga).count()
-    published_manga = db.query(Manga).filter(Manga.is_published == True).count()
+    total_manga = db.query(Manga).filter(Manga.is_deleted == False).count()
+    published_manga = db.query(Manga).filter(Manga.is_published == True, Manga.is_deleted == False).count()
     total_chapters = db.query(Chapter).count()
 
     return {
@@ -159,6 +213,116 @@ def get_stats(
     }
 
 
+@router.get("/storage/dedup")
+def get_dedup_stats(
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Get space saved by the content-addressed page store (admin only)"""
+    from app.blobstore import dedup_stats
+
+    return dedup_stats(db)
+
+
+@router.get("/storage/gc")
+def get_gc_progress(
+    limit: int = 50,
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Get progress of background storage reclamation (admin only)"""
+    from app.collector import job_progress
+    from app.models import StorageGcJob
+
+    jobs = db.query(StorageGcJob).order_by(StorageGcJob.id.desc()).limit(min(limit, 500)).all()
+    return [job_progress(job) for job in jobs]
+
+
+@router.get("/cache/pages")
+def get_page_cache_stats(current_user: User = Depends(require_admin)):
+    """Get hit rate and memory use of the hot page cache of the worker process answering (admin only)"""
+    from app.pagecache import page_cache
+
+    return page_cache.stats()
+
+
+def scan_response(scan) -> dict:
+    import json
+
+    return {
+        "id": scan.id,
+        "trigger": scan.trigger,
+        "repair": scan.repair.split(",") if scan.repair else [],
+        "status": scan.status,
+        "error": scan.error,
+        "started_at": scan.started_at,
+        "finished_at": scan.finished_at,
+        "report": json.loads(scan.report) if scan.report else None,
+    }
+
+
+@router.post("/storage/scan", status_code=status.HTTP_202_ACCEPTED)
+def start_storage_scan(
+    repair: str = "",
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Start a storage consistency scan, optionally repairing what it finds (admin only)
+
+    repair is a comma-separated list of: orphans (remove folders no chapter
+    uses), trash (remove leftovers of interrupted uploads), missing (delete
+    chapters whose files are gone).
+    """
+    from app.models import StorageScan
+    from app.scanner import parse_repair, scanner
+
+    try:
+        actions = parse_repair(repair)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    running = db.query(StorageScan).filter(StorageScan.status == "running").first()
+    if running:
+        raise HTTPException(status_code=409, detail=f"Scan {running.id} is already running")
+
+    scan = StorageScan(trigger="admin", repair=",".join(actions), status="running")
+    db.add(scan)
+    db.commit()
+    db.refresh(scan)
+
+    scanner.start(scan.id, actions)
+    return scan_response(scan)
+
+
+@router.get("/storage/scan")
+def get_latest_storage_scan(
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Get the most recent storage scan and its report (admin only)"""
+    from app.models import StorageScan
+
+    scan = db.query(StorageScan).order_by(StorageScan.id.desc()).first()
+    if not scan:
+        raise HTTPException(status_code=404, detail="No storage scan yet")
+    return scan_response(scan)
+
+
+@router.get("/storage/scan/{scan_id}")
+def get_storage_scan(
+    scan_id: int,
+    current_user: User = Depends(require_admin),
+    db: Session = Depends(get_db)
+):
+    """Get a storage scan and its report (admin only)"""
+    from app.models import StorageScan
+
+    scan = db.query(StorageScan).filter(StorageScan.id == scan_id).first()
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return scan_response(scan)
+
+
 # Site Configuration endpoints
 from app.models import SiteConfig
 
@@ -1,130 +1,379 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+from typing import BinaryIO, List, NamedTuple, Optional, Union
+from urllib.parse import quote
 import os
 import zipfile
-import io
 
-from app.database import get_db
-from app.models import Chapter
-import re
+from app import cbz, sprites, storage, tiles
+from app.database import with_read_db
+from app.diskio import disk_io
+from app.models import Chapter, ChapterPage, Manga
+from app.archive import content_type_for, zip_page_refs
+from app.archive_index import archive_index, read_entry
+from app.blobstore import apply_manifest, blob_path
+from app.config import settings
+from app.exploded import pages_dir
+from app.imageinfo import read_image_info
+from app.pagecache import page_cache
+from app.zipmmap import BadArchive
 
 router = APIRouter(prefix="/api/chapters", tags=["chapters"])
 
 STORAGE_PATH = os.getenv("STORAGE_PATH", "/app/storage/manga")
 
+PAGE_CACHE_CONTROL = "public, max-age=300"
 
-def nat_sort_key(s):
-    """Natural sort key - extracts numbers for sorting, falls back to ASCII if no numbers"""
-    # Find all numbers in the string
-    numbers = re.findall(r'\d+', s)
-    if numbers:
-        # Convert to integers for natural sorting
-        # Use a tuple that starts with 0 to prefer files with numbers
-        # Then include all found numbers as integers
-        return (0, tuple(int(n) for n in numbers), s.lower())
-    else:
-        # No numbers found - fallback to ASCII (lexicographic) sorting
-        # Use 1 to put these after files with numbers
-        return (1, (), s.lower())
+# The routes below are coroutines: their database and disk work runs on the
+# dedicated disk I/O pool (app.diskio), never on the shared thread pool.
 
 
-def get_zip_path(chapter: Chapter) -> str:
-    """Get the path to the chapter's ZIP file"""
-    if not chapter.folder_path:
-        return None
-    zip_path = os.path.join(chapter.folder_path, "chapter.zip")
-    if os.path.exists(zip_path):
-        return zip_path
-    return None
+class PageSource(NamedTuple):
+    """A page to send: an open file, a path for nginx to send, or data read from an archive"""
+    file: Optional[BinaryIO] = None
+    path: Optional[str] = None
+    size: int = 0
+    data: Union[bytes, memoryview, None] = None
 
 
-@router.get("/{chapter_id}/pages")
-def get_chapter_pages(chapter_id: int, db: Session = Depends(get_db)):
-    """Get list of pages for a chapter - reads from ZIP file"""
-    chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
+def get_readable_chapter(db: Session, chapter_id: int) -> Chapter:
+    """Look up a chapter readers may access, i.e. one of a published manga"""
+    chapter = db.query(Chapter).join(Manga).filter(
+        Chapter.id == chapter_id,
+        Manga.is_published == True
+    ).first()
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
+    return chapter
 
-    if not chapter.folder_path:
-        raise HTTPException(status_code=404, detail="Chapter path not set")
 
-    # Check for ZIP file
+def use_accel_redirect(request: Request) -> bool:
+    """Whether nginx is in front and sends files itself; it advertises this with X-Sendfile-Type"""
+    return bool(settings.ACCEL_REDIRECT_PREFIX) and request.headers.get("x-sendfile-type") == "X-Accel-Redirect"
+
+
+def open_file(path: str, not_found: str) -> PageSource:
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=not_found)
+    return PageSource(file=f, size=os.fstat(f.fileno()).st_size)
+
+
+def page_file_response(source: PageSource, media_type: str, headers: dict) -> Response:
+    """Send a page stored as a plain file.
+
+    Behind nginx the file is handed off with X-Accel-Redirect so it is sent
+    with sendfile. Anything else gets the file streamed in chunks read on
+    the disk I/O pool.
+    """
+    if source.path is not None:
+        relative_path = os.path.relpath(source.path, settings.STORAGE_PATH)
+        headers["X-Accel-Redirect"] = f"{settings.ACCEL_REDIRECT_PREFIX}/{quote(relative_path)}"
+        return Response(media_type=media_type, headers=headers)
+    headers["Content-Length"] = str(source.size)
+    return StreamingResponse(disk_io.iter_file(source.file), media_type=media_type, headers=headers)
+
+
+def get_zip_path(chapter: Chapter, fetch: bool = True) -> Optional[str]:
+    """Get the path to the chapter's ZIP file, fetching it from the object store if needed"""
+    return storage.archive_path(chapter, fetch)
+
+
+@router.get("/{chapter_id}/neighbors")
+async def get_chapter_neighbors(chapter_id: int):
+    """Previous and next chapter of the same manga, in one query on the (manga_id, chapter_number) index"""
+    return await disk_io.run(with_read_db, load_neighbors, chapter_id)
+
+
+def load_neighbors(db: Session, chapter_id: int) -> dict:
+    other = aliased(Chapter)
+
+    def neighbor(before: bool):
+        order = other.chapter_number.desc() if before else other.chapter_number.asc()
+        condition = other.chapter_number < Chapter.chapter_number if before else other.chapter_number > Chapter.chapter_number
+        return (
+            select(other.id)
+            .where(other.manga_id == Chapter.manga_id, condition)
+            .order_by(order)
+            .limit(1)
+            .correlate(Chapter)
+            .scalar_subquery()
+        )
+
+    row = db.query(
+        Chapter.id, Chapter.manga_id, Chapter.chapter_number,
+        neighbor(True).label("prev_id"), neighbor(False).label("next_id")
+    ).join(Manga).filter(
+        Chapter.id == chapter_id,
+        Manga.is_published == True
+    ).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    return {
+        "chapter_id": row.id,
+        "manga_id": row.manga_id,
+        "chapter_number": row.chapter_number,
+        "prev_id": row.prev_id,
+        "next_id": row.next_id,
+    }
+
+
+def page_path(chapter: Chapter, page: ChapterPage) -> str:
+    """Path of a page stored as a plain file (blob or exploded storage)"""
+    if chapter.storage_mode == "blob":
+        return blob_path(page.blob_sha256)
+    return os.path.join(pages_dir(chapter.folder_path, chapter.archive_version), page.filename)
+
+
+def ensure_manifest(db: Session, chapter: Chapter) -> List[ChapterPage]:
+    """The chapter's page manifest, completed for chapters ingested before it carried page dimensions"""
+    pages = chapter.pages
+    if chapter.storage_mode in ("blob", "exploded"):
+        if pages and all(page.format is None for page in pages):
+            for page in pages:
+                try:
+                    with open(page_path(chapter, page), "rb") as f:
+                        info = read_image_info(f)
+                except FileNotFoundError:
+                    continue
+                if info:
+                    page.format, page.width, page.height = info
+            db.commit()
+        return pages
+
+    if pages:
+        return pages
+    # A ZIP chapter from before manifests: build it once from the archive
     zip_path = get_zip_path(chapter)
-    if not zip_path or not os.path.exists(zip_path):
+    if not zip_path:
         raise HTTPException(status_code=404, detail="Chapter ZIP file not found")
-
-    # Get image files from ZIP
-    valid_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-    pages = []
-    
     try:
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            for filename in zf.namelist():
-                ext = os.path.splitext(filename)[1].lower()
-                if ext in valid_extensions and not filename.endswith('/'):
-                    pages.append(os.path.basename(filename))
+        refs = zip_page_refs(zip_path)
     except zipfile.BadZipFile:
         raise HTTPException(status_code=400, detail="Invalid ZIP file")
+    db.query(Chapter).filter(Chapter.id == chapter.id).with_for_update().first()
+    if not db.query(ChapterPage.id).filter(ChapterPage.chapter_id == chapter.id).first():
+        apply_manifest(db, chapter.id, refs)
+    db.commit()
+    db.refresh(chapter)
+    return chapter.pages
 
-    # Sort naturally
-    pages.sort(key=nat_sort_key)
-
-    # Return URLs with just filenames
-    page_urls = [f"/api/chapters/{chapter_id}/pages/{filename}" for filename in pages]
 
-    return {"pages": page_urls, "total": len(pages)}
+@router.get("/{chapter_id}/pages")
+async def get_chapter_pages(chapter_id: int):
+    """Get list of pages for a chapter, with each page's dimensions, format, size and place in the sprite sheet"""
+    return await disk_io.run(with_read_db, load_pages, chapter_id)
 
 
-@router.get("/{chapter_id}/pages/{filename}")
-def get_page(chapter_id: int, filename: str, db: Session = Depends(get_db)):
-    """Get a specific page image - reads from ZIP file"""
-    chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
-    if not chapter:
-        raise HTTPException(status_code=404, detail="Chapter not found")
+def load_pages(db: Session, chapter_id: int) -> dict:
+    chapter = get_readable_chapter(db, chapter_id)
 
-    if not chapter.folder_path:
+    if not chapter.folder_path and chapter.storage_mode != "blob":
         raise HTTPException(status_code=404, detail="Chapter path not set")
 
+    pages = ensure_manifest(db, chapter)
+    sprite, thumbs = sprites.sprite_info(chapter)
+    manifest = []
+    for index, page in enumerate(pages):
+        manifest.append({
+            "url": f"/api/chapters/{chapter_id}/pages/{page.filename}",
+            "filename": page.filename,
+            "width": page.width,
+            "height": page.height,
+            "format": page.format,
+            "size": page.size,
+            "thumb": thumbs[index] if index < len(thumbs) else None,
+            "tiles": tiles.tile_list(chapter, page),
+        })
+
+    return {
+        "pages": [page["url"] for page in manifest],
+        "total": len(manifest),
+        "manifest": manifest,
+        "sprite": sprite,
+    }
+
+
+@router.get("/{chapter_id}/download")
+async def download_chapter(chapter_id: int, request: Request):
+    """The chapter as a CBZ, streamed from the stored pages. Supports Range, so downloads can resume."""
+    plan, filename = await disk_io.run(with_read_db, cbz.plan_chapter, chapter_id)
+    return cbz.download_response(plan, filename, request)
+
+
+@router.get("/{chapter_id}/sprite")
+async def get_sprite(chapter_id: int, v: Optional[str] = None):
+    """Thumbnails of every page of the chapter in one image; where each page is comes with the page list"""
+    source, version = await disk_io.run(with_read_db, open_sprite, chapter_id)
+    if v == version:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=300"
+    return page_file_response(source, "image/webp", {"Cache-Control": cache_control})
+
+
+def open_sprite(db: Session, chapter_id: int):
+    chapter = get_readable_chapter(db, chapter_id)
+    if not chapter.sprite_version:
+        raise HTTPException(status_code=404, detail="Sprite not found")
+    path = storage.generated_path(sprites.sprite_path(chapter.manga_id, chapter.id), chapter.sprite_version)
+    if not path:
+        raise HTTPException(status_code=404, detail="Sprite not found")
+    return open_file(path, "Sprite not found"), chapter.sprite_version
+
+
+@router.get("/{chapter_id}/pages/{filename}/tiles/{tile}")
+async def get_tile(chapter_id: int, filename: str, tile: int, request: Request, v: Optional[str] = None):
+    """One tile of a long-strip page, as listed with the page list"""
+    filename = os.path.basename(filename)
+    source, version = await disk_io.run(with_read_db, open_tile, chapter_id, filename, tile, v, use_accel_redirect(request))
+    if v == version:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=300"
+    return page_file_response(source, "image/webp", {"Cache-Control": cache_control})
+
+
+def open_tile(db: Session, chapter_id: int, filename: str, tile: int, requested: Optional[str], accel_redirect: bool):
+    chapter = get_readable_chapter(db, chapter_id)
+    if not chapter.folder_path or tile < 0:
+        raise HTTPException(status_code=404, detail="Tile not found")
+    current = chapter.archive_version
+    if requested and requested.isdigit() and current and 0 < int(requested) < current:
+        # From a page list read before a re-upload: its tiles stay until the old version is collected
+        version = requested
+        path = tiles.tile_path(chapter.folder_path, int(requested), filename, None, tile)
+    else:
+        page = db.query(ChapterPage).filter(
+            ChapterPage.chapter_id == chapter_id,
+            ChapterPage.filename == filename
+        ).order_by(ChapterPage.page_index).first()
+        if not page or not page.tile_count or tile >= page.tile_count:
+            raise HTTPException(status_code=404, detail="Tile not found")
+        version = tiles.tile_version(current, page)
+        path = tiles.tile_path(chapter.folder_path, current, page.filename, page.page_index, tile)
+    path = storage.generated_path(path, version)
+    if not path:
+        raise HTTPException(status_code=404, detail="Tile not found")
+    if accel_redirect and not storage.backend.remote:
+        return PageSource(path=path), version
+    return open_file(path, "Tile not found"), version
+
+
+@router.get("/{chapter_id}/pages/{filename}")
+async def get_page(chapter_id: int, filename: str, request: Request):
+    """Get a specific page image, streamed in chunks"""
     # Security: prevent directory traversal
     filename = os.path.basename(filename)
+    source = await disk_io.run(with_read_db, load_page, chapter_id, filename, use_accel_redirect(request))
+
+    media_type = content_type_for(filename)
+    # Page URLs carry no version and a re-upload keeps them, so browsers only keep pages briefly
+    headers = {"Content-Disposition": f"inline; filename={filename}", "Cache-Control": PAGE_CACHE_CONTROL}
+    if source.data is None:
+        return page_file_response(source, media_type, headers)
+    headers["Content-Length"] = str(len(source.data))
+    return StreamingResponse(disk_io.iter_data(source.data), media_type=media_type, headers=headers)
+
+
+def load_page(db: Session, chapter_id: int, filename: str, accel_redirect: bool) -> PageSource:
+    """Find a page and open or read it. Runs on the disk I/O pool."""
+    chapter = get_readable_chapter(db, chapter_id)
+
+    if chapter.storage_mode in ("blob", "exploded"):
+        page = db.query(ChapterPage).filter(
+            ChapterPage.chapter_id == chapter_id,
+            ChapterPage.filename == filename
+        ).order_by(ChapterPage.page_index).first()
+        if not page:
+            raise HTTPException(status_code=404, detail="Page not found")
+        path = page_path(chapter, page)
+        if accel_redirect:
+            return PageSource(path=path)
+        if page.size is not None and page.size > page_cache.max_entry_bytes:
+            return open_file(path, "Page not found")
+        if chapter.storage_mode == "blob":
+            key = ("blob", page.blob_sha256)
+        else:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail="Page not found")
+            key = ("file", path, st.st_ino, st.st_mtime_ns)
+        return PageSource(data=page_cache.get_or_load(key, read_page_file, path))
+
+    if not chapter.folder_path:
+        raise HTTPException(status_code=404, detail="Chapter path not set")
 
     # Find the ZIP file
-    zip_path = get_zip_path(chapter)
+    zip_path = get_zip_path(chapter, fetch=not chapter.archive_key)
+    if not zip_path and chapter.archive_key and storage.backend.remote:
+        return load_remote_page(db, chapter, filename)
     if not zip_path:
         raise HTTPException(status_code=404, detail="Chapter ZIP file not found")
 
-    # Find the file inside ZIP
+    return PageSource(data=read_zip_page(chapter.id, zip_path, filename))
+
+
+def read_page_file(path: str) -> bytes:
     try:
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            # Try to find the file with exact name or similar
-            target_file = None
-            for name in zf.namelist():
-                if os.path.basename(name) == filename:
-                    target_file = name
-                    break
-            
-            if not target_file:
-                raise HTTPException(status_code=404, detail="Page not found")
-            
-            # Read the file from ZIP
-            file_data = zf.read(target_file)
-            
-            # Determine content type
-            ext = os.path.splitext(filename)[1].lower()
-            content_type = {
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.gif': 'image/gif',
-                '.webp': 'image/webp'
-            }.get(ext, 'application/octet-stream')
-            
-            return StreamingResponse(
-                io.BytesIO(file_data),
-                media_type=content_type,
-                headers={"Content-Disposition": f"inline; filename={filename}"}
-            )
-    except zipfile.BadZipFile:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Page not found")
+
+
+def read_zip_page(chapter_id: int, zip_path: str, filename: str):
+    """A page of a chapter archive, through the hot page cache"""
+    try:
+        st = os.stat(zip_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Chapter ZIP file not found")
+    key = ("zip", zip_path, st.st_ino, st.st_size, st.st_mtime_ns, filename)
+    return page_cache.get_or_load(key, read_archive_entry, chapter_id, zip_path, filename)
+
+
+def read_archive_entry(chapter_id: int, zip_path: str, filename: str):
+    """A page found through the shared archive index and read from this process's mapping; a view of it when stored"""
+    try:
+        entry = archive_index.lookup(chapter_id, zip_path, filename)
+        if not entry:
+            raise HTTPException(status_code=404, detail="Page not found")
+        return read_entry(zip_path, entry)
+    except BadArchive:
         raise HTTPException(status_code=400, detail="Invalid ZIP file")
+
+
+def load_remote_page(db: Session, chapter: Chapter, filename: str) -> PageSource:
+    """Read a page of an archive this node has not cached yet.
+
+    Stored pages are fetched on their own with a ranged GET at the offset
+    recorded at ingest, while the whole archive is fetched into the cache
+    in the background for the pages after it.
+    """
+    page = db.query(ChapterPage).filter(
+        ChapterPage.chapter_id == chapter.id,
+        ChapterPage.filename == filename
+    ).order_by(ChapterPage.page_index).first()
+    if not page:
+        raise HTTPException(status_code=404, detail="Page not found")
+    if page.data_offset is None:
+        # Deflated or from before offsets were recorded: only readable from the whole archive
+        zip_path = get_zip_path(chapter)
+        if not zip_path:
+            raise HTTPException(status_code=404, detail="Chapter ZIP file not found")
+        return PageSource(data=read_zip_page(chapter.id, zip_path, filename))
+
+    storage.cache.prefetch(chapter.archive_key)
+    key = ("object", chapter.archive_key, filename)
+    return PageSource(data=page_cache.get_or_load(key, read_object_range, chapter.archive_key, page.data_offset, page.size))
+
+
+def read_object_range(key: str, start: int, length: int) -> bytes:
+    try:
+        return storage.backend.read_range(key, start, length)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Chapter ZIP file not found")
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional, Tuple
+import base64
+import hashlib
+import json
+
+from app.database import get_read_db
+from app.models import Chapter, Manga
+
+router = APIRouter(prefix="/api/feed", tags=["feed"])
+
+MAX_LIMIT = 100
+
+
+def encode_cursor(created_at: datetime, chapter_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{chapter_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(created_at, chapter id) of the last item of the previous page"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, chapter_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(chapter_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/updates")
+def get_updates(
+    request: Request,
+    since: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: Session = Depends(get_read_db)
+):
+    """Chapters of published manga, newest first, with their manga.
+
+    One query walking idx_chapters_created. ``since`` keeps only chapters
+    added after it; ``cursor`` is the ``next_cursor`` of the previous page.
+    Responses carry an ETag, so polling clients mostly get 304.
+    """
+    query = db.query(
+        Chapter.id, Chapter.chapter_number, Chapter.title, Chapter.created_at,
+        Manga.id.label("manga_id"), Manga.title.label("manga_title"), Manga.cover_image, Manga.cover_version,
+    ).join(Manga, Manga.id == Chapter.manga_id).filter(
+        Manga.is_published == True,
+        Manga.is_deleted == False
+    )
+    if since is not None:
+        query = query.filter(Chapter.created_at > since)
+    if cursor:
+        query = query.filter(tuple_(Chapter.created_at, Chapter.id) < tuple_(*decode_cursor(cursor)))
+    limit = min(max(limit, 1), MAX_LIMIT)
+    rows = query.order_by(Chapter.created_at.desc(), Chapter.id.desc()).limit(limit + 1).all()
+
+    items = [
+        {
+            "chapter_id": row.id,
+            "chapter_number": row.chapter_number,
+            "chapter_title": row.title,
+            "created_at": row.created_at,
+            "manga_id": row.manga_id,
+            "title": row.manga_title,
+            "cover_image": row.cover_image,
+            "cover_version": row.cover_version,
+        }
+        for row in rows[:limit]
+    ]
+    last = rows[limit - 1] if len(rows) > limit else None
+    body = jsonable_encoder({
+        "items": items,
+        "next_cursor": encode_cursor(last.created_at, last.id) if last else None,
+    })
+
+    etag = '"' + hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=body, headers=headers)
@@ -1,18 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.sql import func
+from typing import List, Optional
 import os
 import zipfile
-import shutil
 import re
-from pathlib import Path
 
-from app.database import get_db
+from app.database import get_db, get_read_db, with_read_db
 from app.models import Manga, Chapter, User
 from app.schemas.manga import MangaCreate, MangaUpdate, MangaResponse, MangaListResponse, ChapterResponse
 from app.deps import get_current_active_user, require_admin
-from app.auth import get_password_hash
+from app import cbz, collector, covers, ingest, storage
+from app.diskio import disk_io
 
 router = APIRouter(prefix="/api/manga", tags=["manga"])
 
@@ -25,16 +26,18 @@ def nat_sort_key(s):
 
 
 @router.get("", response_model=List[MangaListResponse])
-def list_manga(db: Session = Depends(get_db)):
-    """List all published manga"""
-    manga = db.query(Manga).filter(Manga.is_published == True).all()
+def list_manga(db: Session = Depends(get_read_db)):
+    """List all published manga, the most recently updated first"""
+    manga = db.query(Manga).filter(Manga.is_published == True, Manga.is_deleted == False).order_by(
+        Manga.last_chapter_at.desc().nullslast(), Manga.id.desc()
+    ).all()
     return manga
 
 
 @router.get("/{manga_id}", response_model=MangaResponse)
-def get_manga(manga_id: int, db: Session = Depends(get_db)):
+def get_manga(manga_id: int, db: Session = Depends(get_read_db)):
     """Get manga details with chapters"""
-    manga = db.query(Manga).filter(Manga.id == manga_id).first()
+    manga = db.query(Manga).filter(Manga.id == manga_id, Manga.is_deleted == False).first()
     if not manga:
         raise HTTPException(status_code=404, detail="Manga not found")
     if not manga.is_published:
@@ -42,6 +45,27 @@ def get_manga(manga_id: int, db: Session = Depends(get_db)):
     return manga
 
 
+@router.get("/{manga_id}/cover/{size}")
+def get_cover(manga_id: int, size: str, v: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """Generated cover thumbnail (small, medium or large). Cached for good when requested with its version."""
+    if size not in covers.COVER_SIZES:
+        raise HTTPException(status_code=404, detail="Cover not found")
+    manga = db.query(Manga.cover_version).filter(
+        Manga.id == manga_id, Manga.is_published == True, Manga.is_deleted == False
+    ).first()
+    if not manga or not manga.cover_version:
+        raise HTTPException(status_code=404, detail="Cover not found")
+    path = storage.generated_path(covers.cover_path(manga_id, size, manga.cover_version), manga.cover_version) \
+        or storage.generated_path(covers.legacy_cover_path(manga_id, size), manga.cover_version)
+    if not path:
+        raise HTTPException(status_code=404, detail="Cover not found")
+    if v == manga.cover_version:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=300"
+    return FileResponse(path, media_type="image/webp", headers={"Cache-Control": cache_control})
+
+
 @router.post("", response_model=MangaResponse, dependencies=[Depends(require_admin)])
 def create_manga(
     manga: MangaCreate,
@@ -73,7 +97,7 @@ def update_manga(
     db: Session = Depends(get_db)
 ):
     """Update manga details"""
-    manga = db.query(Manga).filter(Manga.id == manga_id).first()
+    manga = db.query(Manga).filter(Manga.id == manga_id, Manga.is_deleted == False).first()
     if not manga:
         raise HTTPException(status_code=404, detail="Manga not found")
 
@@ -82,34 +106,69 @@ def update_manga(
         raise HTTPException(status_code=403, detail="Not authorized")
 
     update_data = manga_update.model_dump(exclude_unset=True)
+    cover_changed = "cover_image" in update_data and update_data["cover_image"] != manga.cover_image
+    if cover_changed:
+        # Until the new cover's thumbnails are made, cards show it as it is
+        manga.cover_version = None
     for key, value in update_data.items():
         setattr(manga, key, value)
 
     db.commit()
     db.refresh(manga)
+    if cover_changed:
+        covers.schedule(manga.id)
     return manga
 
 
-@router.delete("/{manga_id}", dependencies=[Depends(require_admin)])
+@router.delete("/{manga_id}", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_admin)])
 def delete_manga(
     manga_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Delete manga (admin only)"""
-    manga = db.query(Manga).filter(Manga.id == manga_id).first()
+    """Delete manga (admin only) - hidden immediately, storage is reclaimed in the background"""
+    manga = db.query(Manga).filter(Manga.id == manga_id, Manga.is_deleted == False).first()
     if not manga:
         raise HTTPException(status_code=404, detail="Manga not found")
 
-    # Delete manga folder
-    manga_folder = os.path.join(STORAGE_PATH, str(manga.id))
-    if os.path.exists(manga_folder):
-        shutil.rmtree(manga_folder)
-
-    db.delete(manga)
+    manga.is_deleted = True
+    manga.is_published = False
+    manga.deleted_at = func.now()
+    job = collector.enqueue_manga(db, manga)
     db.commit()
 
-    return {"message": "Manga deleted successfully"}
+    return {"message": "Manga scheduled for deletion", "job_id": job.id}
+
+
+def chapter_number_from_name(name: str):
+    """Chapter number in a folder or archive name, e.g. "Vol.2 Ch.015" -> 15"""
+    parts = nat_sort_key(name)
+    numbers = [(i, part) for i, part in enumerate(parts) if isinstance(part, int)]
+    if not numbers:
+        return None
+
+    def label(i):
+        return parts[i - 1].rstrip(" ._-#").lower() if i > 0 else ""
+
+    for i, number in numbers:
+        if label(i).endswith(("chapter", "chap", "ch", "c", "第")):
+            return number
+    for i, number in numbers:
+        if not label(i).endswith(("volume", "vol", "v", "巻")):
+            return number
+    return numbers[0][1]
+
+
+def get_uploadable_manga(db: Session, manga_id: int, current_user: User) -> Manga:
+    """Look up a manga the current user may upload chapters to"""
+    manga = db.query(Manga).filter(Manga.id == manga_id, Manga.is_deleted == False).first()
+    if not manga:
+        raise HTTPException(status_code=404, detail="Manga not found")
+
+    # Check permission
+    if manga.uploaded_by != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return manga
 
 
 @router.post("/{manga_id}/upload", response_model=ChapterResponse)
@@ -121,78 +180,103 @@ async def upload_chapter(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Upload a chapter as ZIP file (admin only) - ZIP is stored, not extracted"""
-    # Check manga exists
-    manga = db.query(Manga).filter(Manga.id == manga_id).first()
-    if not manga:
-        raise HTTPException(status_code=404, detail="Manga not found")
-
-    # Check permission
-    if manga.uploaded_by != current_user.id and current_user.role != "admin":
-        raise HTTPException(status_code=403, detail="Not authorized")
-
-    # Create chapter folder
-    chapter_folder = os.path.join(STORAGE_PATH, str(manga_id), str(chapter_number))
-    os.makedirs(chapter_folder, exist_ok=True)
-
-    # Save ZIP file directly (NOT extracted)
-    zip_filename = "chapter.zip"
-    zip_path = os.path.join(chapter_folder, zip_filename)
-    
-    # Remove old zip if exists
-    if os.path.exists(zip_path):
-        os.remove(zip_path)
-    
-    with open(zip_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
-
-    # Validate it's a valid ZIP
-    try:
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            # Just verify it's valid, don't extract
-            namelist = zf.namelist()
-            if not namelist:
-                raise HTTPException(status_code=400, detail="ZIP file is empty")
-    except zipfile.BadZipFile:
-        os.remove(zip_path)
-        raise HTTPException(status_code=400, detail="Invalid ZIP file")
-
-    # Create chapter in database
-    chapter = Chapter(
-        manga_id=manga_id,
-        chapter_number=chapter_number,
-        title=chapter_title,
-        folder_path=chapter_folder
-    )
+    """Upload a chapter as ZIP file (admin only) - stored as-is unless STORAGE_MODE says otherwise"""
+    manga = await run_in_threadpool(get_uploadable_manga, db, manga_id, current_user)
+    # Hand the connection back while the file work runs, it can take a while
+    await run_in_threadpool(db.rollback)
+
+    staged = await run_in_threadpool(ingest.save_upload, file.file)
+    prepared = await run_in_threadpool(ingest.prepare_chapter, manga_id, chapter_number, chapter_title, staged)
+    chapter, = await run_in_threadpool(ingest.commit_chapters, db, manga, [prepared])
+    return chapter
 
-    # Check if chapter already exists
-    existing = db.query(Chapter).filter(
-        Chapter.manga_id == manga_id,
-        Chapter.chapter_number == chapter_number
-    ).first()
 
-    if existing:
-        # Update existing chapter
-        existing.title = chapter_title
-        existing.folder_path = chapter_folder
-        db.commit()
-        db.refresh(existing)
-        return existing
+@router.post("/{manga_id}/upload/bulk")
+async def upload_chapters_bulk(
+    manga_id: int,
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Upload many chapters at once (admin only)
 
-    db.add(chapter)
-    db.commit()
-    db.refresh(chapter)
+    The ZIP holds one folder of images or one ZIP/CBZ archive per chapter;
+    chapter numbers are read from their names. Chapters are prepared in
+    parallel and recorded in a single transaction.
+    """
+    manga = await run_in_threadpool(get_uploadable_manga, db, manga_id, current_user)
+    # Hand the connection back while the chapters are prepared, which can take minutes
+    await run_in_threadpool(db.rollback)
 
-    return chapter
+    outer_path = await run_in_threadpool(ingest.save_upload, file.file)
+    try:
+        try:
+            items = await run_in_threadpool(ingest.list_bulk_items, outer_path)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Invalid ZIP file")
+        if not items:
+            raise HTTPException(status_code=400, detail="No chapters found in ZIP file")
+        items.sort(key=lambda item: nat_sort_key(item.name))
+
+        results = []
+        numbered = []
+        claimed = set()
+        for item in items:
+            number = chapter_number_from_name(item.name)
+            result = {"name": item.name, "chapter_number": number, "status": "error", "chapter_id": None, "detail": None}
+            results.append(result)
+            if number is None:
+                result["detail"] = "No chapter number in name"
+            elif number in claimed:
+                result["detail"] = f"Duplicate chapter number {number}"
+            else:
+                claimed.add(number)
+                numbered.append((number, item))
+
+        outcomes = await run_in_threadpool(ingest.prepare_bulk, manga_id, outer_path, numbered)
+    finally:
+        ingest.discard(outer_path)
+
+    by_number = {result["chapter_number"]: result for result in results if result["detail"] is None}
+    prepared = []
+    for (number, _), outcome in zip(numbered, outcomes):
+        if isinstance(outcome, HTTPException):
+            by_number[number]["detail"] = outcome.detail
+        elif isinstance(outcome, Exception):
+            by_number[number]["detail"] = str(outcome) or outcome.__class__.__name__
+        else:
+            prepared.append(outcome)
+
+    if prepared:
+        chapters = await run_in_threadpool(ingest.commit_chapters, db, manga, prepared)
+        for chapter in chapters:
+            by_number[chapter.chapter_number].update(status="ok", chapter_id=chapter.id)
+
+    return {
+        "uploaded": len(prepared),
+        "failed": len(results) - len(prepared),
+        "chapters": results,
+    }
 
 
 @router.get("/{manga_id}/chapters", response_model=List[ChapterResponse])
-def get_chapters(manga_id: int, db: Session = Depends(get_db)):
+def get_chapters(manga_id: int, db: Session = Depends(get_read_db)):
     """Get all chapters for a manga"""
-    manga = db.query(Manga).filter(Manga.id == manga_id).first()
+    manga = db.query(Manga).filter(Manga.id == manga_id, Manga.is_deleted == False).first()
     if not manga:
         raise HTTPException(status_code=404, detail="Manga not found")
 
     chapters = db.query(Chapter).filter(Chapter.manga_id == manga_id).order_by(Chapter.chapter_number).all()
     return chapters
+
+
+@router.get("/{manga_id}/download")
+async def download_manga(
+    manga_id: int,
+    request: Request,
+    first: Optional[int] = Query(None, alias="from"),
+    last: Optional[int] = Query(None, alias="to"),
+):
+    """Chapters from..to (all by default) as one CBZ with a folder per chapter, streamed. Supports Range."""
+    plan, filename = await disk_io.run(with_read_db, cbz.plan_volume, manga_id, first, last)
+    return cbz.download_response(plan, filename, request)
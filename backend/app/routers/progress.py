@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.orm import Session
+from typing import Dict
+
+from app.database import get_db
+from app.models import Chapter, Manga, ReadingProgress, User
+from app.schemas.manga import ProgressUpdate
+from app.deps import get_current_active_user
+from app.progress import progress_buffer
+
+router = APIRouter(prefix="/api/progress", tags=["progress"])
+
+# chapter_id -> manga_id of readable chapters, so a page turn costs no query
+CHAPTER_CACHE_SIZE = 10000
+chapter_manga: Dict[int, int] = {}
+
+
+def readable_chapter_manga(db: Session, chapter_id: int) -> int:
+    manga_id = chapter_manga.get(chapter_id)
+    if manga_id is None:
+        row = db.query(Chapter.manga_id).join(Manga).filter(
+            Chapter.id == chapter_id,
+            Manga.is_published == True,
+            Manga.is_deleted == False
+        ).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Chapter not found")
+        if len(chapter_manga) >= CHAPTER_CACHE_SIZE:
+            chapter_manga.clear()
+        manga_id = chapter_manga[chapter_id] = row.manga_id
+    return manga_id
+
+
+@router.put("", status_code=status.HTTP_204_NO_CONTENT)
+def report_progress(
+    update: ProgressUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Record the page being read. Buffered, written to reading_progress within a few seconds."""
+    if update.page < 0:
+        raise HTTPException(status_code=400, detail="Invalid page")
+    manga_id = readable_chapter_manga(db, update.chapter_id)
+    progress_buffer.record(db, current_user.id, manga_id, update.chapter_id, update.page)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get("/continue")
+def continue_reading(
+    limit: int = 12,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Manga the current user has been reading, most recent first"""
+    progress_buffer.flush(current_user.id)
+    rows = (
+        db.query(ReadingProgress, Manga, Chapter)
+        .join(Manga, Manga.id == ReadingProgress.manga_id)
+        .join(Chapter, Chapter.id == ReadingProgress.chapter_id)
+        .filter(
+            ReadingProgress.user_id == current_user.id,
+            Manga.is_published == True,
+            Manga.is_deleted == False
+        )
+        .order_by(ReadingProgress.updated_at.desc())
+        .limit(min(max(limit, 1), 50))
+        .all()
+    )
+    return [
+        {
+            "manga_id": manga.id,
+            "title": manga.title,
+            "cover_image": manga.cover_image,
+            "cover_version": manga.cover_version,
+            "chapter_id": chapter.id,
+            "chapter_number": chapter.chapter_number,
+            "chapter_title": chapter.title,
+            "page": progress.page,
+            "updated_at": progress.updated_at,
+        }
+        for progress, manga, chapter in rows
+    ]
+
+
+@router.get("/{manga_id}")
+def get_progress(
+    manga_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """The current user's progress in a manga"""
+    progress_buffer.flush(current_user.id)
+    progress = db.query(ReadingProgress).filter(
+        ReadingProgress.user_id == current_user.id,
+        ReadingProgress.manga_id == manga_id
+    ).first()
+    if not progress:
+        raise HTTPException(status_code=404, detail="No progress for this manga")
+    return {"manga_id": manga_id, "chapter_id": progress.chapter_id, "page": progress.page, "updated_at": progress.updated_at}
@@ -0,0 +1,144 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+import os
+
+from app.database import get_db
+from app.models import UploadSession, User
+from app.schemas.manga import ChapterResponse, UploadSessionCreate
+from app.deps import get_current_active_user
+from app.config import settings
+from app.routers.manga import get_uploadable_manga
+from app import ingest, resumable
+
+router = APIRouter(prefix="/api/uploads", tags=["uploads"])
+
+
+def get_own_session(db: Session, upload_id: str, current_user: User) -> UploadSession:
+    session = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if session.user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return session
+
+
+@router.post("", status_code=status.HTTP_201_CREATED)
+def create_upload(
+    upload: UploadSessionCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Start a resumable chapter upload of `size` bytes"""
+    manga = get_uploadable_manga(db, upload.manga_id, current_user)
+    session = resumable.create_session(
+        db, manga, current_user, upload.chapter_number, upload.chapter_title, upload.size
+    )
+    return resumable.session_status(session)
+
+
+@router.get("/{upload_id}")
+def get_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Received bytes and missing ranges, to resume an interrupted upload"""
+    return resumable.session_status(get_own_session(db, upload_id, current_user))
+
+
+@router.put("/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Write the request body at `offset`. Chunks may be sent in any order and in parallel."""
+    session = await run_in_threadpool(get_own_session, db, upload_id, current_user)
+    if session.status != "open":
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+
+    try:
+        length = int(request.headers["content-length"])
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=411, detail="Content-Length required")
+    if length > settings.UPLOAD_CHUNK_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Chunk too large")
+    if offset < 0 or offset + length > session.size:
+        raise HTTPException(status_code=416, detail="Chunk outside the upload")
+    path = session.path
+    # Don't hold a pooled connection idle while the chunk arrives
+    await run_in_threadpool(db.rollback)
+
+    try:
+        fd = os.open(path, os.O_WRONLY)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    position = offset
+    buffer = bytearray()
+    try:
+        async for data in request.stream():
+            if position + len(buffer) + len(data) > offset + length:
+                raise HTTPException(status_code=400, detail="Body longer than Content-Length")
+            buffer += data
+            if len(buffer) >= resumable.WRITE_BUFFER_SIZE:
+                await run_in_threadpool(resumable.write_at, fd, bytes(buffer), position)
+                position += len(buffer)
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(resumable.write_at, fd, bytes(buffer), position)
+            position += len(buffer)
+    finally:
+        os.close(fd)
+
+    if position != offset + length:
+        raise HTTPException(status_code=400, detail="Body shorter than Content-Length")
+    session = await run_in_threadpool(resumable.record_chunk, db, upload_id, offset, position)
+    return resumable.session_status(session)
+
+
+@router.post("/{upload_id}/finalize", response_model=ChapterResponse)
+async def finalize_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Ingest a completely received upload as a chapter"""
+    await run_in_threadpool(get_own_session, db, upload_id, current_user)
+    session, manga = await run_in_threadpool(resumable.begin_finalize, db, upload_id)
+
+    try:
+        prepared = await run_in_threadpool(resumable.prepare_upload, db, session)
+    except HTTPException:
+        # The staged file was rejected and removed
+        await run_in_threadpool(resumable.remove_session, db, session)
+        raise
+    except Exception:
+        await run_in_threadpool(resumable.recover_session, db, session)
+        raise
+
+    try:
+        chapter, = await run_in_threadpool(ingest.commit_chapters, db, manga, [prepared])
+    except Exception:
+        # The staged file is in the library now, so the upload cannot be finalized again
+        await run_in_threadpool(ingest.abandon_chapters, db, manga, [prepared])
+        await run_in_threadpool(resumable.remove_session, db, session)
+        raise
+    await run_in_threadpool(resumable.remove_session, db, session)
+    return chapter
+
+
+@router.delete("/{upload_id}")
+def abort_upload(
+    upload_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Abort an upload and remove what was received"""
+    session = get_own_session(db, upload_id, current_user)
+    if session.status != "open":
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+    resumable.remove_session(db, session)
+    return {"message": "Upload aborted"}
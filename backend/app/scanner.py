@@ -0,0 +1,422 @@
+"""Storage consistency scanner.
+
+Walks STORAGE_PATH with a thread pool and cross-checks what it finds against
+the chapters table, loaded in bulk. It reports chapters whose files are
+missing, folders no chapter points at, stray trash left by interrupted
+uploads or old archive versions nothing is collecting, corrupt archives and blobs missing from the page store. Archive
+integrity is verified incrementally: an archive whose size and mtime match
+the last scan is not read again.
+
+Scans are started by an admin or on a schedule; a Postgres advisory lock
+keeps several backend processes from scanning at the same time.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app import collector, storage
+from app.blobstore import blob_path
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.exploded import PAGES_DIR
+from app.models import ArchiveScanState, Chapter, Manga, PageBlob, StorageGcJob, StorageScan
+
+logger = logging.getLogger(__name__)
+
+REPAIR_ACTIONS = {"orphans", "trash", "missing"}
+
+# Issues of each kind listed in a report; the counts are always complete
+ISSUE_LIMIT = 1000
+
+# Rows per bulk statement when writing scan state
+BULK_SIZE = 1000
+
+SCAN_LOCK_KEY = 720029
+
+# Folders changed this recently are never reported as orphans: an upload
+# creates its chapter's folder before the chapter row is committed
+ORPHAN_GRACE_SECONDS = 3600
+
+
+@dataclass
+class ChapterDir:
+    path: str
+    mtime: float
+    # (size, mtime_ns) of each archive version, 0 for a chapter.zip from before versioning
+    archives: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+    # Version of each pages or tiles folder generated from an archive version, by path
+    generated: Dict[str, int] = field(default_factory=dict)
+    # Files in the pages folder of each version
+    page_files: Dict[int, int] = field(default_factory=dict)
+    trash: List[str] = field(default_factory=list)
+
+
+@dataclass
+class MangaDir:
+    path: str
+    name: str
+    mtime: float
+    chapters: List[ChapterDir] = field(default_factory=list)
+    trash: List[str] = field(default_factory=list)
+
+
+def parse_repair(value: Optional[str]) -> List[str]:
+    """Parse a comma-separated list of repair actions"""
+    actions = [action.strip() for action in (value or "").split(",") if action.strip()]
+    unknown = set(actions) - REPAIR_ACTIONS
+    if unknown:
+        raise ValueError(f"Unknown repair actions: {', '.join(sorted(unknown))}")
+    return actions
+
+
+def scan_chapter_dir(path: str) -> ChapterDir:
+    result = ChapterDir(path=path, mtime=os.stat(path).st_mtime)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            version = storage.entry_version(entry.name)
+            if entry.name.startswith(".trash-"):
+                result.trash.append(entry.path)
+            elif version is None:
+                continue
+            elif entry.name.endswith(".zip"):
+                stat = entry.stat()
+                result.archives[version] = (stat.st_size, stat.st_mtime_ns)
+            elif entry.is_dir(follow_symlinks=False):
+                result.generated[entry.path] = version
+                if entry.name.startswith(PAGES_DIR):
+                    with os.scandir(entry.path) as pages:
+                        result.page_files[version] = sum(1 for _ in pages)
+    return result
+
+
+def scan_manga_dir(path: str) -> MangaDir:
+    result = MangaDir(path=path, name=os.path.basename(path), mtime=os.stat(path).st_mtime)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith(".trash-"):
+                result.trash.append(entry.path)
+            elif not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False):
+                result.chapters.append(scan_chapter_dir(entry.path))
+    return result
+
+
+def verify_archive(path: str) -> Optional[str]:
+    """Read every entry of an archive and check its CRC. Returns an error or None."""
+    try:
+        with zipfile.ZipFile(path, "r") as zf:
+            bad = zf.testzip()
+        return f"CRC mismatch in {bad}" if bad else None
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+
+
+class Report:
+    def __init__(self):
+        self.stats: Dict[str, int] = {}
+        self.issues: Dict[str, List[dict]] = {
+            "missing_archive": [],
+            "orphan_folder": [],
+            "corrupt_archive": [],
+            "stray_trash": [],
+            "missing_blob": [],
+        }
+        self.repaired: Dict[str, int] = {}
+
+    def add(self, kind: str, **item):
+        self.issues[kind].append(item)
+
+    def as_dict(self) -> dict:
+        return {
+            **self.stats,
+            "issues": {
+                kind: {"count": len(items), "items": items[:ISSUE_LIMIT]}
+                for kind, items in self.issues.items()
+            },
+            "repaired": self.repaired,
+        }
+
+
+class StorageScanner:
+    def __init__(self, workers: int = None):
+        self.workers = workers or settings.SCAN_WORKERS
+
+    def run(self, trigger: str, repair: List[str], scan_id: Optional[int] = None) -> Optional[int]:
+        """Run a scan and store its report. Returns the scan id, or None if another scan holds the lock."""
+        with engine.connect() as lock_conn:
+            locked = lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": SCAN_LOCK_KEY}).scalar()
+            lock_conn.commit()
+            db = SessionLocal()
+            try:
+                if scan_id is None:
+                    if not locked or not self._schedule_due(db):
+                        return None
+                    scan = StorageScan(trigger=trigger, repair=",".join(repair), status="running")
+                    db.add(scan)
+                    db.commit()
+                else:
+                    scan = db.get(StorageScan, scan_id)
+                    if not locked:
+                        scan.status = "failed"
+                        scan.error = "Another scan is running"
+                        scan.finished_at = datetime.now(timezone.utc)
+                        db.commit()
+                        return scan.id
+
+                try:
+                    report = self._scan(db, repair)
+                    scan.report = json.dumps(report.as_dict())
+                    scan.status = "done"
+                except Exception as e:
+                    db.rollback()
+                    logger.exception("Storage scan %s failed", scan.id)
+                    scan.status = "failed"
+                    scan.error = str(e)[:1000]
+                scan.finished_at = datetime.now(timezone.utc)
+                db.commit()
+                return scan.id
+            finally:
+                db.close()
+                if locked:
+                    lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCAN_LOCK_KEY})
+                    lock_conn.commit()
+
+    def start(self, scan_id: int, repair: List[str]) -> threading.Thread:
+        """Run an admin-triggered scan on a background thread"""
+        thread = threading.Thread(
+            target=self.run, args=("admin", repair, scan_id), name=f"storage-scan-{scan_id}", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _schedule_due(self, db: Session) -> bool:
+        last = db.query(func.max(StorageScan.started_at)).filter(StorageScan.trigger == "schedule").scalar()
+        interval = timedelta(hours=settings.SCAN_INTERVAL_HOURS)
+        return last is None or last < datetime.now(timezone.utc) - interval
+
+    def _scan(self, db: Session, repair: List[str]) -> Report:
+        report = Report()
+        root = settings.STORAGE_PATH
+        orphan_cutoff = time.time() - ORPHAN_GRACE_SECONDS
+
+        # Database side, in bulk
+        chapters = {}
+        unplaced = []
+        rows = (
+            db.query(Chapter.id, Chapter.manga_id, Chapter.folder_path, Chapter.storage_mode,
+                     Chapter.archive_key, Chapter.archive_version)
+            .join(Manga)
+            .filter(Manga.is_deleted == False)
+            .yield_per(5000)
+        )
+        for row in rows:
+            if row.folder_path:
+                chapters[os.path.normpath(row.folder_path)] = row
+            else:
+                unplaced.append(row)
+        manga_deleted = dict(db.query(Manga.id, Manga.is_deleted).all())
+        queued = {
+            path for path, in db.query(StorageGcJob.path).filter(StorageGcJob.status.in_(["pending", "running"]))
+        }
+        previous = {
+            row.path: row
+            for row in db.query(
+                ArchiveScanState.path, ArchiveScanState.size, ArchiveScanState.mtime_ns,
+                ArchiveScanState.ok, ArchiveScanState.error
+            ).yield_per(5000)
+        }
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="storage-scan") as pool:
+            # Storage side, one task per manga folder
+            manga_paths = []
+            root_trash = []
+            if os.path.isdir(root):
+                with os.scandir(root) as entries:
+                    for entry in entries:
+                        if entry.name.startswith(".trash-"):
+                            root_trash.append(entry.path)
+                        elif not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False):
+                            manga_paths.append(entry.path)
+            manga_dirs = list(pool.map(scan_manga_dir, manga_paths))
+
+            for path in root_trash:
+                if path not in queued:
+                    report.add("stray_trash", path=path)
+
+            seen: Set[int] = set()
+            to_verify: List[Tuple[str, Tuple[int, int], object]] = []
+            current: Set[str] = set()
+            for manga_dir in manga_dirs:
+                manga_id = int(manga_dir.name) if manga_dir.name.isdigit() else None
+                if manga_id not in manga_deleted:
+                    if manga_dir.path not in queued and manga_dir.mtime < orphan_cutoff:
+                        report.add("orphan_folder", path=manga_dir.path)
+                    continue
+                if manga_deleted[manga_id]:
+                    # Being reclaimed by the storage collector
+                    continue
+                chapter_dirs = manga_dir.chapters
+                trash = list(manga_dir.trash)
+                for chapter_dir in chapter_dirs:
+                    trash.extend(chapter_dir.trash)
+                    row = chapters.get(os.path.normpath(chapter_dir.path))
+                    if row is None:
+                        if chapter_dir.path not in queued and chapter_dir.mtime < orphan_cutoff:
+                            report.add("orphan_folder", path=chapter_dir.path)
+                        continue
+                    seen.add(row.id)
+                    version = row.archive_version or 0
+                    for old_version in chapter_dir.archives:
+                        # Newer versions may belong to an upload not committed yet
+                        old_path = os.path.join(chapter_dir.path, storage.archive_name(old_version))
+                        if old_version < version:
+                            trash.append(old_path)
+                    trash.extend(path for path, old_version in chapter_dir.generated.items() if old_version < version)
+                    if row.storage_mode == "exploded":
+                        if not chapter_dir.page_files.get(version):
+                            report.add("missing_archive", chapter_id=row.id, manga_id=row.manga_id, path=chapter_dir.path)
+                    elif row.storage_mode != "blob" and not row.archive_key:
+                        archive = chapter_dir.archives.get(version)
+                        if archive is None:
+                            report.add("missing_archive", chapter_id=row.id, manga_id=row.manga_id, path=chapter_dir.path)
+                            continue
+                        zip_path = os.path.join(chapter_dir.path, storage.archive_name(version))
+                        current.add(zip_path)
+                        last = previous.get(zip_path)
+                        if last is not None and (last.size, last.mtime_ns) == archive:
+                            if not last.ok:
+                                report.add("corrupt_archive", chapter_id=row.id, manga_id=row.manga_id,
+                                           path=zip_path, error=last.error)
+                        else:
+                            to_verify.append((zip_path, archive, row))
+                for path in trash:
+                    if path not in queued:
+                        report.add("stray_trash", path=path)
+
+            for row in list(chapters.values()) + unplaced:
+                # Archives in the object store are not on this disk to check
+                if row.id not in seen and row.storage_mode != "blob" and not row.archive_key:
+                    report.add("missing_archive", chapter_id=row.id, manga_id=row.manga_id, path=row.folder_path)
+
+            # Verify new and changed archives
+            errors = list(pool.map(verify_archive, [path for path, _, _ in to_verify]))
+            checked_at = datetime.now(timezone.utc)
+            states = []
+            for (path, (size, mtime_ns), row), error in zip(to_verify, errors):
+                states.append({"path": path, "size": size, "mtime_ns": mtime_ns, "ok": error is None,
+                               "error": error, "checked_at": checked_at})
+                if error:
+                    report.add("corrupt_archive", chapter_id=row.id, manga_id=row.manga_id, path=path, error=error)
+            for start in range(0, len(states), BULK_SIZE):
+                stmt = insert(ArchiveScanState).values(states[start:start + BULK_SIZE])
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=[ArchiveScanState.path],
+                    set_={column: stmt.excluded[column] for column in ("size", "mtime_ns", "ok", "error", "checked_at")},
+                ))
+            gone = [path for path in previous if path not in current]
+            for start in range(0, len(gone), BULK_SIZE):
+                db.query(ArchiveScanState).filter(
+                    ArchiveScanState.path.in_(gone[start:start + BULK_SIZE])
+                ).delete(synchronize_session=False)
+            db.commit()
+
+            # Blobs still referenced by some chapter must exist
+            hashes = [sha256 for sha256, in db.query(PageBlob.sha256).filter(PageBlob.ref_count > 0).yield_per(10000)]
+            present = pool.map(lambda sha256: os.path.exists(blob_path(sha256)), hashes, chunksize=256)
+            for sha256, exists in zip(hashes, present):
+                if not exists:
+                    report.add("missing_blob", sha256=sha256)
+
+        report.stats = {
+            "chapters_checked": len(chapters) + len(unplaced),
+            "folders_scanned": len(manga_dirs) + sum(len(manga_dir.chapters) for manga_dir in manga_dirs),
+            "archives_verified": len(to_verify),
+            "archives_unchanged": len(current) - len(to_verify),
+            "blobs_checked": len(hashes),
+        }
+        self._repair(db, report, repair)
+        return report
+
+    def _still_orphaned(self, db: Session, path: str) -> bool:
+        """Check an orphan again right before removing it: the walk ran against rows loaded earlier"""
+        try:
+            if os.stat(path).st_mtime >= time.time() - ORPHAN_GRACE_SECONDS:
+                return False
+        except FileNotFoundError:
+            return False
+        if os.path.dirname(os.path.normpath(path)) == os.path.normpath(settings.STORAGE_PATH):
+            name = os.path.basename(path)
+            return not (name.isdigit() and db.query(Manga.id).filter(Manga.id == int(name)).first())
+        return not db.query(Chapter.id).filter(
+            Chapter.folder_path.in_([path, os.path.normpath(path)])
+        ).first()
+
+    def _repair(self, db: Session, report: Report, repair: List[str]):
+        if "orphans" in repair:
+            repaired = 0
+            for item in report.issues["orphan_folder"]:
+                if self._still_orphaned(db, item["path"]):
+                    collector.enqueue_path(db, item["path"])
+                    repaired += 1
+            report.repaired["orphans"] = repaired
+        if "trash" in repair:
+            for item in report.issues["stray_trash"]:
+                collector.enqueue_path(db, item["path"])
+            report.repaired["trash"] = len(report.issues["stray_trash"])
+        if "missing" in repair:
+            chapter_ids = [item["chapter_id"] for item in report.issues["missing_archive"]]
+            for item in report.issues["missing_archive"]:
+                # Whatever is left of the chapter's folder goes with it
+                if item["path"] and os.path.isdir(item["path"]):
+                    collector.enqueue_path(db, item["path"])
+            for start in range(0, len(chapter_ids), BULK_SIZE):
+                db.query(Chapter).filter(
+                    Chapter.id.in_(chapter_ids[start:start + BULK_SIZE])
+                ).delete(synchronize_session=False)
+            report.repaired["missing"] = len(chapter_ids)
+        db.commit()
+
+
+class ScanScheduler:
+    """Starts a scheduled scan whenever SCAN_INTERVAL_HOURS have passed since the last one"""
+
+    CHECK_SECONDS = 300
+
+    def __init__(self, scanner: StorageScanner):
+        self.scanner = scanner
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if settings.SCAN_INTERVAL_HOURS <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-scan-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        repair = parse_repair(settings.SCAN_REPAIR)
+        while not self._stop.wait(self.CHECK_SECONDS):
+            try:
+                self.scanner.run("schedule", repair)
+            except Exception:
+                logger.exception("Scheduled storage scan failed")
+
+
+scanner = StorageScanner()
+scheduler = ScanScheduler(scanner)
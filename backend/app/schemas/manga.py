@@ -36,8 +36,10 @@ class MangaUpdate(BaseModel):
 class MangaResponse(MangaBase):
     id: int
     cover_image: Optional[str]
+    cover_version: Optional[str] = None
     is_published: bool
     created_at: datetime
+    last_chapter_at: Optional[datetime] = None
     uploaded_by: Optional[int] = None
     chapters: List[ChapterResponse] = []
 
@@ -50,7 +52,21 @@ class MangaListResponse(BaseModel):
     title: str
     description: Optional[str]
     cover_image: Optional[str]
+    cover_version: Optional[str] = None
     created_at: datetime
+    last_chapter_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
+
+
+class UploadSessionCreate(BaseModel):
+    manga_id: int
+    chapter_number: int
+    chapter_title: Optional[str] = None
+    size: int
+
+
+class ProgressUpdate(BaseModel):
+    chapter_id: int
+    page: int = 0
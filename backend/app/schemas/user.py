@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -23,6 +23,14 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UserListResponse(BaseModel):
+    items: List[UserResponse]
+    next_cursor: Optional[int] = None
+    # Estimated from the planner's statistics on large tables
+    total: int
+    total_is_estimate: bool
+
+
 class UserUpdate(BaseModel):
     username: Optional[str] = None
     email: Optional[EmailStr] = None
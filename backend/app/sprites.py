@@ -0,0 +1,201 @@
+"""Per-chapter sprite sheets of page thumbnails for the reader's page strip.
+
+Every page of a chapter is scaled to THUMB_HEIGHT and packed in rows into
+one WebP image under STORAGE_PATH/<manga>/.sprites/, so previewing a
+whole chapter costs a single small request. Where each page landed is
+stored on the chapter as a JSON list of [x, y, width, height] and returned
+with the page list.
+
+Sheets are rendered in the image process pool as background jobs: after
+ingest for new and replaced chapters, and on first request for chapters
+from before sprites. A sheet is versioned by a hash of the chapter's
+pages, and a re-upload clears the version, so a stale sheet is never
+served for a changed chapter.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from app import storage, workers
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Chapter
+
+THUMB_HEIGHT = 120
+# Double-page spreads and odd strips are clipped to this width
+THUMB_MAX_WIDTH = 240
+SHEET_MAX_WIDTH = 2048
+SPRITE_QUALITY = 60
+
+# ("zip", zip_path, [filenames]) or ("files", [paths]), in page order
+Source = Tuple
+
+# Chapters with a sheet queued or rendering in this process
+_pending: Set[int] = set()
+_pending_lock = threading.Lock()
+
+
+def sprite_path(manga_id: int, chapter_id: int) -> str:
+    return os.path.join(settings.STORAGE_PATH, str(manga_id), ".sprites", f"{chapter_id}.webp")
+
+
+def sprite_url(chapter_id: int, version: str) -> str:
+    return f"/api/chapters/{chapter_id}/sprite?v={version}"
+
+
+def pack(sizes: List[Tuple[int, int]]) -> Tuple[List[List[int]], int, int]:
+    """Lay thumbnails out in rows. Returns ([x, y, w, h] per thumbnail, sheet width, sheet height)."""
+    boxes = []
+    x = y = width = 0
+    for w, h in sizes:
+        if x and x + w > SHEET_MAX_WIDTH:
+            x, y = 0, y + THUMB_HEIGHT
+        boxes.append([x, y, w, h])
+        x += w
+        width = max(width, x)
+    height = y + THUMB_HEIGHT if boxes else 0
+    return boxes, width, height
+
+
+def _page_images(source: Source):
+    """Yield the bytes of each page, or None for a page that cannot be read"""
+    if source[0] == "zip":
+        from app.zipmmap import BadArchive, MappedArchive
+
+        _, zip_path, filenames = source
+        archive = MappedArchive(zip_path)
+        entries = {}
+        for entry in archive.entries():
+            entries.setdefault(os.path.basename(entry.name), entry)
+        for filename in filenames:
+            entry = entries.get(filename)
+            try:
+                yield archive.read(entry.header_offset, entry.compress_size, entry.compress_type) if entry else None
+            except BadArchive:
+                yield None
+    else:
+        for path in source[1]:
+            try:
+                with open(path, "rb") as f:
+                    yield f.read()
+            except OSError:
+                yield None
+
+
+def render_sprite(source: Source, out_path: str) -> List[List[int]]:
+    """Render a chapter's sprite sheet. Runs in the image process pool; returns the boxes, in page order."""
+    from PIL import Image, ImageOps
+
+    thumbnails = []
+    for data in _page_images(source):
+        thumbnail = None
+        if data is not None:
+            try:
+                with Image.open(io.BytesIO(data)) as image:
+                    # JPEGs decode straight at a reduced scale
+                    image.draft("RGB", (THUMB_MAX_WIDTH * 4, THUMB_HEIGHT * 4))
+                    image = ImageOps.exif_transpose(image).convert("RGB")
+                width = max(1, min(THUMB_MAX_WIDTH, round(image.width * THUMB_HEIGHT / image.height)))
+                thumbnail = ImageOps.fit(image, (width, THUMB_HEIGHT), Image.LANCZOS)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                thumbnail = None
+        thumbnails.append(thumbnail)
+
+    # Unreadable pages get a blank slot of the usual page shape
+    blank = (THUMB_HEIGHT * 2 // 3, THUMB_HEIGHT)
+    boxes, width, height = pack([t.size if t else blank for t in thumbnails])
+    sheet = Image.new("RGB", (max(width, 1), max(height, 1)), (32, 32, 32))
+    for thumbnail, (x, y, _, _) in zip(thumbnails, boxes):
+        if thumbnail:
+            sheet.paste(thumbnail, (x, y))
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.tmp-{os.getpid()}"
+    sheet.save(tmp_path, "WEBP", quality=SPRITE_QUALITY, method=4)
+    os.replace(tmp_path, out_path)
+    return boxes
+
+
+def chapter_source(chapter: Chapter) -> Tuple[Source, str]:
+    """Where the renderer reads the chapter's pages, and the version of that content"""
+    from app.routers.chapter import page_path
+
+    pages = chapter.pages
+    digest = hashlib.sha256()
+    for page in pages:
+        digest.update(f"{page.page_index}:{page.filename}:{page.size}:{page.blob_sha256 or ''}\n".encode("utf-8"))
+    if chapter.storage_mode in ("blob", "exploded"):
+        source = ("files", [page_path(chapter, page) for page in pages])
+    else:
+        zip_path = storage.archive_path(chapter)
+        if zip_path is None:
+            raise FileNotFoundError(f"Archive of chapter {chapter.id} not found")
+        if chapter.archive_key:
+            # Keys in the object store are never reused
+            digest.update(chapter.archive_key.encode("utf-8"))
+        else:
+            st = os.stat(zip_path)
+            digest.update(f"{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+        source = ("zip", zip_path, [page.filename for page in pages])
+    return source, digest.hexdigest()[:12]
+
+
+def generate(chapter_id: int) -> Optional[str]:
+    """Render a chapter's sprite sheet if it has none. Returns the new version, if any."""
+    try:
+        db = SessionLocal()
+        try:
+            chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
+            if not chapter or chapter.sprite_version or not chapter.pages:
+                return None
+            source, version = chapter_source(chapter)
+            path = sprite_path(chapter.manga_id, chapter.id)
+            db.rollback()
+
+            boxes = workers.submit(render_sprite, source, path).result()
+            storage.publish(path, version)
+
+            # Only if the chapter's pages are still the ones rendered
+            chapter = db.query(Chapter).filter(Chapter.id == chapter_id).with_for_update().first()
+            if not chapter or chapter_source(chapter)[1] != version:
+                db.rollback()
+                return None
+            chapter.sprite_version = version
+            chapter.sprite_map = json.dumps(boxes, separators=(",", ":"))
+            db.commit()
+            return version
+        finally:
+            db.close()
+    finally:
+        with _pending_lock:
+            _pending.discard(chapter_id)
+
+
+def schedule(chapter_ids) -> None:
+    """Render the chapters' sprite sheets in the background, once per chapter at a time"""
+    for chapter_id in chapter_ids:
+        with _pending_lock:
+            if chapter_id in _pending:
+                continue
+            _pending.add(chapter_id)
+        workers.schedule(generate, chapter_id)
+
+
+def sprite_info(chapter: Chapter) -> Tuple[Optional[Dict], List[Optional[Dict]]]:
+    """The sheet and each page's box in it, for the page list. Schedules a missing sheet."""
+    if not chapter.sprite_version or not chapter.sprite_map:
+        schedule([chapter.id])
+        return None, []
+    boxes = json.loads(chapter.sprite_map)
+    width = max((x + w for x, _, w, _ in boxes), default=0)
+    height = max((y + h for _, y, _, h in boxes), default=0)
+    sheet = {
+        "url": sprite_url(chapter.id, chapter.sprite_version),
+        "width": width,
+        "height": height,
+        "thumb_height": THUMB_HEIGHT,
+    }
+    return sheet, [{"x": x, "y": y, "w": w, "h": h} for x, y, w, h in boxes]
@@ -0,0 +1,411 @@
+"""Where the library is kept: local disk or an S3-compatible object store.
+
+With STORAGE_BACKEND=local (the default) everything stays under
+STORAGE_PATH as it always has. With STORAGE_BACKEND=s3, chapter archives
+and generated images live in a bucket, so several backend nodes can serve
+one library. Each node keeps:
+
+- a read-through cache of whole archives under STORAGE_CACHE_PATH, bounded
+  to STORAGE_CACHE_BYTES and evicted least recently used first. A cached
+  archive is read like a local one: mapped, and indexed by the shared
+  archive index.
+- ranged GETs for single pages of archives it has not cached yet, using
+  the data offset recorded for each page at ingest. The archive is fetched
+  into the cache in the background for the pages after it.
+
+Object keys are never rewritten. A re-uploaded chapter gets a new archive
+key and a regenerated image a new versioned key, so a node's cached copy
+can never go stale. On local disk a re-upload likewise gets a new
+chapter.v<N>.zip next to the old one. Replaced archives are deleted by the
+storage collector once readers of the old version have had time to finish.
+
+Keys are paths relative to STORAGE_PATH, so a local file and its object
+have the same name. The object store needs boto3, which is only imported
+when STORAGE_BACKEND=s3.
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# A cached file's access time is refreshed at most this often, in seconds
+TOUCH_INTERVAL = 60
+# The cache folder is walked again this often, in seconds, to count what other processes added
+RESCAN_INTERVAL = 600
+# Threads fetching archives into the cache in the background
+PREFETCH_WORKERS = 2
+
+# What one upload leaves in a chapter folder: its archive and the page and tile folders made from it
+VERSIONED_ENTRY = re.compile(r"(?:chapter\.v(\d+)\.zip|(?:pages|tiles)\.v(\d+))")
+UNVERSIONED_ENTRIES = ("chapter.zip", "pages", "tiles")
+
+
+class LocalStorage:
+    """The library on local disk, under STORAGE_PATH. Files are already where they belong."""
+    remote = False
+
+    def path(self, key: str) -> str:
+        return os.path.join(settings.STORAGE_PATH, key)
+
+    def upload(self, key: str, path: str) -> None:
+        pass
+
+    def download(self, key: str, path: str) -> None:
+        shutil.copyfile(self.path(key), path)
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        with open(self.path(key), "rb") as f:
+            data = os.pread(f.fileno(), length, start)
+        if len(data) != length:
+            raise OSError(f"{key} is shorter than expected")
+        return data
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix: str) -> int:
+        # Folders on disk are removed by the storage collector itself
+        return 0
+
+    def check(self) -> None:
+        pass
+
+
+class S3Storage:
+    """An S3-compatible bucket (AWS, MinIO, ...), configured with the S3_* settings"""
+    remote = True
+
+    def __init__(self):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install boto3)")
+        if not settings.S3_BUCKET:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        self.bucket = settings.S3_BUCKET
+        self.prefix = settings.S3_PREFIX.strip("/") + "/" if settings.S3_PREFIX.strip("/") else ""
+        # Clients are thread-safe; one per process, with a connection for every disk I/O thread
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL or None,
+            region_name=settings.S3_REGION or None,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None,
+            config=Config(max_pool_connections=max(10, settings.DISK_IO_WORKERS),
+                          retries={"max_attempts": 3, "mode": "standard"}),
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _not_found(self, error: Exception) -> bool:
+        code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def upload(self, key: str, path: str) -> None:
+        # Large archives go up as a multipart upload
+        self.client.upload_file(path, self.bucket, self._key(key))
+
+    def download(self, key: str, path: str) -> None:
+        try:
+            self.client.download_file(self.bucket, self._key(key), path)
+        except Exception as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self._key(key), Range=f"bytes={start}-{start + length - 1}"
+            )
+        except Exception as e:
+            if self._not_found(e):
+                raise FileNotFoundError(key)
+            raise
+        data = response["Body"].read()
+        if len(data) != length:
+            raise OSError(f"{key} is shorter than expected")
+        return data
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every object under prefix. Returns how many were deleted."""
+        deleted = 0
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            keys = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if keys:
+                self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": keys, "Quiet": True})
+                deleted += len(keys)
+        return deleted
+
+    def check(self) -> None:
+        self.client.head_bucket(Bucket=self.bucket)
+
+
+class ReadThroughCache:
+    """Whole objects from the store, kept on local disk within a byte budget.
+
+    Shared by the worker processes of a node: files appear by rename once
+    complete, and recency is the file's access time, so eviction in one
+    process sees what the others read. Evicted archives that are still
+    mapped stay readable until unmapped.
+
+    Each process keeps an index of the cached files, least recently used
+    first, and their total size, so making room does not walk the folder.
+    It is seeded from a walk and walked again every RESCAN_INTERVAL to
+    count files other processes added meanwhile.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._fetching: Dict[str, threading.Event] = {}
+        # Path -> [size, access time], least recently used first
+        self._index: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._total = 0
+        self._scanned_at: Optional[float] = None
+        self._index_lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="storage-prefetch")
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """The local path of a cached object, or None"""
+        path = self.path(key)
+        try:
+            st = os.stat(path)
+            if time.time() - st.st_atime > TOUCH_INTERVAL:
+                # Only the access time: the archive index and mappings go by mtime
+                os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+        except FileNotFoundError:
+            self._forget(path)
+            return None
+        self._track(path, st.st_size)
+        return path
+
+    def fetch(self, key: str) -> str:
+        """The local path of an object, downloading it first if needed. One download per key at a time."""
+        path = self.get(key)
+        if path:
+            return path
+        with self._lock:
+            event = self._fetching.get(key)
+            leader = event is None
+            if leader:
+                event = self._fetching[key] = threading.Event()
+        if not leader:
+            event.wait()
+            path = self.get(key)
+            if path is None:
+                raise FileNotFoundError(key)
+            return path
+
+        try:
+            path = self.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.part-{os.getpid()}-{threading.get_ident()}"
+            try:
+                backend.download(key, tmp_path)
+                size = os.path.getsize(tmp_path)
+                self.make_room(size)
+                os.replace(tmp_path, path)
+                self._track(path, size)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return path
+        finally:
+            with self._lock:
+                self._fetching.pop(key, None)
+            event.set()
+
+    def prefetch(self, key: str) -> None:
+        """Fetch an object in the background, unless it is cached or on its way"""
+        if key in self._fetching or self.get(key):
+            return
+        self._prefetcher.submit(self._prefetch, key)
+
+    def _prefetch(self, key: str) -> None:
+        try:
+            self.fetch(key)
+        except Exception:
+            logger.exception("Prefetching %s failed", key)
+
+    def add(self, key: str, src_path: str) -> str:
+        """Move a local file that was just uploaded into the cache. Returns its new path."""
+        size = os.path.getsize(src_path)
+        self.make_room(size)
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(src_path, path)
+        self._track(path, size)
+        return path
+
+    def make_room(self, incoming: int) -> None:
+        """Evict the least recently used files until incoming bytes fit in the budget"""
+        with self._index_lock:
+            if self._scanned_at is None or time.monotonic() - self._scanned_at > RESCAN_INTERVAL:
+                self._scan()
+            # Each file is looked at once, so files other processes keep reading cannot loop this
+            for _ in range(len(self._index)):
+                if self._total + incoming <= self.max_bytes:
+                    break
+                path, (size, atime) = self._index.popitem(last=False)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    # Evicted by another process
+                    self._total -= size
+                    continue
+                if st.st_atime > atime:
+                    # Read by another process since
+                    self._index[path] = [size, st.st_atime]
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._total -= size
+
+    def _scan(self) -> None:
+        """Rebuild the index from the cache folder. Called with the index lock held."""
+        files = []
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if ".part-" in name:
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_atime, st.st_size, path))
+        files.sort()
+        self._index = OrderedDict((path, [size, atime]) for atime, size, path in files)
+        self._total = sum(size for _, size, _ in files)
+        self._scanned_at = time.monotonic()
+
+    def _track(self, path: str, size: int) -> None:
+        """Count a file in the index as the most recently used"""
+        with self._index_lock:
+            entry = self._index.pop(path, None)
+            if entry is not None:
+                self._total -= entry[0]
+            self._index[path] = [size, time.time()]
+            self._total += size
+
+    def _forget(self, path: str) -> None:
+        with self._index_lock:
+            entry = self._index.pop(path, None)
+            if entry is not None:
+                self._total -= entry[0]
+
+
+def create_backend():
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage()
+    return LocalStorage()
+
+
+backend = create_backend()
+cache = ReadThroughCache(
+    settings.STORAGE_CACHE_PATH or os.path.join(settings.STORAGE_PATH, ".cache"),
+    settings.STORAGE_CACHE_BYTES,
+)
+
+
+def relative_key(path: str) -> str:
+    """The key of a file under STORAGE_PATH"""
+    return os.path.relpath(path, settings.STORAGE_PATH)
+
+
+def new_archive_key(manga_id: int, chapter_number: int) -> str:
+    """A fresh key for an uploaded chapter archive; every upload gets its own"""
+    return f"{manga_id}/{chapter_number}/chapter-{uuid.uuid4().hex[:12]}.zip"
+
+
+def archive_name(version: Optional[int]) -> str:
+    """File name of a chapter archive version; chapter.zip is the one from before versioning"""
+    return f"chapter.v{version}.zip" if version else "chapter.zip"
+
+
+def versioned_name(base: str, version: Optional[int]) -> str:
+    """Name of a chapter's pages or tiles folder for one archive version"""
+    return f"{base}.v{version}" if version else base
+
+
+def entry_version(name: str) -> Optional[int]:
+    """The archive version a chapter folder entry belongs to, 0 from before versioning, None for other entries"""
+    if name in UNVERSIONED_ENTRIES:
+        return 0
+    match = VERSIONED_ENTRY.fullmatch(name)
+    return int(match.group(1) or match.group(2)) if match else None
+
+
+def local_archive_path(chapter) -> Optional[str]:
+    """Where a chapter's archive version lives on local disk"""
+    if not chapter.folder_path:
+        return None
+    return os.path.join(chapter.folder_path, archive_name(chapter.archive_version))
+
+
+def archive_path(chapter, fetch: bool = True) -> Optional[str]:
+    """A local path of a chapter's archive, or None when there is none.
+
+    ``chapter`` is a Chapter or a row with its folder_path, archive_key and
+    archive_version. Archives in the object store come from the cache,
+    downloaded first if fetch is set.
+    """
+    if chapter.archive_key:
+        if not backend.remote:
+            return None
+        if not fetch:
+            return cache.get(chapter.archive_key)
+        try:
+            return cache.fetch(chapter.archive_key)
+        except FileNotFoundError:
+            return None
+    zip_path = local_archive_path(chapter)
+    return zip_path if zip_path and os.path.exists(zip_path) else None
+
+
+def versioned_key(path: str, version: str) -> str:
+    """Key of a generated file under STORAGE_PATH, with its version in the name"""
+    stem, ext = os.path.splitext(relative_key(path))
+    return f"{stem}-{version}{ext}"
+
+
+def publish(path: str, version: str) -> None:
+    """Make a generated file available to every node"""
+    if backend.remote:
+        backend.upload(versioned_key(path, version), path)
+
+
+def generated_path(path: str, version: str) -> Optional[str]:
+    """A local copy of a generated file, or None if there is none"""
+    if not backend.remote:
+        return path if os.path.exists(path) else None
+    try:
+        return cache.fetch(versioned_key(path, version))
+    except FileNotFoundError:
+        return None
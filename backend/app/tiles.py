@@ -0,0 +1,191 @@
+"""Tiles of long-strip (webtoon) pages.
+
+A webtoon "page" can be a 720x30000 image of many megabytes, and none of it
+shows until all of it has arrived. Ingest slices pages at least TALL_RATIO
+times as tall as they are wide into TILE_HEIGHT high WebP tiles, in the
+image process pool, and keeps them in a ``tiles.v<N>`` folder next to the
+chapter archive of the same version. The page list describes each tall
+page's tiles, so the reader can lay out the whole strip up front and load
+only the tiles coming into view. The page itself stays available whole.
+
+Tile URLs carry the archive version, so they are cached for good. A
+re-upload writes the next version's folder and leaves the current one in
+place; the old folder is collected with the old archive once readers on
+its page list have drained, and until then its tiles are still served.
+Chapters from before versioning keep theirs in ``tiles``, named by page
+index and versioned by the page's CRC-32. ``python -m app.tiles`` tiles
+chapters from before tiling.
+"""
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+import zlib
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app import storage, workers
+from app.archive import PageRef, list_image_entries
+from app.database import SessionLocal
+from app.models import Chapter, ChapterPage
+
+logger = logging.getLogger(__name__)
+
+TILES_DIR = "tiles"
+TILE_HEIGHT = 1024
+TALL_RATIO = 3
+TILE_QUALITY = 90
+
+
+def tiles_dir(chapter_folder: str, version: Optional[int]) -> str:
+    """Folder holding the tiles of the tall pages of a chapter archive version"""
+    return os.path.join(chapter_folder, storage.versioned_name(TILES_DIR, version))
+
+
+def tile_stem(version: Optional[int], filename: str, page_index: Optional[int]) -> str:
+    # Versioned folders name tiles by page, so the tiles of an old page list can be found without its rows
+    return filename if version else f"{page_index:04d}"
+
+
+def tile_path(chapter_folder: str, version: Optional[int], filename: str, page_index: Optional[int], tile: int) -> str:
+    stem = tile_stem(version, filename, page_index)
+    return os.path.join(tiles_dir(chapter_folder, version), f"{stem}-{tile:03d}.webp")
+
+
+def is_tall(width: Optional[int], height: Optional[int]) -> bool:
+    """Whether a page is a long strip worth slicing"""
+    return bool(width and height) and height >= width * TALL_RATIO and height > TILE_HEIGHT
+
+
+def tile_version(version: Optional[int], page) -> str:
+    return str(version) if version else f"{page.crc32:08x}"
+
+
+def tile_list(chapter: Chapter, page: ChapterPage) -> Optional[List[dict]]:
+    """URL and height of each tile of a page, for the page list; None when the page is not tiled"""
+    if not page.tile_count:
+        return None
+    version = tile_version(chapter.archive_version, page)
+    tiles = []
+    for tile in range(page.tile_count):
+        top = tile * page.tile_height
+        tiles.append({
+            "url": f"/api/chapters/{chapter.id}/pages/{page.filename}/tiles/{tile}?v={version}",
+            "height": min(page.tile_height, page.height - top),
+        })
+    return tiles
+
+
+def render_tiles(data: bytes, out_dir: str, stem: str, tile_height: int) -> int:
+    """Slice an image into tiles. Runs in the image process pool; returns how many were written, 0 if unreadable."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+            mode = "RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB"
+            image = image.convert(mode)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return 0
+
+    count = 0
+    for top in range(0, image.height, tile_height):
+        tile = image.crop((0, top, image.width, min(top + tile_height, image.height)))
+        path = os.path.join(out_dir, f"{stem}-{count:03d}.webp")
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        tile.save(tmp_path, "WEBP", quality=TILE_QUALITY, method=4)
+        os.replace(tmp_path, path)
+        count += 1
+    return count
+
+
+def publish_tiles(chapter_folder: str, version: Optional[int], page, count: int) -> None:
+    for tile in range(count):
+        path = tile_path(chapter_folder, version, page.filename, getattr(page, "page_index", None), tile)
+        storage.publish(path, tile_version(version, page))
+
+
+def tile_chapter(zip_path: str, refs: List[PageRef], chapter_folder: str, version: int) -> None:
+    """Slice the tall pages of a new chapter archive version into its tiles folder, recording the tiles on refs"""
+    tall = [ref for ref in refs if is_tall(ref.width, ref.height)]
+    if not tall:
+        return
+    staging = tempfile.mkdtemp(dir=chapter_folder, prefix=".tiles-")
+    try:
+        with zipfile.ZipFile(zip_path, "r") as zf:
+            names = {}
+            for filename, name in list_image_entries(zf):
+                names.setdefault(filename, name)
+            # One page at a time, so only one strip is held in memory
+            for ref in tall:
+                stem = tile_stem(version, ref.filename, None)
+                count = workers.submit(render_tiles, zf.read(names[ref.filename]), staging, stem, TILE_HEIGHT).result()
+                if count:
+                    ref.tile_height, ref.tile_count = TILE_HEIGHT, count
+        # The folder appears complete; nothing points at it before the chapter is committed
+        os.rename(staging, tiles_dir(chapter_folder, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    for ref in tall:
+        if ref.tile_count:
+            publish_tiles(chapter_folder, version, ref, ref.tile_count)
+
+
+def tile_existing(db: Session, chapter: Chapter) -> int:
+    """Tile the tall pages of a chapter ingested before tiling. Returns how many pages were tiled."""
+    from app.covers import read_page
+
+    tiled = 0
+    for page in chapter.pages:
+        if page.tile_count is not None or not is_tall(page.width, page.height):
+            continue
+        data = read_page(chapter, page)
+        if page.crc32 is None:
+            page.crc32 = zlib.crc32(data)
+        folder = tiles_dir(chapter.folder_path, chapter.archive_version)
+        os.makedirs(folder, exist_ok=True)
+        stem = tile_stem(chapter.archive_version, page.filename, page.page_index)
+        count = workers.submit(render_tiles, data, folder, stem, TILE_HEIGHT).result()
+        if count:
+            publish_tiles(chapter.folder_path, chapter.archive_version, page, count)
+            page.tile_height = TILE_HEIGHT
+            tiled += 1
+        # 0 marks a tall page that could not be tiled, so it is not retried
+        page.tile_count = count
+        db.commit()
+    return tiled
+
+
+def main() -> int:
+    """Tile the tall pages of every chapter from before tiling"""
+    db = SessionLocal()
+    tiled = 0
+    try:
+        chapter_ids = [chapter_id for chapter_id, in db.query(ChapterPage.chapter_id).filter(
+            ChapterPage.tile_count.is_(None),
+            ChapterPage.height >= ChapterPage.width * TALL_RATIO,
+            ChapterPage.height > TILE_HEIGHT,
+        ).distinct().order_by(ChapterPage.chapter_id)]
+        for chapter_id in chapter_ids:
+            chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
+            if not chapter or not chapter.folder_path:
+                continue
+            try:
+                tiled += tile_existing(db, chapter)
+            except Exception:
+                db.rollback()
+                logger.exception("Tiling failed for chapter %s", chapter_id)
+    finally:
+        db.close()
+    workers.shutdown()
+    print(f"Tiles: {tiled} pages in {len(chapter_ids)} chapters tiled")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
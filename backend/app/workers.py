@@ -0,0 +1,66 @@
+"""Shared process pool for CPU-bound image work.
+
+Resizing and encoding images holds the GIL, so it runs in separate
+processes, not in request threads. The pool is created on first use and
+shared by everything in the worker process that needs it. IMAGE_WORKERS
+bounds how many cores image work can take from request handling.
+
+Jobs that produce images for the catalogue or reader (covers, sprite
+sheets) are started with schedule(). It queues them on a single
+coordinator thread that prepares each one and waits on the pool, so a bulk
+upload queues jobs instead of flooding the pool.
+
+The pool's processes come from a fork server. Forking this process
+directly is not safe: it is multi-threaded, and a child could inherit a
+lock that another thread held at the moment of the fork.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+_coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-jobs")
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max(1, settings.IMAGE_WORKERS),
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _executor
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    """Run a module-level function in the pool"""
+    return get_executor().submit(fn, *args, **kwargs)
+
+
+def _run_logged(fn, args):
+    try:
+        return fn(*args)
+    except Exception:
+        logger.exception("Background image job %s%r failed", fn.__name__, args)
+
+
+def schedule(fn, *args) -> Future:
+    """Run a job on the coordinator thread, in the background. Failures are logged."""
+    return _coordinator.submit(_run_logged, fn, args)
+
+
+def shutdown(wait: bool = True) -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,199 @@
+"""Memory-mapped reader for chapter ZIPs.
+
+A chapter archive is mapped once per process and its central directory is
+parsed straight from the mapping. Stored entries come back as memoryview
+slices of the mapping, without copying; deflated entries are decompressed
+directly from the mapped bytes. Page data is read through the page cache,
+so workers reading the same chapter share memory and nothing is read
+twice.
+
+Archives are only ever replaced by renaming a new file into place, never
+rewritten, so a mapping stays valid for as long as anything references it.
+"""
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+# Open mappings kept per process
+MAX_OPEN_ARCHIVES = 128
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+EOCD = struct.Struct("<4s4H2LH")
+EOCD_SIGNATURE = b"PK\x05\x06"
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+ZIP64_EOCD_SIGNATURE = b"PK\x06\x06"
+# signature, versions, flags, method, time, date, crc, sizes, name, extra and
+# comment lengths, disk, attributes, local header offset
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+CENTRAL_HEADER_SIGNATURE = b"PK\x01\x02"
+# signature, version, flags, method, time, date, crc, sizes, name and extra lengths
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+ZIP64_EXTRA_ID = 0x0001
+MAX_COMMENT = 0xFFFF
+
+
+class BadArchive(Exception):
+    pass
+
+
+class Entry(NamedTuple):
+    name: str
+    header_offset: int
+    compress_size: int
+    file_size: int
+    compress_type: int
+    crc: int
+
+
+class MappedArchive:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                raise BadArchive("Empty file")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+        self._view = memoryview(self._map)
+        self._entries: Optional[List[Entry]] = None
+
+    def _central_directory(self) -> Tuple[int, int]:
+        """(offset, entry count) of the central directory, from the end of central directory record"""
+        data = self._map
+        start = max(0, len(data) - EOCD.size - MAX_COMMENT)
+        position = data.rfind(EOCD_SIGNATURE, start)
+        if position < 0 or position + EOCD.size > len(data):
+            raise BadArchive("End of central directory not found")
+        _, _, _, _, count, _, offset, _ = EOCD.unpack_from(data, position)
+
+        locator = position - ZIP64_LOCATOR.size
+        if locator >= 0 and data[locator:locator + 4] == ZIP64_LOCATOR_SIGNATURE:
+            _, _, eocd64, _ = ZIP64_LOCATOR.unpack_from(data, locator)
+            if data[eocd64:eocd64 + 4] != ZIP64_EOCD_SIGNATURE:
+                raise BadArchive("Bad ZIP64 end of central directory")
+            fields = ZIP64_EOCD.unpack_from(data, eocd64)
+            count, offset = fields[7], fields[9]
+        return offset, count
+
+    def entries(self) -> List[Entry]:
+        """Every entry of the archive, in central directory order"""
+        if self._entries is not None:
+            return self._entries
+        try:
+            self._entries = self._parse_entries()
+        except (struct.error, UnicodeDecodeError, StopIteration) as e:
+            raise BadArchive(f"Corrupt central directory: {e}")
+        return self._entries
+
+    def _parse_entries(self) -> List[Entry]:
+        data = self._map
+        position, count = self._central_directory()
+        entries = []
+        for _ in range(count):
+            if data[position:position + 4] != CENTRAL_HEADER_SIGNATURE:
+                raise BadArchive("Bad central directory entry")
+            fields = CENTRAL_HEADER.unpack_from(data, position)
+            flags, method = fields[3], fields[4]
+            compress_size, file_size = fields[8], fields[9]
+            name_length, extra_length, comment_length = fields[10], fields[11], fields[12]
+            crc, header_offset = fields[7], fields[16]
+            name_start = position + CENTRAL_HEADER.size
+            raw_name = data[name_start:name_start + name_length]
+            name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+            if 0xFFFFFFFF in (compress_size, file_size, header_offset):
+                file_size, compress_size, header_offset = self._zip64_sizes(
+                    name_start + name_length, extra_length, file_size, compress_size, header_offset)
+            entries.append(Entry(name, header_offset, compress_size, file_size, method, crc))
+            position = name_start + name_length + extra_length + comment_length
+        return entries
+
+    def _zip64_sizes(self, start: int, length: int, file_size: int, compress_size: int, header_offset: int):
+        """Read the 64-bit values that replace 0xFFFFFFFF placeholders, in the order the spec lists them"""
+        data = self._map
+        position = start
+        while position + 4 <= start + length:
+            header_id, size = struct.unpack_from("<2H", data, position)
+            if header_id == ZIP64_EXTRA_ID:
+                values = iter(struct.unpack_from(f"<{size // 8}Q", data, position + 4))
+                if file_size == 0xFFFFFFFF:
+                    file_size = next(values)
+                if compress_size == 0xFFFFFFFF:
+                    compress_size = next(values)
+                if header_offset == 0xFFFFFFFF:
+                    header_offset = next(values)
+                break
+            position += 4 + size
+        return file_size, compress_size, header_offset
+
+    def data_offset(self, header_offset: int) -> int:
+        """Where an entry's data starts, after its local header"""
+        try:
+            fields = LOCAL_HEADER.unpack_from(self._map, header_offset)
+        except struct.error:
+            raise BadArchive("Truncated local file header")
+        if fields[0] != LOCAL_HEADER_SIGNATURE:
+            raise BadArchive("Bad local file header")
+        return header_offset + LOCAL_HEADER.size + fields[9] + fields[10]
+
+    def raw(self, start: int, length: int) -> memoryview:
+        """A view of length bytes of the archive file from start"""
+        view = self._view[start:start + length]
+        if len(view) != length:
+            raise BadArchive("Truncated entry")
+        return view
+
+    def read(self, header_offset: int, compress_size: int, compress_type: int) -> Union[memoryview, bytes]:
+        """An entry's contents: a view of the mapping when stored, decompressed when deflated"""
+        start = self.data_offset(header_offset)
+        raw = self._view[start:start + compress_size]
+        if len(raw) != compress_size:
+            raise BadArchive("Truncated entry")
+        if compress_type == ZIP_STORED:
+            return raw
+        if compress_type == ZIP_DEFLATED:
+            try:
+                return zlib.decompress(raw, -15)
+            except zlib.error as e:
+                raise BadArchive(str(e))
+        raise BadArchive(f"Unsupported compression method {compress_type}")
+
+
+class ArchiveCache:
+    """Open mappings by path, reopened when the file at that path is replaced.
+
+    Evicted mappings are not closed explicitly: a response may still hold
+    a view of one, and the mapping is released when the last view goes.
+    """
+
+    def __init__(self, size: int = MAX_OPEN_ARCHIVES):
+        self.size = size
+        self._archives: "OrderedDict[str, MappedArchive]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, path: str, st: os.stat_result = None) -> MappedArchive:
+        st = st or os.stat(path)
+        identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            archive = self._archives.get(path)
+            if archive is not None and archive.identity == identity:
+                self._archives.move_to_end(path)
+                return archive
+        archive = MappedArchive(path)
+        with self._lock:
+            self._archives[path] = archive
+            self._archives.move_to_end(path)
+            while len(self._archives) > self.size:
+                self._archives.popitem(last=False)
+        return archive
+
+
+archives = ArchiveCache()
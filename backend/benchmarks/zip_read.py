@@ -0,0 +1,99 @@
+"""Microbenchmark: reading chapter pages out of chapter.zip.
+
+Compares the ways the chapter router has read a page from a ZIP chapter:
+
+    zipfile   open the archive, scan its names, ZipFile.read (per request)
+    pread     shared index lookup, then seek and read the entry from the file
+    mmap      shared index lookup, then a view of the mapped archive
+
+Run from backend/:
+
+    python benchmarks/zip_read.py [--pages 40] [--page-kb 400] [--rounds 20]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Settings need these, the benchmark touches neither
+os.environ.setdefault("DATABASE_URL", "postgresql://unused")
+os.environ.setdefault("SECRET_KEY", "unused")
+
+from app.archive_index import ArchiveIndex, read_entry  # noqa: E402
+from app.zipmmap import LOCAL_HEADER  # noqa: E402
+
+
+def make_chapter(path: str, pages: int, page_size: int, method: int) -> list:
+    """A chapter archive of incompressible pages, like real JPEGs"""
+    names = [f"{i:03d}.jpg" for i in range(1, pages + 1)]
+    with zipfile.ZipFile(path, "w", method) as zf:
+        for name in names:
+            zf.writestr(name, os.urandom(page_size))
+    return names
+
+
+def read_zipfile(zip_path: str, filename: str) -> bytes:
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        for name in zf.namelist():
+            if os.path.basename(name) == filename:
+                return zf.read(name)
+    raise KeyError(filename)
+
+
+def read_pread(index: ArchiveIndex, zip_path: str, filename: str) -> bytes:
+    entry = index.lookup(1, zip_path, filename)
+    with open(zip_path, "rb") as f:
+        f.seek(entry.header_offset)
+        fields = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+        f.seek(fields[9] + fields[10], os.SEEK_CUR)
+        data = f.read(entry.compress_size)
+    if entry.compress_type == zipfile.ZIP_DEFLATED:
+        return zlib.decompress(data, -15)
+    return data
+
+
+def read_mmap(index: ArchiveIndex, zip_path: str, filename: str) -> bytes:
+    entry = index.lookup(1, zip_path, filename)
+    # The response body needs bytes, so count the copy the router makes
+    return bytes(read_entry(zip_path, entry))
+
+
+def run(label: str, read, names: list, rounds: int) -> None:
+    order = names * rounds
+    random.shuffle(order)
+    read(names[0])
+    start = time.perf_counter()
+    total = 0
+    for name in order:
+        total += len(read(name))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:8s} {len(order) / elapsed:10.0f} pages/s  "
+          f"{elapsed / len(order) * 1e6:8.1f} us/page  {total / elapsed / 2**20:8.0f} MiB/s")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--page-kb", type=int, default=400)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for method, label in ((zipfile.ZIP_STORED, "stored"), (zipfile.ZIP_DEFLATED, "deflated")):
+            zip_path = os.path.join(tmp, f"{label}.zip")
+            names = make_chapter(zip_path, args.pages, args.page_kb * 1024, method)
+            index = ArchiveIndex(os.path.join(tmp, f"{label}.idx"))
+            print(f"{label}: {args.pages} pages of {args.page_kb} KiB, {args.rounds} rounds")
+            run("zipfile", lambda name: read_zipfile(zip_path, name), names, args.rounds)
+            run("pread", lambda name: read_pread(index, zip_path, name), names, args.rounds)
+            run("mmap", lambda name: read_mmap(index, zip_path, name), names, args.rounds)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+#!/bin/sh
+set -e
+
+# One worker per core unless WEB_CONCURRENCY says otherwise
+WEB_CONCURRENCY="${WEB_CONCURRENCY:-$(nproc)}"
+
+# Create or upgrade the schema and the seed admin, once for all workers
+python -m app.migrate
+
+# Compact the shared chapter archive index so workers start warm
+python -m app.archive_index || echo "Archive index warm-up failed, continuing"
+
+exec uvicorn app.main:app \
+    --host 0.0.0.0 --port 8000 \
+    --workers "$WEB_CONCURRENCY" \
+    --limit-concurrency 100 \
+    --proxy-headers --forwarded-allow-ips='*'
@@ -14,6 +14,9 @@ CREATE TABLE IF NOT EXISTS users (
 
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+-- Case-insensitive prefix search in the admin user list
+CREATE INDEX IF NOT EXISTS idx_users_username_prefix ON users(lower(username) varchar_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_users_email_prefix ON users(lower(email) varchar_pattern_ops);
 
 -- Create manga table
 CREATE TABLE IF NOT EXISTS manga (
@@ -27,6 +30,12 @@ CREATE TABLE IF NOT EXISTS manga (
     is_published BOOLEAN DEFAULT FALSE
 );
 
+ALTER TABLE manga ADD COLUMN IF NOT EXISTS is_deleted BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE manga ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE manga ADD COLUMN IF NOT EXISTS cover_version VARCHAR(16);
+-- When the manga last got a new chapter, for the catalogue's "recently updated" order
+ALTER TABLE manga ADD COLUMN IF NOT EXISTS last_chapter_at TIMESTAMP WITH TIME ZONE;
+
 -- Create chapters table
 CREATE TABLE IF NOT EXISTS chapters (
     id SERIAL PRIMARY KEY,
@@ -37,7 +46,162 @@ CREATE TABLE IF NOT EXISTS chapters (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_chapters_manga_id ON chapters(manga_id);
+ALTER TABLE chapters ADD COLUMN IF NOT EXISTS storage_mode VARCHAR(20) NOT NULL DEFAULT 'zip';
+ALTER TABLE chapters ADD COLUMN IF NOT EXISTS sprite_version VARCHAR(16);
+ALTER TABLE chapters ADD COLUMN IF NOT EXISTS sprite_map TEXT;
+-- Object store key of the chapter archive (STORAGE_BACKEND=s3); NULL for archives on local disk
+ALTER TABLE chapters ADD COLUMN IF NOT EXISTS archive_key VARCHAR(500);
+-- Version of the chapter archive on local disk (chapter.v<N>.zip); NULL for a chapter.zip from before versioning
+ALTER TABLE chapters ADD COLUMN IF NOT EXISTS archive_version INTEGER;
+
+-- Content-addressed page store (STORAGE_MODE=blob)
+CREATE TABLE IF NOT EXISTS page_blobs (
+    sha256 VARCHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_page_blobs_unreferenced ON page_blobs(sha256) WHERE ref_count <= 0;
+
+CREATE TABLE IF NOT EXISTS chapter_pages (
+    id SERIAL PRIMARY KEY,
+    chapter_id INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+    page_index INTEGER NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    blob_sha256 VARCHAR(64) REFERENCES page_blobs(sha256),
+    size BIGINT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_chapter_pages_chapter ON chapter_pages(chapter_id, page_index);
+CREATE INDEX IF NOT EXISTS idx_chapter_pages_blob ON chapter_pages(blob_sha256);
+
+-- Page dimensions read from image headers at ingest
+ALTER TABLE chapter_pages ADD COLUMN IF NOT EXISTS width INTEGER;
+ALTER TABLE chapter_pages ADD COLUMN IF NOT EXISTS height INTEGER;
+ALTER TABLE chapter_pages ADD COLUMN IF NOT EXISTS format VARCHAR(10);
+
+-- CRC-32 of the page, for building CBZ downloads without reading the pages first
+ALTER TABLE chapter_pages ADD COLUMN IF NOT EXISTS crc32 BIGINT;
+-- Where a stored page's data starts in the chapter archive, for ranged reads
+ALTER TABLE chapter_pages ADD COLUMN IF NOT EXISTS data_offset BIGINT;
+-- Long-strip pages sliced into tiles for the reader; NULL when not sliced
+ALTER TABLE chapter_pages ADD COLUMN IF NOT EXISTS tile_height INTEGER;
+ALTER TABLE chapter_pages ADD COLUMN IF NOT EXISTS tile_count INTEGER;
+
+-- One row per chapter number. Databases from before the unique index may
+-- hold duplicates from concurrent uploads: keep the newest, releasing the
+-- blob references of the others.
+WITH duplicates AS (
+    SELECT c.id FROM chapters c
+    WHERE EXISTS (
+        SELECT 1 FROM chapters d
+        WHERE d.manga_id = c.manga_id AND d.chapter_number = c.chapter_number AND d.id > c.id
+    )
+), released AS (
+    DELETE FROM chapter_pages WHERE chapter_id IN (SELECT id FROM duplicates) RETURNING blob_sha256
+), counts AS (
+    SELECT blob_sha256, COUNT(*) AS n FROM released WHERE blob_sha256 IS NOT NULL GROUP BY blob_sha256
+), unreferenced AS (
+    UPDATE page_blobs SET ref_count = page_blobs.ref_count - counts.n
+    FROM counts WHERE page_blobs.sha256 = counts.blob_sha256
+)
+DELETE FROM chapters WHERE id IN (SELECT id FROM duplicates);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_chapters_manga_number ON chapters(manga_id, chapter_number);
+-- Covered by idx_chapters_manga_number
+DROP INDEX IF EXISTS idx_chapters_manga_id;
+
+-- Recently updated: the catalogue and the feed of new chapters
+UPDATE manga m SET last_chapter_at = c.latest
+FROM (SELECT manga_id, MAX(created_at) AS latest FROM chapters GROUP BY manga_id) c
+WHERE c.manga_id = m.id AND m.last_chapter_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_manga_last_chapter_at ON manga(last_chapter_at DESC NULLS LAST, id DESC);
+CREATE INDEX IF NOT EXISTS idx_chapters_created ON chapters(created_at DESC, id DESC);
+
+-- Storage reclaimed in the background after deletes and re-uploads
+CREATE TABLE IF NOT EXISTS storage_gc_jobs (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    manga_id INTEGER,
+    path VARCHAR(500) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    files_total INTEGER,
+    files_removed INTEGER NOT NULL DEFAULT 0,
+    bytes_freed BIGINT NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Replaced archives wait until readers of the old version have drained
+ALTER TABLE storage_gc_jobs ADD COLUMN IF NOT EXISTS not_before TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS idx_storage_gc_jobs_status ON storage_gc_jobs(status, id);
+
+-- Resumable chapter uploads
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id VARCHAR(32) PRIMARY KEY,
+    manga_id INTEGER NOT NULL REFERENCES manga(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    chapter_number INTEGER NOT NULL,
+    title VARCHAR(255),
+    size BIGINT NOT NULL,
+    received_bytes BIGINT NOT NULL DEFAULT 0,
+    ranges TEXT NOT NULL DEFAULT '[]',
+    path VARCHAR(500) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'open',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires_at ON upload_sessions(expires_at);
+
+-- Reading progress, one row per user and manga
+CREATE TABLE IF NOT EXISTS reading_progress (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    manga_id INTEGER NOT NULL REFERENCES manga(id) ON DELETE CASCADE,
+    chapter_id INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+    page INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_reading_progress_user_manga ON reading_progress(user_id, manga_id);
+CREATE INDEX IF NOT EXISTS idx_reading_progress_user_updated ON reading_progress(user_id, updated_at);
+
+-- Progress reports waiting to be written to reading_progress, shared by all workers
+CREATE UNLOGGED TABLE IF NOT EXISTS reading_progress_pending (
+    user_id INTEGER NOT NULL,
+    manga_id INTEGER NOT NULL,
+    chapter_id INTEGER NOT NULL,
+    page INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    PRIMARY KEY (user_id, manga_id)
+);
+
+-- Storage consistency scanner
+CREATE TABLE IF NOT EXISTS archive_scan_state (
+    path VARCHAR(500) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    ok BOOLEAN NOT NULL,
+    error TEXT,
+    checked_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS storage_scans (
+    id SERIAL PRIMARY KEY,
+    trigger VARCHAR(20) NOT NULL,
+    repair VARCHAR(100),
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    report TEXT,
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    finished_at TIMESTAMP WITH TIME ZONE
+);
 
 -- Create site_config table
 CREATE TABLE IF NOT EXISTS site_config (
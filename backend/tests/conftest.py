@@ -0,0 +1,7 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Settings need these; tests that use the database set their own
+os.environ.setdefault("DATABASE_URL", "postgresql://unused")
+os.environ.setdefault("SECRET_KEY", "unused")
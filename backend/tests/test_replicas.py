@@ -0,0 +1,121 @@
+"""Read replicas: which database the reader's routes end up on.
+
+Needs a Postgres server to create two databases on, one standing in for
+the primary and one for a replica, given as TEST_DATABASE_URL (a user
+allowed to create databases). Skipped without it.
+"""
+import os
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import database, main
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+def create_database(name: str) -> str:
+    """A fresh database on the test server holding a single row with its role. Returns its URL."""
+    server = create_engine(TEST_DATABASE_URL, isolation_level="AUTOCOMMIT")
+    with server.connect() as conn:
+        conn.execute(text(f'DROP DATABASE IF EXISTS "{name}"'))
+        conn.execute(text(f'CREATE DATABASE "{name}"'))
+    server.dispose()
+    url = make_url(TEST_DATABASE_URL).set(database=name)
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE role (name TEXT)"))
+        conn.execute(text("INSERT INTO role VALUES (:name)"), {"name": name.rsplit("_", 1)[1]})
+    engine.dispose()
+    return url.render_as_string(hide_password=False)
+
+
+@pytest.fixture(scope="module")
+def urls():
+    return create_database("manga_test_primary"), create_database("manga_test_replica")
+
+
+@pytest.fixture
+def replicas(urls, monkeypatch):
+    primary_url, replica_url = urls
+    primary = create_engine(primary_url)
+    monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=primary))
+    replicas = database.ReplicaSet([replica_url], max_lag=5, check_seconds=1)
+    replicas.check_all()
+    monkeypatch.setattr(database, "replicas", replicas)
+    monkeypatch.setattr(main, "replicas", replicas)
+    yield replicas
+    for replica in replicas.replicas:
+        replica.engine.dispose()
+    primary.dispose()
+
+
+def role(db: Session) -> str:
+    return db.execute(text("SELECT name FROM role")).scalar()
+
+
+def claim(db: Session) -> str:
+    db.execute(text("UPDATE role SET name = name"))
+    db.commit()
+    return role(db)
+
+
+@pytest.fixture
+def client(replicas):
+    app = FastAPI()
+    app.middleware("http")(main.read_your_writes)
+
+    @app.get("/role")
+    def read(db: Session = Depends(database.get_read_db)):
+        return role(db)
+
+    @app.post("/role")
+    def write(db: Session = Depends(database.get_db)):
+        return claim(db)
+
+    return TestClient(app)
+
+
+def test_reads_go_to_the_replica(replicas):
+    assert replicas.replicas[0].healthy
+    assert database.with_read_db(role) == "replica"
+    db = next(database.get_read_db())
+    assert role(db) == "replica"
+
+
+def test_writer_reads_from_the_primary(client, replicas):
+    assert client.get("/role").json() == "replica"
+    response = client.post("/role")
+    assert response.json() == "primary"
+    assert float(response.cookies[main.READ_PRIMARY_COOKIE]) > 0
+    assert client.get("/role").json() == "primary"
+    # Once every replica has the write, back to the replica
+    client.cookies.set(main.READ_PRIMARY_COOKIE, "1")
+    assert client.get("/role").json() == "replica"
+    # Other clients were never pinned
+    assert TestClient(client.app).get("/role").json() == "replica"
+
+
+def test_write_on_a_replica_reruns_on_the_primary(replicas):
+    assert database.with_read_db(claim) == "primary"
+    assert replicas.replicas[0].healthy
+
+
+def test_unreachable_replica_falls_back_to_the_primary(replicas, tmp_path, monkeypatch):
+    down = database.ReplicaSet([f"postgresql://nobody@/nowhere?host={tmp_path}"], max_lag=5, check_seconds=1)
+    # Healthy as of the last check, gone since
+    down.replicas[0].healthy = True
+    monkeypatch.setattr(database, "replicas", down)
+    assert database.with_read_db(role) == "primary"
+    assert not down.replicas[0].healthy
+
+    down.replicas[0].healthy = True
+    db = next(database.get_read_db())
+    assert role(db) == "primary"
+    assert not down.replicas[0].healthy
@@ -0,0 +1,110 @@
+"""S3Storage against a mocked bucket, and eviction from the read-through cache"""
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from app import storage
+from app.config import settings
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setattr(settings, "S3_BUCKET", "library")
+    monkeypatch.setattr(settings, "S3_PREFIX", "manga/")
+    monkeypatch.setattr(settings, "S3_REGION", "us-east-1")
+    monkeypatch.setattr(settings, "S3_ACCESS_KEY_ID", "testing")
+    monkeypatch.setattr(settings, "S3_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="library")
+        yield storage.S3Storage()
+
+
+@pytest.fixture
+def cache(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "backend", s3)
+    return storage.ReadThroughCache(str(tmp_path / "cache"), max_bytes=250)
+
+
+def put(s3, tmp_path, key, data):
+    src = tmp_path / "src"
+    src.write_bytes(data)
+    s3.upload(key, str(src))
+
+
+def test_upload_and_download(s3, tmp_path):
+    put(s3, tmp_path, "1/1/chapter-a.zip", b"archive")
+    assert boto3.client("s3", region_name="us-east-1").head_object(Bucket="library", Key="manga/1/1/chapter-a.zip")
+    s3.download("1/1/chapter-a.zip", str(tmp_path / "copy"))
+    assert (tmp_path / "copy").read_bytes() == b"archive"
+    with pytest.raises(FileNotFoundError):
+        s3.download("1/1/missing.zip", str(tmp_path / "missing"))
+
+
+def test_read_range(s3, tmp_path):
+    put(s3, tmp_path, "1/1/chapter-a.zip", bytes(range(100)))
+    assert s3.read_range("1/1/chapter-a.zip", 10, 5) == bytes(range(10, 15))
+    with pytest.raises(OSError):
+        s3.read_range("1/1/chapter-a.zip", 95, 10)
+    with pytest.raises(FileNotFoundError):
+        s3.read_range("1/1/missing.zip", 0, 1)
+
+
+def test_delete_prefix(s3, tmp_path):
+    for key in ("1/1/chapter-a.zip", "1/2/chapter-b.zip", "2/1/chapter-c.zip"):
+        put(s3, tmp_path, key, b"x")
+    assert s3.delete_prefix("1/") == 2
+    s3.delete("2/1/chapter-c.zip")
+    with pytest.raises(FileNotFoundError):
+        s3.download("2/1/chapter-c.zip", str(tmp_path / "gone"))
+
+
+def test_cache_evicts_least_recently_used(cache, s3, tmp_path):
+    for name in "abc":
+        put(s3, tmp_path, f"{name}.zip", name.encode() * 100)
+    a = cache.fetch("a.zip")
+    b = cache.fetch("b.zip")
+    assert cache.get("a.zip") == a
+    cache.fetch("c.zip")
+    assert os.path.exists(a) and not os.path.exists(b)
+    assert cache._total == 200
+    # Fetched again from the store
+    assert open(cache.fetch("b.zip"), "rb").read() == b"b" * 100
+
+
+def test_cache_walks_its_folder_once(cache, s3, tmp_path, monkeypatch):
+    for name in "abcd":
+        put(s3, tmp_path, f"{name}.zip", name.encode() * 100)
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(os, "walk", lambda *args: walks.append(args) or walk(*args))
+    for name in "abcd":
+        cache.fetch(f"{name}.zip")
+    cache.add("e.zip", str(tmp_path / "src"))
+    assert len(walks) == 1
+    assert cache._total == 200
+
+
+def test_cache_keeps_files_other_processes_read(cache, s3, tmp_path):
+    for name in "abc":
+        put(s3, tmp_path, f"{name}.zip", name.encode() * 100)
+    a = cache.fetch("a.zip")
+    b = cache.fetch("b.zip")
+    # Another worker of the node reads a.zip
+    st = os.stat(a)
+    os.utime(a, ns=(st.st_atime_ns + 10**9, st.st_mtime_ns))
+    cache.fetch("c.zip")
+    assert os.path.exists(a) and not os.path.exists(b)
+
+
+def test_cache_seeds_from_disk(cache, s3, tmp_path):
+    for name in "abc":
+        put(s3, tmp_path, f"{name}.zip", name.encode() * 100)
+    a = cache.fetch("a.zip")
+    b = cache.fetch("b.zip")
+    # A restarted worker finds both on disk
+    restarted = storage.ReadThroughCache(cache.root, max_bytes=250)
+    restarted.fetch("c.zip")
+    assert restarted._total == 200
+    assert not os.path.exists(a) and os.path.exists(b)
@@ -15,7 +15,9 @@ export default function UploadPage() {
   const [chapters, setChapters] = useState<{ number: number; title: string; file: File | null }[]>([
     { number: 1, title: '', file: null }
   ]);
+  const [volumeFile, setVolumeFile] = useState<File | null>(null);
   const [uploading, setUploading] = useState(false);
+  const [progress, setProgress] = useState('');
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
 
@@ -51,8 +53,8 @@ export default function UploadPage() {
 
     // Check if all chapters have files
     const chaptersWithFiles = chapters.filter(c => c.file);
-    if (chaptersWithFiles.length === 0) {
-      setError('Please upload at least one chapter');
+    if (chaptersWithFiles.length === 0 && !volumeFile) {
+      setError('Please upload at least one chapter or a volume archive');
       return;
     }
 
@@ -65,22 +67,37 @@ export default function UploadPage() {
       // Upload chapters
       for (const chapter of chapters) {
         if (chapter.file) {
-          await mangaApi.uploadChapter(
+          await mangaApi.uploadChapterResumable(
             manga.id,
             chapter.number,
             chapter.title || null,
-            chapter.file
+            chapter.file,
+            (sent, total) => setProgress(`Chapter ${chapter.number}: ${Math.round((sent / total) * 100)}%`)
           );
         }
       }
 
+      // Upload volume archive, chapters are numbered from their folder names
+      let failed: string[] = [];
+      if (volumeFile) {
+        const result = await mangaApi.uploadChaptersBulk(manga.id, volumeFile);
+        failed = result.chapters
+          .filter((c: any) => c.status !== 'ok')
+          .map((c: any) => `${c.name}: ${c.detail}`);
+      }
+
       // Publish manga
       await mangaApi.update(manga.id, { is_published: true });
 
-      setSuccess('Manga uploaded successfully!');
+      setSuccess(
+        failed.length
+          ? `Manga uploaded, but some chapters were skipped: ${failed.join('; ')}`
+          : 'Manga uploaded successfully!'
+      );
       setTitle('');
       setDescription('');
       setChapters([{ number: 1, title: '', file: null }]);
+      setVolumeFile(null);
 
       setTimeout(() => {
         router.push('/');
@@ -89,6 +106,7 @@ export default function UploadPage() {
       setError(err.response?.data?.detail || 'Upload failed');
     } finally {
       setUploading(false);
+      setProgress('');
     }
   };
 
@@ -187,7 +205,7 @@ export default function UploadPage() {
                   accept=".zip"
                   onChange={(e) => updateChapter(index, 'file', e.target.files?.[0] || null)}
                   className="w-full px-3 py-2 border border-gray-300 rounded focus:outline-none focus:border-blue-500"
-                  required
+                  required={!volumeFile}
                 />
               </div>
               <button
@@ -210,12 +228,26 @@ export default function UploadPage() {
           </button>
         </div>
 
+        <div className="mb-6">
+          <h2 className="text-xl font-semibold mb-2">Volume Archive (optional)</h2>
+          <p className="text-gray-600 text-sm mb-2">
+            A ZIP with one folder or ZIP/CBZ file per chapter, e.g. <code>Ch 001/</code> or <code>Chapter 2.cbz</code>.
+            Chapter numbers are taken from the names.
+          </p>
+          <input
+            type="file"
+            accept=".zip"
+            onChange={(e) => setVolumeFile(e.target.files?.[0] || null)}
+            className="w-full px-3 py-2 border border-gray-300 rounded focus:outline-none focus:border-blue-500"
+          />
+        </div>
+
         <button
           type="submit"
           disabled={uploading}
           className="px-6 py-3 bg-blue-600 text-white rounded hover:bg-blue-700 disabled:opacity-50"
         >
-          {uploading ? 'Uploading...' : 'Upload Manga'}
+          {uploading ? `Uploading... ${progress}` : 'Upload Manga'}
         </button>
       </form>
     </div>
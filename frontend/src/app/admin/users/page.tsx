@@ -5,7 +5,7 @@ import { useRouter } from 'next/navigation';
 import Link from 'next/link';
 import { useAuth } from '@/lib/auth';
 import { adminApi } from '@/lib/api';
-import { User } from '@/types';
+import { User, UserPage } from '@/types';
 
 export default function UsersPage() {
   const { user, loading: authLoading } = useAuth();
@@ -14,6 +14,16 @@ export default function UsersPage() {
   const [users, setUsers] = useState<User[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+
+  // Search, filters and paging
+  const [search, setSearch] = useState('');
+  const [query, setQuery] = useState('');
+  const [roleFilter, setRoleFilter] = useState('');
+  const [activeFilter, setActiveFilter] = useState('');
+  const [nextCursor, setNextCursor] = useState<number | null>(null);
+  const [total, setTotal] = useState(0);
+  const [totalIsEstimate, setTotalIsEstimate] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   
   // Modal state
   const [showModal, setShowModal] = useState(false);
@@ -37,22 +47,55 @@ export default function UsersPage() {
     }
   }, [user, authLoading, router]);
 
+  // Wait for a pause in typing before searching
   useEffect(() => {
-    const fetchUsers = async () => {
-      try {
-        const data = await adminApi.getUsers();
-        setUsers(data);
-      } catch (err) {
-        setError('Failed to load users');
-      } finally {
-        setLoading(false);
-      }
+    const timer = setTimeout(() => setQuery(search.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [search]);
+
+  const fetchUsers = async (cursor?: number) => {
+    const page: UserPage = await adminApi.getUsers({
+      q: query || undefined,
+      role: roleFilter || undefined,
+      is_active: activeFilter ? activeFilter === 'active' : undefined,
+      cursor,
+    });
+    setNextCursor(page.next_cursor);
+    setTotal(page.total);
+    setTotalIsEstimate(page.total_is_estimate);
+    return page.items;
+  };
+
+  useEffect(() => {
+    if (!user || user.role !== 'admin') return;
+    let cancelled = false;
+    fetchUsers()
+      .then((items) => {
+        if (!cancelled) setUsers(items);
+      })
+      .catch(() => {
+        if (!cancelled) setError('Failed to load users');
+      })
+      .finally(() => {
+        if (!cancelled) setLoading(false);
+      });
+    return () => {
+      cancelled = true;
     };
+  }, [user, query, roleFilter, activeFilter]);
 
-    if (user && user.role === 'admin') {
-      fetchUsers();
+  const handleLoadMore = async () => {
+    if (nextCursor === null) return;
+    setLoadingMore(true);
+    try {
+      const items = await fetchUsers(nextCursor);
+      setUsers([...users, ...items]);
+    } catch (err) {
+      setError('Failed to load users');
+    } finally {
+      setLoadingMore(false);
     }
-  }, [user]);
+  };
 
   const handleRoleChange = async (userId: number, newRole: string) => {
     try {
@@ -78,6 +121,7 @@ export default function UsersPage() {
     try {
       await adminApi.deleteUser(userId);
       setUsers(users.filter(u => u.id !== userId));
+      setTotal(total - 1);
     } catch (err: any) {
       setError(err.response?.data?.detail || 'Failed to delete user');
     }
@@ -120,7 +164,11 @@ export default function UsersPage() {
         password: newPassword,
         role: newRole,
       });
-      setUsers([...users, newUser]);
+      // Users are listed by id, so a new one belongs at the end of the last page
+      if (nextCursor === null) {
+        setUsers([...users, newUser]);
+      }
+      setTotal(total + 1);
       setShowModal(false);
       // Reset form
       setNewUsername('');
@@ -168,6 +216,37 @@ export default function UsersPage() {
         </div>
       )}
 
+      <div className="flex flex-wrap gap-2 items-center mb-4">
+        <input
+          type="search"
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+          placeholder="Search username or email..."
+          className="flex-1 min-w-[200px] px-3 py-2 border border-gray-300 rounded focus:outline-none focus:border-blue-500"
+        />
+        <select
+          value={roleFilter}
+          onChange={(e) => setRoleFilter(e.target.value)}
+          className="px-3 py-2 border border-gray-300 rounded"
+        >
+          <option value="">All roles</option>
+          <option value="user">User</option>
+          <option value="admin">Admin</option>
+        </select>
+        <select
+          value={activeFilter}
+          onChange={(e) => setActiveFilter(e.target.value)}
+          className="px-3 py-2 border border-gray-300 rounded"
+        >
+          <option value="">Any status</option>
+          <option value="active">Active</option>
+          <option value="inactive">Inactive</option>
+        </select>
+        <span className="text-sm text-gray-500">
+          {totalIsEstimate ? '~' : ''}{total.toLocaleString()} users
+        </span>
+      </div>
+
       <div className="bg-white rounded-lg shadow overflow-hidden">
         <table className="min-w-full">
           <thead className="bg-gray-50">
@@ -225,8 +304,23 @@ export default function UsersPage() {
             ))}
           </tbody>
         </table>
+        {users.length === 0 && (
+          <div className="px-6 py-8 text-center text-gray-500">No users found</div>
+        )}
       </div>
 
+      {nextCursor !== null && (
+        <div className="text-center mt-4">
+          <button
+            onClick={handleLoadMore}
+            disabled={loadingMore}
+            className="px-4 py-2 border border-gray-300 rounded text-gray-700 hover:bg-gray-100 disabled:opacity-50"
+          >
+            {loadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        </div>
+      )}
+
       {/* Create User Modal */}
       {showModal && (
         <div className="fixed inset-0 bg-black bg-opacity-50 flex items-center justify-center z-50">
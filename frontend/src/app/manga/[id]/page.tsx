@@ -62,7 +62,7 @@ export default function MangaPage() {
           <div className="aspect-[3/4] bg-gray-200 rounded-lg overflow-hidden shadow-lg">
             {manga.cover_image ? (
               <img
-                src={manga.cover_image}
+                src={manga.cover_version ? mangaApi.getCoverUrl(manga.id, manga.cover_version, 'large') : manga.cover_image}
                 alt={manga.title}
                 className="w-full h-full object-cover"
               />
@@ -85,7 +85,18 @@ export default function MangaPage() {
 
           {/* Chapters */}
           <div className="mt-8">
-            <h2 className="text-xl font-semibold mb-4">Chapters</h2>
+            <div className="flex items-center justify-between mb-4">
+              <h2 className="text-xl font-semibold">Chapters</h2>
+              {manga.chapters && manga.chapters.length > 0 && (
+                <a
+                  href={mangaApi.getDownloadUrl(manga.id)}
+                  download
+                  className="text-sm text-blue-600 hover:underline"
+                >
+                  Download all (CBZ)
+                </a>
+              )}
+            </div>
             <ChapterList chapters={manga.chapters || []} />
           </div>
         </div>
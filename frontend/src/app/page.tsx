@@ -2,13 +2,16 @@
 
 import { useEffect, useState } from 'react';
 import { useRouter } from 'next/navigation';
+import Link from 'next/link';
 import { useAuth } from '@/lib/auth';
 import MangaCard from '@/components/MangaCard';
-import { MangaListItem } from '@/types';
-import { mangaApi } from '@/lib/api';
+import { ContinueReadingItem, FeedItem, MangaListItem } from '@/types';
+import { feedApi, mangaApi, progressApi } from '@/lib/api';
 
 export default function Home() {
   const [manga, setManga] = useState<MangaListItem[]>([]);
+  const [continueReading, setContinueReading] = useState<ContinueReadingItem[]>([]);
+  const [updates, setUpdates] = useState<FeedItem[]>([]);
   const [loading, setLoading] = useState(true);
   const { user, loading: authLoading } = useAuth();
   const router = useRouter();
@@ -26,8 +29,14 @@ export default function Home() {
       if (!user) return;
       
       try {
-        const data = await mangaApi.list();
+        const [data, reading, feed] = await Promise.all([
+          mangaApi.list(),
+          progressApi.continueReading().catch(() => []),
+          feedApi.updates({ limit: 12 }).catch(() => ({ items: [] })),
+        ]);
         setManga(data);
+        setContinueReading(reading);
+        setUpdates(feed.items);
       } catch (error) {
         console.error('Failed to fetch manga:', error);
       } finally {
@@ -54,6 +63,76 @@ export default function Home() {
 
   return (
     <div className="container mx-auto px-4 py-8">
+      {continueReading.length > 0 && (
+        <div className="mb-10">
+          <h2 className="text-2xl font-bold mb-4">Continue Reading</h2>
+          <div className="flex gap-4 overflow-x-auto pb-2">
+            {continueReading.map((item) => (
+              <Link
+                key={item.manga_id}
+                href={`/read/${item.chapter_id}?page=${item.page}`}
+                className="flex-shrink-0 w-40 bg-white rounded-lg shadow-md overflow-hidden hover:shadow-xl transition-shadow duration-300"
+              >
+                <div className="aspect-[3/4] bg-gray-200">
+                  {item.cover_version ? (
+                    <img
+                      src={mangaApi.getCoverUrl(item.manga_id, item.cover_version, 'small')}
+                      srcSet={mangaApi.getCoverSrcSet(item.manga_id, item.cover_version)}
+                      sizes="160px"
+                      alt={item.title}
+                      className="w-full h-full object-cover"
+                    />
+                  ) : item.cover_image && (
+                    <img src={item.cover_image} alt={item.title} className="w-full h-full object-cover" />
+                  )}
+                </div>
+                <div className="p-2">
+                  <h3 className="font-semibold text-sm truncate">{item.title}</h3>
+                  <p className="text-gray-600 text-xs">
+                    Chapter {item.chapter_number} · Page {item.page + 1}
+                  </p>
+                </div>
+              </Link>
+            ))}
+          </div>
+        </div>
+      )}
+
+      {updates.length > 0 && (
+        <div className="mb-10">
+          <h2 className="text-2xl font-bold mb-4">New Chapters</h2>
+          <div className="flex gap-4 overflow-x-auto pb-2">
+            {updates.map((item) => (
+              <Link
+                key={item.chapter_id}
+                href={`/read/${item.chapter_id}`}
+                className="flex-shrink-0 w-40 bg-white rounded-lg shadow-md overflow-hidden hover:shadow-xl transition-shadow duration-300"
+              >
+                <div className="aspect-[3/4] bg-gray-200">
+                  {item.cover_version ? (
+                    <img
+                      src={mangaApi.getCoverUrl(item.manga_id, item.cover_version, 'small')}
+                      srcSet={mangaApi.getCoverSrcSet(item.manga_id, item.cover_version)}
+                      sizes="160px"
+                      alt={item.title}
+                      className="w-full h-full object-cover"
+                    />
+                  ) : item.cover_image && (
+                    <img src={item.cover_image} alt={item.title} className="w-full h-full object-cover" />
+                  )}
+                </div>
+                <div className="p-2">
+                  <h3 className="font-semibold text-sm truncate">{item.title}</h3>
+                  <p className="text-gray-600 text-xs">
+                    Chapter {item.chapter_number} · {new Date(item.created_at).toLocaleDateString()}
+                  </p>
+                </div>
+              </Link>
+            ))}
+          </div>
+        </div>
+      )}
+
       <h1 className="text-3xl font-bold mb-8">Manga Library</h1>
       {manga.length === 0 ? (
         <p className="text-gray-500 text-center py-8">No manga available yet.</p>
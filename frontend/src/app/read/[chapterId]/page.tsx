@@ -1,16 +1,21 @@
 'use client';
 
 import { useEffect, useState } from 'react';
-import { useParams, useRouter } from 'next/navigation';
+import { useParams, useRouter, useSearchParams } from 'next/navigation';
 import Link from 'next/link';
 import Reader from '@/components/Reader';
 import { chapterApi } from '@/lib/api';
+import { ChapterNeighbors, PageInfo, SpriteSheet } from '@/types';
 
 export default function ReadPage() {
   const params = useParams();
   const chapterId = Number(params.chapterId);
+  const initialPage = Number(useSearchParams().get('page')) || 0;
   const router = useRouter();
   const [pages, setPages] = useState<string[]>([]);
+  const [manifest, setManifest] = useState<PageInfo[]>([]);
+  const [sprite, setSprite] = useState<SpriteSheet | null>(null);
+  const [neighbors, setNeighbors] = useState<ChapterNeighbors | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
@@ -21,6 +26,8 @@ export default function ReadPage() {
       try {
         const data = await chapterApi.getPages(chapterId);
         setPages(data.pages);
+        setManifest(data.manifest || []);
+        setSprite(data.sprite || null);
       } catch (err) {
         setError('Failed to load chapter');
       } finally {
@@ -30,6 +37,7 @@ export default function ReadPage() {
 
     if (chapterId) {
       fetchPages();
+      chapterApi.getNeighbors(chapterId).then(setNeighbors).catch(() => setNeighbors(null));
     }
   }, [chapterId]);
 
@@ -57,7 +65,34 @@ export default function ReadPage() {
 
   return (
     <>
-      <Reader pages={pages} chapterId={chapterId} apiUrl={apiUrl} />
+      <Reader pages={pages} manifest={manifest} sprite={sprite} chapterId={chapterId} apiUrl={apiUrl} initialPage={initialPage} />
+      {/* Chapter navigation */}
+      {neighbors && (
+        <div className="flex justify-center gap-4 py-8 bg-gray-900">
+          {neighbors.prev_id && (
+            <Link
+              href={`/read/${neighbors.prev_id}`}
+              className="px-4 py-2 bg-gray-800 text-white rounded hover:bg-gray-700"
+            >
+              ← Previous Chapter
+            </Link>
+          )}
+          <Link
+            href={`/manga/${neighbors.manga_id}`}
+            className="px-4 py-2 bg-gray-800 text-white rounded hover:bg-gray-700"
+          >
+            Chapter List
+          </Link>
+          {neighbors.next_id && (
+            <Link
+              href={`/read/${neighbors.next_id}`}
+              className="px-4 py-2 bg-gray-800 text-white rounded hover:bg-gray-700"
+            >
+              Next Chapter →
+            </Link>
+          )}
+        </div>
+      )}
       {/* Back button for mobile */}
       <Link
         href="#"
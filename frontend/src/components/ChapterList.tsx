@@ -2,6 +2,7 @@
 
 import Link from 'next/link';
 import { Chapter } from '@/types';
+import { chapterApi } from '@/lib/api';
 
 interface ChapterListProps {
   chapters: Chapter[];
@@ -17,33 +18,50 @@ export default function ChapterList({ chapters }: ChapterListProps) {
   return (
     <div className="grid gap-2">
       {chapters.map((chapter) => (
-        <Link
-          key={chapter.id}
-          href={`/read/${chapter.id}`}
-          className="block p-4 bg-gray-100 rounded-lg hover:bg-gray-200 transition-colors"
-        >
-          <div className="flex items-center justify-between">
-            <div>
-              <span className="font-semibold">Chapter {chapter.chapter_number}</span>
-              {chapter.title && (
-                <span className="ml-2 text-gray-600">- {chapter.title}</span>
-              )}
+        <div key={chapter.id} className="flex items-stretch gap-2">
+          <Link
+            href={`/read/${chapter.id}`}
+            className="flex-1 block p-4 bg-gray-100 rounded-lg hover:bg-gray-200 transition-colors"
+          >
+            <div className="flex items-center justify-between">
+              <div>
+                <span className="font-semibold">Chapter {chapter.chapter_number}</span>
+                {chapter.title && (
+                  <span className="ml-2 text-gray-600">- {chapter.title}</span>
+                )}
+              </div>
+              <svg
+                className="w-5 h-5 text-gray-400"
+                fill="none"
+                stroke="currentColor"
+                viewBox="0 0 24 24"
+              >
+                <path
+                  strokeLinecap="round"
+                  strokeLinejoin="round"
+                  strokeWidth={2}
+                  d="M9 5l7 7-7 7"
+                />
+              </svg>
             </div>
-            <svg
-              className="w-5 h-5 text-gray-400"
-              fill="none"
-              stroke="currentColor"
-              viewBox="0 0 24 24"
-            >
+          </Link>
+          {/* Plain link: the browser downloads the CBZ itself and can resume it */}
+          <a
+            href={chapterApi.getDownloadUrl(chapter.id)}
+            download
+            title="Download CBZ"
+            className="flex items-center px-4 bg-gray-100 rounded-lg text-gray-500 hover:bg-gray-200 hover:text-gray-700 transition-colors"
+          >
+            <svg className="w-5 h-5" fill="none" stroke="currentColor" viewBox="0 0 24 24">
               <path
                 strokeLinecap="round"
                 strokeLinejoin="round"
                 strokeWidth={2}
-                d="M9 5l7 7-7 7"
+                d="M4 16v2a2 2 0 002 2h12a2 2 0 002-2v-2M7 10l5 5 5-5M12 15V3"
               />
             </svg>
-          </div>
-        </Link>
+          </a>
+        </div>
       ))}
     </div>
   );
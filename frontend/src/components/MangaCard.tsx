@@ -2,6 +2,7 @@
 
 import Link from 'next/link';
 import { MangaListItem } from '@/types';
+import { mangaApi } from '@/lib/api';
 
 interface MangaCardProps {
   manga: MangaListItem;
@@ -12,10 +13,21 @@ export default function MangaCard({ manga }: MangaCardProps) {
     <Link href={`/manga/${manga.id}`}>
       <div className="bg-white rounded-lg shadow-md overflow-hidden hover:shadow-xl transition-shadow duration-300">
         <div className="aspect-[3/4] bg-gray-200 relative">
-          {manga.cover_image ? (
+          {manga.cover_version ? (
+            <img
+              src={mangaApi.getCoverUrl(manga.id, manga.cover_version, 'small')}
+              srcSet={mangaApi.getCoverSrcSet(manga.id, manga.cover_version)}
+              sizes="(min-width: 1280px) 20vw, (min-width: 1024px) 25vw, (min-width: 768px) 33vw, 50vw"
+              alt={manga.title}
+              loading="lazy"
+              decoding="async"
+              className="w-full h-full object-cover"
+            />
+          ) : manga.cover_image ? (
             <img
               src={manga.cover_image}
               alt={manga.title}
+              loading="lazy"
               className="w-full h-full object-cover"
             />
           ) : (
@@ -0,0 +1,67 @@
+'use client';
+
+import { useEffect, useRef } from 'react';
+import { PageInfo, SpriteSheet } from '@/types';
+
+interface PageStripProps {
+  count: number;
+  manifest: PageInfo[];
+  sprite: SpriteSheet | null;
+  currentPage: number;
+  onSelect: (index: number) => void;
+}
+
+// Displayed thumbnail height in CSS pixels; the sheet is drawn scaled down
+const STRIP_HEIGHT = 72;
+
+export default function PageStrip({ count, manifest, sprite, currentPage, onSelect }: PageStripProps) {
+  const itemRefs = useRef<(HTMLButtonElement | null)[]>([]);
+
+  useEffect(() => {
+    itemRefs.current[currentPage]?.scrollIntoView({ block: 'nearest', inline: 'center' });
+  }, [currentPage]);
+
+  const scale = sprite ? STRIP_HEIGHT / sprite.thumb_height : 1;
+
+  return (
+    <div className="fixed bottom-0 left-0 right-0 z-40 bg-gray-900/95 border-t border-gray-700">
+      <div className="flex gap-2 overflow-x-auto px-4 py-3">
+        {Array.from({ length: count }, (_, index) => {
+          const box = manifest[index]?.thumb;
+          const selected = index === currentPage;
+          return (
+            <button
+              key={index}
+              ref={(el) => { itemRefs.current[index] = el; }}
+              onClick={() => onSelect(index)}
+              title={`Page ${index + 1}`}
+              className={`flex-shrink-0 rounded overflow-hidden border-2 ${
+                selected ? 'border-blue-500' : 'border-transparent hover:border-gray-500'
+              }`}
+            >
+              {sprite && box ? (
+                // One sheet for the whole chapter, positioned per page
+                <div
+                  style={{
+                    width: box.w * scale,
+                    height: STRIP_HEIGHT,
+                    backgroundImage: `url(${sprite.url})`,
+                    backgroundSize: `${sprite.width * scale}px ${sprite.height * scale}px`,
+                    backgroundPosition: `-${box.x * scale}px -${box.y * scale}px`,
+                  }}
+                />
+              ) : (
+                <div
+                  className="flex items-center justify-center bg-gray-800 text-gray-300 text-sm"
+                  style={{ width: STRIP_HEIGHT * 2 / 3, height: STRIP_HEIGHT }}
+                >
+                  {index + 1}
+                </div>
+              )}
+            </button>
+          );
+        })}
+      </div>
+    </div>
+  );
+}
@@ -1,19 +1,35 @@
 'use client';
 
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
+import { progressApi } from '@/lib/api';
+import { PageInfo, PageTile, SpriteSheet } from '@/types';
+import PageStrip from '@/components/PageStrip';
 
 interface ReaderProps {
   pages: string[];
+  manifest?: PageInfo[];
+  sprite?: SpriteSheet | null;
   chapterId: number;
   apiUrl: string;
+  initialPage?: number;
 }
 
 type ReadingMode = 'webtoon' | 'manga';
 
-export default function Reader({ pages, chapterId, apiUrl }: ReaderProps) {
+// Progress is reported once the reader stays on a page this long
+const PROGRESS_DELAY_MS = 1000;
+
+// Pages after the current one are prefetched up to this many bytes
+const PREFETCH_BYTES = 8 * 1024 * 1024;
+const PREFETCH_MAX_PAGES = 5;
+
+export default function Reader({ pages, manifest = [], sprite = null, chapterId, apiUrl, initialPage = 0 }: ReaderProps) {
   const [currentPage, setCurrentPage] = useState(0);
+  const pageRefs = useRef<(HTMLDivElement | null)[]>([]);
+  const restored = useRef(false);
   const [readingMode, setReadingMode] = useState<ReadingMode>('webtoon');
   const [loading, setLoading] = useState(true);
+  const [showStrip, setShowStrip] = useState(false);
 
   const getPageUrl = (filename: string) => {
     return `${apiUrl}/api/chapters/${chapterId}/pages/${filename}`;
@@ -23,6 +39,29 @@ export default function Reader({ pages, chapterId, apiUrl }: ReaderProps) {
     return url.split('/').pop() || '';
   };
 
+  // Reserve each page's space before it loads so the layout doesn't jump
+  const pageStyle = (index: number) => {
+    const info = manifest[index];
+    return info?.width && info?.height ? { aspectRatio: `${info.width} / ${info.height}` } : undefined;
+  };
+
+  // Long strips come as a stack of tiles, each loaded only as it nears the viewport
+  const renderTiles = (index: number, tiles: PageTile[]) => {
+    const width = manifest[index]?.width;
+    return tiles.map((tile, t) => (
+      <img
+        key={t}
+        src={`${apiUrl}${tile.url}`}
+        alt={t === 0 ? `Page ${index + 1}` : ''}
+        className="block w-full h-auto"
+        loading={index > 1 || t > 0 ? 'lazy' : 'eager'}
+        width={width || undefined}
+        height={tile.height}
+        style={width ? { aspectRatio: `${width} / ${tile.height}` } : undefined}
+      />
+    ));
+  };
+
   const nextPage = useCallback(() => {
     if (currentPage < pages.length - 1) {
       setCurrentPage(currentPage + 1);
@@ -35,6 +74,32 @@ export default function Reader({ pages, chapterId, apiUrl }: ReaderProps) {
     }
   }, [currentPage]);
 
+  const goToPage = (index: number) => {
+    setCurrentPage(index);
+    if (readingMode === 'webtoon') {
+      pageRefs.current[index]?.scrollIntoView();
+    }
+  };
+
+  const pageStrip = showStrip && (
+    <PageStrip
+      count={pages.length}
+      manifest={manifest}
+      sprite={sprite}
+      currentPage={currentPage}
+      onSelect={goToPage}
+    />
+  );
+
+  const stripToggle = (
+    <button
+      onClick={() => setShowStrip(!showStrip)}
+      className="px-4 py-2 bg-gray-800 text-white rounded hover:bg-gray-700"
+    >
+      {showStrip ? 'Hide Pages' : 'Pages'}
+    </button>
+  );
+
   // Keyboard navigation
   useEffect(() => {
     const handleKeyDown = (e: KeyboardEvent) => {
@@ -61,6 +126,54 @@ export default function Reader({ pages, chapterId, apiUrl }: ReaderProps) {
     setLoading(false);
   }, [pages]);
 
+  // Resume at the page reading progress points to
+  useEffect(() => {
+    if (loading || restored.current || pages.length === 0) return;
+    restored.current = true;
+    const page = Math.min(initialPage, pages.length - 1);
+    setCurrentPage(page);
+    if (readingMode === 'webtoon' && page > 0) {
+      pageRefs.current[page]?.scrollIntoView();
+    }
+  }, [loading, pages.length, initialPage, readingMode]);
+
+  // Track the page in view while scrolling in webtoon mode
+  useEffect(() => {
+    if (readingMode !== 'webtoon' || loading) return;
+    const observer = new IntersectionObserver(
+      (entries) => {
+        for (const entry of entries) {
+          if (entry.isIntersecting) {
+            setCurrentPage(Number((entry.target as HTMLElement).dataset.index));
+          }
+        }
+      },
+      { rootMargin: '-50% 0px -50% 0px' }
+    );
+    pageRefs.current.forEach((el) => el && observer.observe(el));
+    return () => observer.disconnect();
+  }, [readingMode, loading, pages.length]);
+
+  // Prefetch the next pages in manga mode, fewer when they are large
+  useEffect(() => {
+    if (readingMode !== 'manga') return;
+    let budget = PREFETCH_BYTES;
+    for (let i = currentPage + 1; i < pages.length && i <= currentPage + PREFETCH_MAX_PAGES; i++) {
+      budget -= manifest[i]?.size || 0;
+      if (budget < 0) break;
+      new Image().src = getPageUrl(getFilename(pages[i]));
+    }
+  }, [readingMode, currentPage, pages, manifest]);
+
+  // Report reading progress; the server batches these, so only settle briefly
+  useEffect(() => {
+    if (!restored.current) return;
+    const timer = setTimeout(() => {
+      progressApi.report(chapterId, currentPage).catch(() => {});
+    }, PROGRESS_DELAY_MS);
+    return () => clearTimeout(timer);
+  }, [chapterId, currentPage]);
+
   if (loading) {
     return (
       <div className="flex items-center justify-center min-h-screen">
@@ -83,6 +196,7 @@ export default function Reader({ pages, chapterId, apiUrl }: ReaderProps) {
       <div className="min-h-screen bg-gray-900">
         {/* Controls */}
         <div className="fixed top-4 right-4 z-50 flex gap-2">
+          {stripToggle}
           <button
             onClick={() => setReadingMode('manga')}
             className="px-4 py-2 bg-gray-800 text-white rounded hover:bg-gray-700"
@@ -94,20 +208,33 @@ export default function Reader({ pages, chapterId, apiUrl }: ReaderProps) {
         {/* Pages */}
         <div className="max-w-3xl mx-auto">
           {pages.map((page, index) => (
-            <div key={index} className="relative w-full">
-              <img
-                src={getPageUrl(getFilename(page))}
-                alt={`Page ${index + 1}`}
-                className="w-full h-auto"
-              />
+            <div
+              key={index}
+              ref={(el) => { pageRefs.current[index] = el; }}
+              data-index={index}
+              className="relative w-full"
+            >
+              {manifest[index]?.tiles ? renderTiles(index, manifest[index].tiles!) : (
+                <img
+                  src={getPageUrl(getFilename(page))}
+                  alt={`Page ${index + 1}`}
+                  className="w-full h-auto"
+                  loading={index > 1 ? 'lazy' : 'eager'}
+                  width={manifest[index]?.width || undefined}
+                  height={manifest[index]?.height || undefined}
+                  style={pageStyle(index)}
+                />
+              )}
             </div>
           ))}
         </div>
 
         {/* Navigation hint */}
-        <div className="fixed bottom-4 left-1/2 transform -translate-x-1/2 bg-gray-800 text-white px-4 py-2 rounded">
-          Use arrow keys or scroll to navigate
-        </div>
+        {pageStrip || (
+          <div className="fixed bottom-4 left-1/2 transform -translate-x-1/2 bg-gray-800 text-white px-4 py-2 rounded">
+            Use arrow keys or scroll to navigate
+          </div>
+        )}
       </div>
     );
   }
@@ -117,6 +244,7 @@ export default function Reader({ pages, chapterId, apiUrl }: ReaderProps) {
     <div className="min-h-screen bg-gray-900 flex flex-col">
       {/* Controls */}
       <div className="fixed top-4 right-4 z-50 flex gap-2">
+        {stripToggle}
         <button
           onClick={() => setReadingMode('webtoon')}
           className="px-4 py-2 bg-gray-800 text-white rounded hover:bg-gray-700"
@@ -149,25 +277,27 @@ export default function Reader({ pages, chapterId, apiUrl }: ReaderProps) {
       </div>
 
       {/* Page navigation */}
-      <div className="fixed bottom-4 left-1/2 transform -translate-x-1/2 flex items-center gap-4 bg-gray-800 text-white px-6 py-3 rounded-lg">
-        <button
-          onClick={prevPage}
-          disabled={currentPage === pages.length - 1}
-          className="px-4 py-2 bg-gray-700 rounded hover:bg-gray-600 disabled:opacity-50"
-        >
-          Next →
-        </button>
-        <span>
-          {currentPage + 1} / {pages.length}
-        </span>
-        <button
-          onClick={nextPage}
-          disabled={currentPage === 0}
-          className="px-4 py-2 bg-gray-700 rounded hover:bg-gray-600 disabled:opacity-50"
-        >
-          ← Prev
-        </button>
-      </div>
+      {pageStrip || (
+        <div className="fixed bottom-4 left-1/2 transform -translate-x-1/2 flex items-center gap-4 bg-gray-800 text-white px-6 py-3 rounded-lg">
+          <button
+            onClick={prevPage}
+            disabled={currentPage === pages.length - 1}
+            className="px-4 py-2 bg-gray-700 rounded hover:bg-gray-600 disabled:opacity-50"
+          >
+            Next →
+          </button>
+          <span>
+            {currentPage + 1} / {pages.length}
+          </span>
+          <button
+            onClick={nextPage}
+            disabled={currentPage === 0}
+            className="px-4 py-2 bg-gray-700 rounded hover:bg-gray-600 disabled:opacity-50"
+          >
+            ← Prev
+          </button>
+        </div>
+      )}
     </div>
   );
 }
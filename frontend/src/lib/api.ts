@@ -64,6 +64,10 @@ export const authApi = {
   },
 };
 
+// Generated cover thumbnail widths, matching the backend
+export const COVER_WIDTHS = { small: 200, medium: 400, large: 800 } as const;
+export type CoverSize = keyof typeof COVER_WIDTHS;
+
 // Manga API
 export const mangaApi = {
   list: async () => {
@@ -76,6 +80,22 @@ export const mangaApi = {
     return response.data;
   },
 
+  getCoverUrl: (mangaId: number, version: string, size: CoverSize) => {
+    // The version makes the URL immutable, so browsers cache it for good
+    return `/api/manga/${mangaId}/cover/${size}?v=${version}`;
+  },
+
+  getCoverSrcSet: (mangaId: number, version: string) => {
+    return (Object.keys(COVER_WIDTHS) as CoverSize[])
+      .map((size) => `${mangaApi.getCoverUrl(mangaId, version, size)} ${COVER_WIDTHS[size]}w`)
+      .join(', ');
+  },
+
+  getDownloadUrl: (mangaId: number) => {
+    // Every chapter as one CBZ, a folder per chapter
+    return `/api/manga/${mangaId}/download`;
+  },
+
   create: async (title: string, description?: string) => {
     const response = await api.post('/api/manga', { title, description });
     return response.data;
@@ -112,6 +132,77 @@ export const mangaApi = {
     });
     return response.data;
   },
+
+  // Resumable upload: the file is sent in chunks, several at a time, and
+  // an interrupted upload of the same file picks up where it stopped
+  uploadChapterResumable: async (
+    mangaId: number,
+    chapterNumber: number,
+    chapterTitle: string | null,
+    file: File,
+    onProgress?: (sent: number, total: number) => void
+  ) => {
+    const key = `upload:${mangaId}:${chapterNumber}:${file.name}:${file.size}:${file.lastModified}`;
+    let upload = null;
+    const saved = localStorage.getItem(key);
+    if (saved) {
+      upload = await api.get(`/api/uploads/${saved}`).then((r) => r.data).catch(() => null);
+    }
+    if (!upload || upload.status !== 'open') {
+      const response = await api.post('/api/uploads', {
+        manga_id: mangaId,
+        chapter_number: chapterNumber,
+        chapter_title: chapterTitle,
+        size: file.size,
+      });
+      upload = response.data;
+      localStorage.setItem(key, upload.id);
+    }
+
+    const chunkSize = Math.min(upload.chunk_max_bytes, 8 * 1024 * 1024);
+    const chunks: number[] = [];
+    for (const [start, end] of upload.missing as [number, number][]) {
+      for (let offset = start; offset < end; offset += chunkSize) chunks.push(offset);
+    }
+
+    let sent = upload.received_bytes;
+    const sendChunk = async (offset: number) => {
+      const blob = file.slice(offset, Math.min(offset + chunkSize, file.size));
+      for (let attempt = 1; ; attempt++) {
+        try {
+          await api.put(`/api/uploads/${upload.id}`, blob, {
+            params: { offset },
+            headers: { 'Content-Type': 'application/octet-stream' },
+          });
+          break;
+        } catch (err: any) {
+          if (attempt >= 5 || (err.response && err.response.status < 500)) throw err;
+          await new Promise((resolve) => setTimeout(resolve, 1000 * attempt));
+        }
+      }
+      sent += blob.size;
+      onProgress?.(sent, file.size);
+    };
+
+    const workers = Array.from({ length: 3 }, async () => {
+      while (chunks.length) await sendChunk(chunks.shift()!);
+    });
+    await Promise.all(workers);
+
+    const response = await api.post(`/api/uploads/${upload.id}/finalize`);
+    localStorage.removeItem(key);
+    return response.data;
+  },
+
+  uploadChaptersBulk: async (mangaId: number, file: File) => {
+    const formData = new FormData();
+    formData.append('file', file);
+
+    const response = await api.post(`/api/manga/${mangaId}/upload/bulk`, formData, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+    });
+    return response.data;
+  },
 };
 
 // Chapter API
@@ -121,16 +212,50 @@ export const chapterApi = {
     return response.data;
   },
 
+  getNeighbors: async (chapterId: number) => {
+    const response = await api.get(`/api/chapters/${chapterId}/neighbors`);
+    return response.data;
+  },
+
   getPageUrl: (chapterId: number, filename: string) => {
     // Don't prefix with API_URL since backend already returns /api/ paths
     return `/api/chapters/${chapterId}/pages/${filename}`;
   },
+
+  getDownloadUrl: (chapterId: number) => {
+    return `/api/chapters/${chapterId}/download`;
+  },
+};
+
+// Reading progress API
+export const progressApi = {
+  report: async (chapterId: number, page: number) => {
+    await api.put('/api/progress', { chapter_id: chapterId, page });
+  },
+
+  get: async (mangaId: number) => {
+    const response = await api.get(`/api/progress/${mangaId}`);
+    return response.data;
+  },
+
+  continueReading: async (limit = 12) => {
+    const response = await api.get('/api/progress/continue', { params: { limit } });
+    return response.data;
+  },
+};
+
+// New chapters feed API
+export const feedApi = {
+  updates: async (params: { since?: string; cursor?: string; limit?: number } = {}) => {
+    const response = await api.get('/api/feed/updates', { params });
+    return response.data;
+  },
 };
 
 // Admin API
 export const adminApi = {
-  getUsers: async () => {
-    const response = await api.get('/api/admin/users');
+  getUsers: async (params: { q?: string; role?: string; is_active?: boolean; cursor?: number; limit?: number } = {}) => {
+    const response = await api.get('/api/admin/users', { params });
     return response.data;
   },
 
@@ -7,6 +7,13 @@ export interface User {
   created_at: string;
 }
 
+export interface UserPage {
+  items: User[];
+  next_cursor: number | null;
+  total: number;
+  total_is_estimate: boolean;
+}
+
 export interface Chapter {
   id: number;
   manga_id: number;
@@ -20,8 +27,10 @@ export interface Manga {
   title: string;
   description: string | null;
   cover_image: string | null;
+  cover_version: string | null;
   is_published: boolean;
   created_at: string;
+  last_chapter_at: string | null;
   uploaded_by: number | null;
   chapters: Chapter[];
 }
@@ -31,12 +40,84 @@ export interface MangaListItem {
   title: string;
   description: string | null;
   cover_image: string | null;
+  cover_version: string | null;
   created_at: string;
+  last_chapter_at: string | null;
+}
+
+export interface ContinueReadingItem {
+  manga_id: number;
+  title: string;
+  cover_image: string | null;
+  cover_version: string | null;
+  chapter_id: number;
+  chapter_number: number;
+  chapter_title: string | null;
+  page: number;
+  updated_at: string;
+}
+
+export interface FeedItem {
+  chapter_id: number;
+  chapter_number: number;
+  chapter_title: string | null;
+  created_at: string;
+  manga_id: number;
+  title: string;
+  cover_image: string | null;
+  cover_version: string | null;
+}
+
+export interface FeedPage {
+  items: FeedItem[];
+  next_cursor: string | null;
+}
+
+export interface PageInfo {
+  url: string;
+  filename: string;
+  width: number | null;
+  height: number | null;
+  format: string | null;
+  size: number;
+  thumb: SpriteBox | null;
+  // Set for long-strip pages, served as a stack of tiles from top to bottom
+  tiles: PageTile[] | null;
+}
+
+export interface PageTile {
+  url: string;
+  height: number;
+}
+
+// A page's thumbnail within the chapter's sprite sheet, in sheet pixels
+export interface SpriteBox {
+  x: number;
+  y: number;
+  w: number;
+  h: number;
+}
+
+export interface SpriteSheet {
+  url: string;
+  width: number;
+  height: number;
+  thumb_height: number;
+}
+
+export interface ChapterNeighbors {
+  chapter_id: number;
+  manga_id: number;
+  chapter_number: number;
+  prev_id: number | null;
+  next_id: number | null;
 }
 
 export interface ChapterPages {
   pages: string[];
   total: number;
+  manifest: PageInfo[];
+  sprite: SpriteSheet | null;
 }
 
 export interface Token {